@@ -1,35 +1,144 @@
-from django.core.management.base import BaseCommand
+import time
+from optparse import make_option
 
-from nodeshot.community.notifications.models import Notification
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from nodeshot.community.notifications.models import Notification, NotificationCounter
 from nodeshot.core.base.utils import ago
 
-from ...settings import settings, DELETE_OLD
+from ...settings import settings, DELETE_OLD, PURGE_CHUNK_SIZE, PURGE_PAUSE, KEEP_LAST
 
 
 class Command(BaseCommand):
-    help = "Delete notifications older than DELETE_OLD"
+    help = """
+    Delete notifications older than DELETE_OLD days and, optionally,
+    all but the last N notifications of each user.
+    Rows are deleted in small batches to avoid locking the table for a long time.
+    """
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--days',
+            action='store',
+            dest='days',
+            type='int',
+            default=DELETE_OLD,
+            help='Delete notifications older than the specified number of days, defaults to settings.NODESHOT_NOTIFICATIONS_DELETE_OLD'),
+        make_option(
+            '--keep-last',
+            action='store',
+            dest='keep_last',
+            type='int',
+            default=KEEP_LAST,
+            help='Keep only the last N notifications of each user, defaults to settings.NODESHOT_NOTIFICATIONS_KEEP_LAST'),
+        make_option(
+            '--chunk-size',
+            action='store',
+            dest='chunk_size',
+            type='int',
+            default=PURGE_CHUNK_SIZE,
+            help='Maximum number of rows deleted by each statement'),
+        make_option(
+            '--pause',
+            action='store',
+            dest='pause',
+            type='float',
+            default=PURGE_PAUSE,
+            help='Seconds to wait between each statement'),
+    )
 
     def retrieve_old_notifications(self):
         """
         Retrieve notifications older than X days, where X is specified in settings
         """
 
-        date = ago(days=DELETE_OLD)
+        date = ago(days=self.days)
 
         return Notification.objects.filter(added__lte=date)
 
     def output(self, message):
         self.stdout.write('%s\n\r' % message)
 
+    def pause(self):
+        if self.pause_seconds:
+            time.sleep(self.pause_seconds)
+
+    def purge_old(self):
+        """
+        deletes old notifications by primary key ranges of chunk_size rows,
+        from the oldest notification to the most recent one older than X days
+        """
+        notifications = self.retrieve_old_notifications()
+
+        try:
+            first = Notification.objects.order_by('id').values_list('id', flat=True)[0]
+            last = notifications.order_by('-id').values_list('id', flat=True)[0]
+        except IndexError:
+            return 0
+
+        deleted = 0
+        start = first
+
+        while start <= last:
+            end = start + self.chunk_size
+            count = NotificationCounter.delete_notifications(notifications.filter(id__gte=start, id__lt=end))
+            if count:
+                deleted += count
+                self.pause()
+            start = end
+
+        return deleted
+
+    def purge_exceeding(self):
+        """
+        deletes all but the last keep_last notifications of each user,
+        the last notifications are retrieved through the (to_user, added) index
+        """
+        deleted = 0
+        # default ordering is cleared otherwise it would be added to the GROUP BY
+        users = Notification.objects.order_by()\
+                                    .values('to_user')\
+                                    .annotate(count=Count('id'))\
+                                    .filter(count__gt=self.keep_last)
+
+        for user in users:
+            notifications = Notification.objects.filter(to_user_id=user['to_user'])
+            # date of the oldest notification which must be kept
+            limit = notifications.order_by('-added').values_list('added', flat=True)[self.keep_last - 1]
+            exceeding = notifications.filter(added__lt=limit).values_list('id', flat=True)
+
+            while True:
+                ids = list(exceeding[:self.chunk_size])
+                if not ids:
+                    break
+                deleted += NotificationCounter.delete_notifications(Notification.objects.filter(id__in=ids))
+                self.pause()
+
+        return deleted
+
     def handle(self, *args, **options):
         """ Purge notifications """
-        # retrieve layers
-        notifications = self.retrieve_old_notifications()
-        count = len(notifications)
+        self.days = options['days']
+        self.keep_last = options['keep_last']
+        self.chunk_size = options['chunk_size']
+        self.pause_seconds = options['pause']
+
+        if self.days is None or self.days < 0:
+            raise CommandError('--days must be a positive number or 0')
+        if self.keep_last is not None and self.keep_last < 0:
+            raise CommandError('--keep-last must be a positive number or 0')
+        if self.chunk_size is None or self.chunk_size < 1:
+            raise CommandError('--chunk-size must be greater than 0')
+        if self.pause_seconds is None or self.pause_seconds < 0:
+            raise CommandError('--pause must be a positive number or 0')
+
+        count = self.purge_old()
+
+        if self.keep_last:
+            count += self.purge_exceeding()
 
         if count > 0:
-            self.output('found %d notifications to purge...' % count)
-            notifications.delete()
             self.output('%d notifications deleted successfully.' % count)
         else:
             self.output('there are no old notifications to purge')
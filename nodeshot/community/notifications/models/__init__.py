@@ -7,12 +7,14 @@ check_dependencies(
 
 
 from .notification import Notification
+from .notification_counter import NotificationCounter
 from .user_settings import UserEmailNotificationSettings, UserWebNotificationSettings
 from ..settings import settings, REGISTER
 
 
 __all__ = [
     'Notification',
+    'NotificationCounter',
     'UserWebNotificationSettings',
     'UserEmailNotificationSettings'
 ]
@@ -1,7 +1,7 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import ugettext_lazy as _, ugettext as __
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage
 from django.core.urlresolvers import reverse, NoReverseMatch
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes import generic
@@ -9,6 +9,7 @@ from django.contrib.contenttypes import generic
 from nodeshot.core.base.models import BaseDate
 
 from ..settings import settings, TEXTS
+from .notification_counter import NotificationCounter
 
 NOTIFICATION_TYPE_CHOICES = [(key, _(key)) for key,value in TEXTS.iteritems()]
 
@@ -35,9 +36,20 @@ class Notification(BaseDate):
     text = models.CharField(_('text'), max_length=120, blank=True)
     is_read = models. BooleanField(_('read?'), default=False)
 
+    # needed to update NotificationCounter when is_read changes
+    _current_is_read = None
+
     class Meta:
         app_label = 'notifications'
         ordering = ('-id',)
+        # used by purge_notifications to retrieve the last notifications of each user
+        index_together = [['to_user', 'added']]
+
+    def __init__(self, *args, **kwargs):
+        """ Fill _current_is_read """
+        super(Notification, self).__init__(*args, **kwargs)
+        if self.pk:
+            self._current_is_read = self.is_read
 
     def __unicode__(self):
         return 'notification #%s' % self.id
@@ -55,12 +67,28 @@ class Notification(BaseDate):
 
         # save notification to database only if user settings allow it
         if self.check_user_settings(medium='web'):
-            super(Notification, self).save(*args, **kwargs)
+            with transaction.atomic():
+                super(Notification, self).save(*args, **kwargs)
+                self.update_counter(created)
 
         if created:
             # send notifications through other mediums according to user settings
             self.send_notifications()
 
+    def update_counter(self, created):
+        """ updates the NotificationCounter of the recipient """
+        if created:
+            NotificationCounter.update_counters([self.to_user_id], total=1, unread=int(not self.is_read))
+        elif self.is_read != self._current_is_read:
+            NotificationCounter.update_counters([self.to_user_id], unread=-1 if self.is_read else 1)
+        self._current_is_read = self.is_read
+
+    def delete(self, *args, **kwargs):
+        """ updates the NotificationCounter of the recipient """
+        with transaction.atomic():
+            super(Notification, self).delete(*args, **kwargs)
+            NotificationCounter.update_counters([self.to_user_id], total=-1, unread=-int(not self._current_is_read))
+
     def send_notifications(self):
         """ send notifications to recipient user according to her settings """
         self.send_email()
@@ -69,32 +97,39 @@ class Notification(BaseDate):
         """ send email notification according to user settings """
         # send only if user notification setting is set to true
         if self.check_user_settings():
-            send_mail(_(self.type), self.email_message, settings.DEFAULT_FROM_EMAIL, [self.to_user.email])
+            self.get_email().send()
             return True
         else:
             # return false otherwise
             return False
 
+    def get_email(self):
+        """ returns the email message (django.core.mail.EmailMessage) of this notification """
+        return EmailMessage(_(self.type), self.email_message, settings.DEFAULT_FROM_EMAIL, [self.to_user.email])
+
     def send_mobile(self):
         """ send push notification according to user settings """
         raise NotImplementedError('mobile notifications not implemented yet')
 
-    def check_user_settings(self, medium='email'):
+    def check_user_settings(self, medium='email', user_settings=None, nearby_users=None):
         """
         Ensure user is ok with receiving this notification through the specified medium.
         Available mediums are 'web' and 'email', while 'mobile' notifications will
         hopefully be implemented in the future.
+        The notification settings of the user can be passed in user_settings if already loaded,
+        distance settings can be checked against the user ids returned by utils.get_nearby_users.
         """
         # custom notifications are always sent
         if self.type == 'custom':
             return True
 
-        try:
-            user_settings = getattr(self.to_user, '%s_notification_settings' % medium)
-        except ObjectDoesNotExist:
-            # user has no settings specified
-            # TODO: it would be better to create the settings with default values
-            return False
+        if user_settings is None:
+            try:
+                user_settings = getattr(self.to_user, '%s_notification_settings' % medium)
+            except ObjectDoesNotExist:
+                # user has no settings specified
+                # TODO: it would be better to create the settings with default values
+                return False
 
         user_setting_type = getattr(user_settings.__class__, self.type).user_setting_type
 
@@ -109,6 +144,9 @@ class Notification(BaseDate):
             elif value < 0:
                 return False
             # enabled for related objects comprised in specified distance range in km
+            # nearby users already resolved for all the recipients
+            elif nearby_users is not None:
+                return self.to_user_id in nearby_users
             else:
                 Model = self.related_object.__class__
                 geo_field = getattr(user_settings.__class__, self.type).geo_field
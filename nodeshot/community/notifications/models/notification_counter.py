@@ -0,0 +1,77 @@
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Count
+from django.utils.translation import ugettext_lazy as _
+
+from ..settings import settings
+
+
+class NotificationCounter(models.Model):
+    """
+    Number of notifications and unread notifications of each user,
+    kept up to date when notifications are created, read or deleted
+    so that the unread count does not require counting notification rows.
+
+    Counters are created (by counting notification rows) the first time they
+    are needed, updates are skipped for users which do not have a counter yet.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL,
+                                verbose_name=_('user'),
+                                related_name='notification_counter',
+                                primary_key=True)
+    total = models.IntegerField(_('total'), default=0)
+    unread = models.IntegerField(_('unread'), default=0)
+
+    class Meta:
+        app_label = 'notifications'
+        db_table = 'notifications_counter'
+
+    def __unicode__(self):
+        return _('notification counter of %s') % self.user_id
+
+    @classmethod
+    def get_for_user(cls, user_id):
+        """ returns the counter of the specified user, creates it if necessary """
+        try:
+            return cls.objects.get(user_id=user_id)
+        except cls.DoesNotExist:
+            return cls.rebuild(user_id)
+
+    @classmethod
+    def rebuild(cls, user_id):
+        """ counts the notifications of the specified user and stores the result """
+        from .notification import Notification
+        notifications = Notification.objects.filter(to_user_id=user_id)
+        counter = cls(user_id=user_id,
+                      total=notifications.count(),
+                      unread=notifications.filter(is_read=False).count())
+        try:
+            with transaction.atomic():
+                counter.save(force_insert=True)
+        except IntegrityError:
+            # created in the meanwhile
+            counter.save(force_update=True)
+        return counter
+
+    @classmethod
+    def update_counters(cls, user_ids, total=0, unread=0):
+        """ adds total and unread (which can be negative) to the counters of the specified users """
+        if not user_ids or not (total or unread):
+            return
+        cls.objects.filter(user_id__in=user_ids).update(total=F('total') + total,
+                                                         unread=F('unread') + unread)
+
+    @classmethod
+    def delete_notifications(cls, queryset):
+        """
+        deletes the notifications of queryset and updates the counters of their recipients
+        (one UPDATE for each user)
+        """
+        with transaction.atomic():
+            # default ordering is cleared otherwise it would be added to the GROUP BY
+            queryset = queryset.order_by()
+            totals = dict(queryset.values_list('to_user').annotate(Count('id')))
+            unread = dict(queryset.filter(is_read=False).values_list('to_user').annotate(Count('id')))
+            queryset.delete()
+            for user_id, count in totals.iteritems():
+                cls.update_counters([user_id], total=-count, unread=-unread.get(user_id, 0))
+        return sum(totals.values())
@@ -21,3 +21,12 @@ USER_SETTING = getattr(settings, 'NODESHOT_NOTIFICATIONS_USER_SETTING', {
 DEFAULT_BOOLEAN = getattr(settings, 'NODESHOT_NOTIFICATIONS_DEFAULT_BOOLEAN', True)
 DEFAULT_DISTANCE = getattr(settings, 'NODESHOT_NOTIFICATIONS_DEFAULT_DISTANCE', 30)
 DELETE_OLD = getattr(settings, 'NODESHOT_NOTIFICATIONS_DELETE_OLD', 40)
+# number of notifications inserted by each query when notifying many users at once
+BULK_CREATE_BATCH_SIZE = getattr(settings, 'NODESHOT_NOTIFICATIONS_BULK_CREATE_BATCH_SIZE', 500)
+# number of emails sent through the same SMTP connection by each background job
+EMAIL_BATCH_SIZE = getattr(settings, 'NODESHOT_NOTIFICATIONS_EMAIL_BATCH_SIZE', 100)
+# purge_notifications: rows deleted by each statement and seconds to wait between statements
+PURGE_CHUNK_SIZE = getattr(settings, 'NODESHOT_NOTIFICATIONS_PURGE_CHUNK_SIZE', 5000)
+PURGE_PAUSE = getattr(settings, 'NODESHOT_NOTIFICATIONS_PURGE_PAUSE', 0)
+# purge_notifications: keep only the last N notifications of each user (None means no limit)
+KEEP_LAST = getattr(settings, 'NODESHOT_NOTIFICATIONS_KEEP_LAST', None)
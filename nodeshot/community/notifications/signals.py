@@ -0,0 +1,4 @@
+import django.dispatch
+
+# sent after notifications have been inserted with bulk_create, which does not send post_save
+notifications_created = django.dispatch.Signal(providing_args=["notifications"])
@@ -1,7 +1,14 @@
 from celery import task
 
 from django.core import management
-from .settings import settings, TEXTS
+from django.db import transaction
+from django.core.mail import get_connection
+
+from nodeshot.core.base.utils import now
+
+from .settings import settings, TEXTS, USER_SETTING, BULK_CREATE_BATCH_SIZE, EMAIL_BATCH_SIZE
+from .signals import notifications_created
+from .utils import get_nearby_users
 
 
 @task()
@@ -18,8 +25,14 @@ def purge_notifications():
 @task
 def create_notifications(users, notification_model, notification_type, related_object):
     """
-    create notifications in a background job to avoid slowing down users
+    create notifications in a background job to avoid slowing down users;
+    the notification settings of all the users are loaded in two queries,
+    distance settings are resolved with one spatial query per medium,
+    web notifications are inserted in bulk and emails are sent in batches
     """
+    # imported here to avoid circular imports (models import the registrars which import this module)
+    from .models import UserWebNotificationSettings, UserEmailNotificationSettings
+
     # shortcuts for readability
     Notification = notification_model
 
@@ -27,16 +40,108 @@ def create_notifications(users, notification_model, notification_type, related_o
     additional = related_object.__dict__ if related_object else ''
     notification_text = TEXTS[notification_type] % additional
 
-    # loop users, notification settings check is done in Notification model
-    for user in users:
+    # notification settings of each user (user_id -> settings)
+    web_settings = _load_settings(UserWebNotificationSettings, users)
+    email_settings = _load_settings(UserEmailNotificationSettings, users)
+    # users which want distance based notifications and own a node in range
+    web_nearby = _nearby_users(UserWebNotificationSettings, web_settings, notification_type, related_object)
+    email_nearby = _nearby_users(UserEmailNotificationSettings, email_settings, notification_type, related_object)
 
+    date = now()
+    notifications = []
+    emails = []
+
+    # loop users and check notification settings in memory
+    for user in users:
         n = Notification(
             to_user=user,
             type=notification_type,
-            text=notification_text
+            text=notification_text,
+            added=date,
+            updated=date
         )
         # attach related object if present
         if related_object:
             n.related_object = related_object
-        # create notification and send according to user settings
-        n.save()
+
+        if _check_user_settings(n, 'web', web_settings, web_nearby):
+            notifications.append(n)
+        if _check_user_settings(n, 'email', email_settings, email_nearby):
+            emails.append(n.get_email())
+
+    _bulk_create(Notification, notifications)
+
+    for i in range(0, len(emails), EMAIL_BATCH_SIZE):
+        send_emails.delay(emails[i:i + EMAIL_BATCH_SIZE])
+
+
+@task
+def send_emails(messages):
+    """
+    sends a list of emails through the same connection
+    """
+    get_connection().send_messages(messages)
+
+
+def _load_settings(model, users):
+    """ returns a dictionary of user_id -> notification settings """
+    return dict((s.user_id, s) for s in model.objects.filter(user__in=users))
+
+
+def _nearby_users(model, user_settings, notification_type, related_object):
+    """
+    returns the ids of the users within their distance setting from related_object,
+    None if notification_type is not distance based or no user has set a distance
+    """
+    if not related_object or USER_SETTING.get(notification_type, {}).get('type') != 'distance':
+        return None
+    if not any(getattr(s, notification_type) > 0 for s in user_settings.itervalues()):
+        return None
+    return get_nearby_users(model, notification_type, related_object)
+
+
+def _check_user_settings(notification, medium, user_settings, nearby_users):
+    """ checks the preloaded notification settings of the recipient of notification """
+    preloaded = user_settings.get(notification.to_user_id)
+    # users which have no settings receive only custom notifications
+    if preloaded is None and notification.type != 'custom':
+        return False
+    return notification.check_user_settings(medium, preloaded, nearby_users)
+
+
+def _bulk_create(Notification, notifications):
+    """
+    inserts notifications with bulk_create and sends the notifications_created signal;
+    primary keys are retrieved only if some receiver is listening
+    (eg: the websocket server which needs them to build the URL of each notification)
+    """
+    if not notifications:
+        return
+
+    # imported here to avoid circular imports
+    from .models import NotificationCounter
+
+    with transaction.atomic():
+        Notification.objects.bulk_create(notifications, batch_size=BULK_CREATE_BATCH_SIZE)
+        # each user receives one unread notification
+        user_ids = [n.to_user_id for n in notifications]
+        for i in range(0, len(user_ids), BULK_CREATE_BATCH_SIZE):
+            NotificationCounter.update_counters(user_ids[i:i + BULK_CREATE_BATCH_SIZE], total=1, unread=1)
+
+    if not notifications_created.has_listeners(Notification):
+        return
+
+    # bulk_create does not set primary keys, each user has only one of these notifications
+    sample = notifications[0]
+    ids = dict(Notification.objects.filter(
+        type=sample.type,
+        content_type_id=sample.content_type_id,
+        object_id=sample.object_id,
+        added=sample.added,
+        to_user__in=[n.to_user_id for n in notifications]
+    ).values_list('to_user_id', 'id'))
+
+    for n in notifications:
+        n.pk = ids.get(n.to_user_id)
+
+    notifications_created.send(sender=Notification, notifications=notifications)
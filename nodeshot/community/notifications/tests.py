@@ -13,7 +13,9 @@ from nodeshot.core.nodes.models import Node
 
 from .models import *
 from .settings import settings, DEFAULT_DISTANCE, DEFAULT_BOOLEAN, REGISTER
-from .tasks import purge_notifications
+from .tasks import purge_notifications, create_notifications
+from .utils import get_nearby_users
+from .views import NotificationList
 
 # TODO: cleanup this mess
 # remove websockets from installed apps and disconnect signals
@@ -100,6 +102,149 @@ class TestNotification(BaseTestCase):
         purge_notifications.delay()
         self.assertEqual(Notification.objects.count(), 0)
 
+    def test_purge_notifications_chunks(self):
+        for days in [50, 45, 42, 5, 4, 3, 2]:
+            n = Notification.objects.create(**{
+                "to_user_id": 1,
+                "type": "custom",
+                "text": "testing"
+            })
+            n.added = ago(days=days)
+            n.save(auto_update=False)
+        # old notifications are deleted one by one
+        management.call_command('purge_notifications', chunk_size=1)
+        self.assertEqual(Notification.objects.count(), 4)
+        # keep only the last 2
+        management.call_command('purge_notifications', keep_last=2, chunk_size=1)
+        self.assertEqual(Notification.objects.count(), 2)
+        for n in Notification.objects.all():
+            self.assertGreater(n.added, ago(days=4))
+
+    def test_purge_notifications_invalid_options(self):
+        n = Notification.objects.create(to_user_id=1, type='custom', text='testing')
+        n.added = ago(days=50)
+        n.save(auto_update=False)
+        for options in [{ 'days': -1 }, { 'keep_last': -1 }, { 'chunk_size': 0 }, { 'pause': -1 }]:
+            with self.assertRaises(management.CommandError):
+                management.call_command('purge_notifications', **options)
+        # nothing has been deleted
+        self.assertEqual(Notification.objects.count(), 1)
+
+    def test_notification_counter(self):
+        def notify():
+            n = Notification(to_user_id=4, type='custom', text='testing')
+            n.save()
+            return n
+
+        notify()
+        # counter is created from the notifications table
+        counter = NotificationCounter.get_for_user(4)
+        self.assertEqual((counter.total, counter.unread), (1, 1))
+        # then kept up to date
+        n = notify()
+        notify()
+        counter = NotificationCounter.get_for_user(4)
+        self.assertEqual((counter.total, counter.unread), (3, 3))
+        n.is_read = True
+        n.save()
+        n.delete()
+        counter = NotificationCounter.get_for_user(4)
+        self.assertEqual((counter.total, counter.unread), (2, 2))
+        count = NotificationCounter.delete_notifications(Notification.objects.filter(to_user_id=4))
+        self.assertEqual(count, 2)
+        counter = NotificationCounter.get_for_user(4)
+        self.assertEqual((counter.total, counter.unread), (0, 0))
+
+    def test_notification_list_cursor(self):
+        url = reverse('api_notification_list')
+        self.client.login(username='romano', password='tester')
+        for i in range(5):
+            Notification(to_user_id=4, type='custom', text='testing %d' % i).save()
+
+        response = self.client.get(url, { 'action': 'count' })
+        self.assertEqual(response.data['count'], 5)
+
+        ids = []
+        next_url = '%s?action=all&limit=2' % url
+        while next_url:
+            response = self.client.get(next_url)
+            self.assertEqual(response.data['count'], 5)
+            self.assertLessEqual(len(response.data['results']), 2)
+            ids += [n['id'] for n in response.data['results']]
+            next_url = response.data['next']
+        self.assertEqual(ids, list(Notification.objects.filter(to_user_id=4).values_list('id', flat=True)))
+
+        # previous link goes back to the newer page
+        first_page = self.client.get(url, { 'action': 'all', 'limit': 2 })
+        self.assertIsNone(first_page.data['previous'])
+        second_page = self.client.get(first_page.data['next'])
+        self.assertIsNotNone(second_page.data['previous'])
+        self.assertNotIn('before', second_page.data['previous'])
+        response = self.client.get(second_page.data['previous'])
+        self.assertEqual(response.data['results'], first_page.data['results'])
+        self.assertIsNone(response.data['previous'])
+        self.assertIsNotNone(response.data['next'])
+
+        # negative limit is rejected, large limits are capped, 0 means all
+        response = self.client.get(url, { 'action': 'all', 'limit': -1 })
+        self.assertEqual(response.status_code, 400)
+        max_paginate_by = NotificationList.max_paginate_by
+        NotificationList.max_paginate_by = 2
+        try:
+            response = self.client.get(url, { 'action': 'all', 'limit': 1000000 })
+            self.assertEqual(len(response.data['results']), 2)
+            self.assertIsNotNone(response.data['next'])
+            response = self.client.get(url, { 'action': 'all', 'limit': 0 })
+            self.assertEqual(len(response.data['results']), 5)
+            self.assertIsNone(response.data['next'])
+        finally:
+            NotificationList.max_paginate_by = max_paginate_by
+
+        # reading notifications updates the unread counter
+        self.client.get(url)
+        response = self.client.get(url, { 'action': 'count' })
+        self.assertEqual(response.data['count'], 0)
+
+    def test_create_notifications_bulk(self):
+        node = Node.objects.create(**{
+            'name': 'bulk notification',
+            'slug': 'bulk-notification',
+            'layer_id': 1,
+            'geometry': 'POINT (12.5454 41.8352)',
+        })
+        Notification.objects.all().delete()
+        mail.outbox = []
+
+        users = User.objects.filter(is_active=True)
+        for user in users:
+            user.web_notification_settings.node_created = 0
+            user.web_notification_settings.save()
+            user.email_notification_settings.node_created = -1
+            user.email_notification_settings.save()
+        # users without settings do not receive notifications
+        no_settings = list(users)[0]
+        no_settings.web_notification_settings.delete()
+        no_settings.email_notification_settings.delete()
+        # one user wants emails
+        email_user = users.exclude(pk=no_settings.pk)[0]
+        email_user.email_notification_settings.node_created = 0
+        email_user.email_notification_settings.save()
+
+        create_notifications.delay(**{
+            "users": users,
+            "notification_model": Notification,
+            "notification_type": "node_created",
+            "related_object": node
+        })
+
+        self.assertEqual(Notification.objects.count(), users.count() - 1)
+        self.assertEqual(Notification.objects.filter(to_user=no_settings).count(), 0)
+        notification = Notification.objects.filter(to_user=email_user)[0]
+        self.assertEqual(notification.related_object, node)
+        self.assertIn(node.name, notification.text)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [email_user.email])
+
     if 'nodeshot.community.notifications.registrars.nodes' in REGISTER:
         def test_check_settings(self):
             n = Notification(**{
@@ -306,6 +451,48 @@ class TestNotification(BaseTestCase):
             # ensure 1 notification is created
             self.assertEqual(Notification.objects.count(), 0)
 
+        def test_get_nearby_users(self):
+            # romano owns a node in rome
+            Node.objects.create(**{
+                'name': 'a node in rome',
+                'slug': 'a-node-in-rome',
+                'layer_id': 1,
+                'geometry': 'POINT (12.5822391919000012 41.8720419276999820)',
+                'user_id': 4  # romano
+            })
+            near_node = Node.objects.create(**{
+                'name': 'near',
+                'slug': 'near',
+                'layer_id': 1,
+                'geometry': 'POINT (12.5454 41.8352)',
+                'user_id': 1
+            })
+            far_node = Node.objects.create(**{
+                'name': 'too far',
+                'slug': 'too-far',
+                'layer_id': 1,
+                'geometry': 'POINT (13.100 41.401)',
+                'user_id': 1
+            })
+            for user in User.objects.all():
+                user.web_notification_settings.node_created = 0
+                user.web_notification_settings.save()
+            user = User.objects.get(username='romano')
+            user.web_notification_settings.node_created = 20
+            user.web_notification_settings.save()
+
+            # one query for all the users
+            with self.assertNumQueries(1):
+                nearby = get_nearby_users(UserWebNotificationSettings, 'node_created', near_node)
+            self.assertEqual(nearby, set([4]))
+            self.assertEqual(get_nearby_users(UserWebNotificationSettings, 'node_created', far_node), set())
+
+            # same result of the check done for each user
+            for node in [near_node, far_node]:
+                n = Notification(to_user=user, type='node_created', related_object=node)
+                nearby = get_nearby_users(UserWebNotificationSettings, 'node_created', node)
+                self.assertEqual(n.check_user_settings(medium='web'), user.pk in nearby)
+
         def test_node_deleted_all(self):
             # set every user to receive notifications about any node deletion
             all_users = User.objects.all()
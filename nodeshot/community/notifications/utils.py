@@ -0,0 +1,32 @@
+from django.db import connection
+
+
+def get_nearby_users(settings_model, notification_type, related_object):
+    """
+    returns the set of user ids which have a distance setting greater than 0
+    for notification_type and own an object (of the same model of related_object)
+    within the configured distance (km) from related_object.
+
+    This is the same check done by Notification.check_user_settings for each user,
+    done for all the users with one PostGIS query.
+    settings_model is either UserWebNotificationSettings or UserEmailNotificationSettings
+    """
+    field = settings_model._meta.get_field(notification_type)
+    Model = related_object.__class__
+    geo_value = getattr(related_object, field.geo_field)
+
+    sql = """
+        SELECT DISTINCT s.user_id FROM {settings_table} s
+        INNER JOIN {table} o ON o.user_id = s.user_id
+        WHERE s.{setting} > 0
+        AND ST_DWithin(o.{geo_column}::geography, ST_GeomFromEWKT(%s)::geography, s.{setting} * 1000)
+    """.format(
+        settings_table=connection.ops.quote_name(settings_model._meta.db_table),
+        table=connection.ops.quote_name(Model._meta.db_table),
+        setting=connection.ops.quote_name(field.column),
+        geo_column=connection.ops.quote_name(Model._meta.get_field(field.geo_field).column)
+    )
+
+    cursor = connection.cursor()
+    cursor.execute(sql, [geo_value.ewkt])
+    return set(row[0] for row in cursor.fetchall())
@@ -1,10 +1,26 @@
-from rest_framework import generics, permissions, authentication
+import urlparse
+
+from django.db import transaction
+from django.http import QueryDict
+
+from rest_framework import generics, permissions, authentication, status
 from rest_framework.response import Response
 
 from .models import *
 from .serializers import *
 
 
+def cursor_url(url, key, value):
+    """ returns url with the pagination cursor key ("before" or "after") set to value """
+    scheme, netloc, path, query, fragment = urlparse.urlsplit(url)
+    query_dict = QueryDict(query).copy()
+    # cursors are mutually exclusive
+    for cursor in ('before', 'after'):
+        query_dict.pop(cursor, None)
+    query_dict[key] = value
+    return urlparse.urlunsplit((scheme, netloc, path, query_dict.urlencode(), fragment))
+
+
 class NotificationList(generics.ListAPIView):
     """
     Retrieve a list of notifications of the current user.
@@ -15,13 +31,18 @@ class NotificationList(generics.ListAPIView):
      * `action=unread&read=false`: retrieve unread notifications without marking them as read
      * `action=count`: retrieve count of unread notifications without marking them as read
      * `action=all`: retrieve all notifications with pagination
-        * `limit=<n>`: specify number of items per page (defaults to 30)
-        * `limit=0`: turns off pagination
+        * `limit=<n>`: specify number of items per page (defaults to 30, maximum 100)
+        * `limit=0`: retrieve all the notifications in one page
+        * `before=<id>`: retrieve notifications older than the specified notification id
+          (the `next` link of each page contains the id of its last notification)
+        * `after=<id>`: retrieve notifications newer than the specified notification id
+          (the `previous` link of each page contains the id of its first notification)
     """
     authentication_classes = (authentication.SessionAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
     paginate_by = 30
     paginate_by_param = 'limit'
+    max_paginate_by = 100
     serializer_class = NotificationSerializer
     pagination_serializer_class = PaginatedNotificationSerializer
     queryset = Notification.objects.select_related('from_user')
@@ -48,18 +69,67 @@ class NotificationList(generics.ListAPIView):
         data = UnreadNotificationSerializer(notifications, many=True).data
         # if True mark retrieve unread notifications as read (default behaviour)
         if mark_as_read:
-            notifications.update(is_read=True)
+            with transaction.atomic():
+                # ensure counter exists before updating it
+                NotificationCounter.get_for_user(request.user.id)
+                count = notifications.update(is_read=True)
+                NotificationCounter.update_counters([request.user.id], unread=-count)
         return Response(data)
     
     def get_count(self, request, notifications, mark_as_read=False):
         """ return count of unread notification """
-        data = { 'count': notifications.filter(is_read=False).count() }
+        data = { 'count': NotificationCounter.get_for_user(request.user.id).unread }
         return Response(data)
     
     def get_all(self, request, notifications, mark_as_read=False):
-        """ return all notifications with pagination """
-        notifications = notifications
-        return self.list(request, notifications)
+        """
+        return all notifications with keyset pagination on id,
+        which does not slow down on deep pages like OFFSET does
+        """
+        try:
+            limit = int(request.QUERY_PARAMS.get(self.paginate_by_param, self.paginate_by))
+        except ValueError:
+            limit = self.paginate_by
+        
+        if limit < 0:
+            return Response({ 'detail': 'limit must be a positive number' }, status=status.HTTP_400_BAD_REQUEST)
+        # 0 means all the notifications (None), positive values are capped
+        limit = min(limit, self.max_paginate_by) or None
+        # one more notification is retrieved to know whether there's another page
+        end = limit + 1 if limit else None
+        
+        before = request.QUERY_PARAMS.get('before', '')
+        after = request.QUERY_PARAMS.get('after', '')
+        
+        if after.isdigit():
+            # page of the notifications immediately newer than "after", from the newest
+            notifications = list(notifications.filter(id__gt=after).order_by('id')[0:end])
+            has_previous = limit is not None and len(notifications) > limit
+            notifications = notifications[0:limit][::-1]
+            has_next = True
+        else:
+            if before.isdigit():
+                notifications = notifications.filter(id__lt=before)
+            notifications = list(notifications.order_by('-id')[0:end])
+            has_next = limit is not None and len(notifications) > limit
+            notifications = notifications[0:limit]
+            has_previous = before.isdigit()
+        
+        url = request.build_absolute_uri()
+        next_url = None
+        previous_url = None
+        
+        if notifications and has_next:
+            next_url = cursor_url(url, 'before', notifications[-1].id)
+        if notifications and has_previous:
+            previous_url = cursor_url(url, 'after', notifications[0].id)
+        
+        return Response({
+            'count': NotificationCounter.get_for_user(request.user.id).total,
+            'next': next_url,
+            'previous': previous_url,
+            'results': self.get_serializer(notifications, many=True).data
+        })
 
 notification_list = NotificationList.as_view()
 
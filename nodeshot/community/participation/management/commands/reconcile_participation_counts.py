@@ -0,0 +1,95 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+
+from nodeshot.community.participation.models import NodeRatingCount, LayerParticipationCount, Vote, Rating, Comment
+
+
+class Command(BaseCommand):
+    help = """
+    Compare the participation counts of each node (likes, dislikes, ratings and comments)
+    with the actual votes, ratings and comments and repair the ones which have drifted,
+    then repair the counts of layers which differ from the sum of the counts of their nodes
+    """
+
+    def output(self, message):
+        self.stdout.write('%s\n\r' % message)
+
+    def count_by_node(self, queryset, *aggregates):
+        """ returns a dictionary of node_id -> aggregates, one GROUP BY query """
+        rows = queryset.order_by().values_list('node').annotate(*aggregates)
+        return dict((row[0], row[1:]) for row in rows)
+
+    def expected_counts(self):
+        """ returns a dictionary of node_id -> expected counts """
+        likes = self.count_by_node(Vote.objects.filter(vote=1), Count('id'))
+        dislikes = self.count_by_node(Vote.objects.filter(vote=-1), Count('id'))
+        ratings = self.count_by_node(Rating.objects.all(), Count('id'), Sum('value'))
+        comments = self.count_by_node(Comment.objects.all(), Count('id'))
+
+        nodes = set(likes) | set(dislikes) | set(ratings) | set(comments)
+        expected = {}
+
+        for node_id in nodes:
+            rating_count, rating_sum = ratings.get(node_id, (0, 0))
+            expected[node_id] = {
+                'likes': likes.get(node_id, (0,))[0],
+                'dislikes': dislikes.get(node_id, (0,))[0],
+                'rating_count': rating_count,
+                'rating_sum': rating_sum,
+                'comment_count': comments.get(node_id, (0,))[0]
+            }
+
+        return expected
+
+    def reconcile_layers(self):
+        """
+        recounts layer counts which differ from the sum of the counts of their nodes
+        (eg: because nodes have been moved to another layer with a queryset update, which sends no signals) and creates missing layer counts,
+        returns the number of repaired layers
+        """
+        fields = LayerParticipationCount.COUNT_FIELDS
+        rows = NodeRatingCount.objects.order_by()\
+                                      .values_list('node__layer')\
+                                      .annotate(*[Sum(field) for field in fields])
+        expected = dict((row[0], row[1:]) for row in rows)
+        drifted = []
+
+        existing = set()
+
+        for counts in LayerParticipationCount.objects.values_list('layer', *fields).iterator():
+            existing.add(counts[0])
+            if counts[1:] != expected.get(counts[0], (0,) * len(fields)):
+                drifted.append(counts[0])
+
+        # layers whose counts have not been created yet
+        drifted += [layer_id for layer_id in expected if layer_id not in existing]
+
+        for layer_id in drifted:
+            LayerParticipationCount.recount(layer_id)
+
+        return len(drifted)
+
+    def handle(self, *args, **options):
+        """ reconcile counts """
+        expected = self.expected_counts()
+        empty = dict.fromkeys(['likes', 'dislikes', 'rating_count', 'rating_sum', 'comment_count'], 0)
+        fields = empty.keys()
+        drifted = []
+
+        for counts in NodeRatingCount.objects.values('node', *fields).iterator():
+            node_id = counts.pop('node')
+            # counts with buffered deltas are not drifted, they will be written soon
+            if counts != expected.get(node_id, empty) and not NodeRatingCount.has_buffered_counts(node_id):
+                drifted.append(node_id)
+
+        # counts are recalculated while their row is locked
+        for node_id in drifted:
+            NodeRatingCount.recount(node_id)
+
+        # counts of nodes repaired above have already been added to their layer
+        layers = self.reconcile_layers()
+
+        if drifted or layers:
+            self.output('repaired participation counts of %d nodes and %d layers' % (len(drifted), layers))
+        else:
+            self.output('participation counts are correct')
@@ -34,8 +34,9 @@ __all__ = [
 
 if 'nodeshot.core.layers' in settings.INSTALLED_APPS:
     from layer_participation_settings import LayerParticipationSettings
+    from layer_participation_count import LayerParticipationCount
     
-    __all__ += ['LayerParticipationSettings']
+    __all__ += ['LayerParticipationSettings', 'LayerParticipationCount']
     
     from nodeshot.core.layers.models import Layer
     
@@ -57,6 +58,23 @@ if 'nodeshot.core.layers' in settings.INSTALLED_APPS:
             return layer_participation_settings
     
     Layer.participation_settings = _layer_participation_settings
+    
+    @property
+    def _layer_participation_count(self):
+        """
+        Return layer_participation_count record
+        or create it (summing the counts of the nodes) if it does not exist
+        
+        usage:
+        layer = Layer.objects.get(pk=1)
+        layer.participation_count
+        """
+        try:
+            return self.layer_participation_count
+        except ObjectDoesNotExist:
+            return LayerParticipationCount.recount(self.pk)
+    
+    Layer.participation_count = _layer_participation_count
 
 
 # ------ Add methods to Node Model ------ #
@@ -77,7 +95,7 @@ def _node_rating_count(self):
     try:
         return self.noderatingcount
     except ObjectDoesNotExist:
-        node_rating_count = NodeRatingCount(node=self)
+        node_rating_count = NodeRatingCount(node=self, layer_id=self.layer_id)
         node_rating_count.save()
         return node_rating_count
 
@@ -103,14 +121,35 @@ def _node_participation_settings(self):
 Node.participation_settings = _node_participation_settings
 
 
+def create_node_participation_objects(nodes, check_existing=True):
+    """
+    creates NodeRatingCount and NodeParticipationSettings of many nodes
+    with one INSERT for each model (plus one SELECT to skip existing rows if check_existing is True)
+    """
+    objects = {
+        NodeRatingCount: [NodeRatingCount(node_id=node.pk, layer_id=node.layer_id) for node in nodes],
+        NodeParticipationSettings: [NodeParticipationSettings(node_id=node.pk) for node in nodes],
+    }
+
+    for model, instances in objects.items():
+        if check_existing:
+            existing = set(model.objects.filter(node__in=[node.pk for node in nodes]).values_list('node', flat=True))
+        else:
+            existing = set()
+        model.objects.bulk_create([instance for instance in instances if instance.node_id not in existing],
+                                  batch_size=BULK_CREATE_BATCH_SIZE)
+
+
 # ------ SIGNALS ------ #
 
 
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_delete
 from nodeshot.core.nodes.models import Node
+from nodeshot.core.nodes.signals import nodes_bulk_created
 
-from ..tasks import create_related_object
+from ..settings import BULK_CREATE_BATCH_SIZE
+from ..signals import node_counts_changed
 
 
 @receiver(post_save, sender=Node)
@@ -119,11 +158,14 @@ def create_node_rating_counts_settings(sender, **kwargs):
     created = kwargs['created']
     node = kwargs['instance']
     if created:
-        # create node_rating_count and settings
-        # task will be executed in background unless settings.CELERY_ALWAYS_EAGER is True
-        # if CELERY_ALWAYS_EAGER is False celery worker must be running otherwise task won't be executed
-        create_related_object.delay(NodeRatingCount, { 'node': node })
-        create_related_object.delay(NodeParticipationSettings, { 'node': node })
+        # created right away: two small inserts are cheaper than two celery tasks
+        create_node_participation_objects([node], check_existing=False)
+
+
+@receiver(nodes_bulk_created, sender=Node)
+def bulk_create_node_rating_counts_settings(sender, **kwargs):
+    """ create node rating counts and settings of nodes inserted in bulk by importers """
+    create_node_participation_objects(kwargs['nodes'])
 
 
 @receiver(post_save, sender=Layer)
@@ -132,8 +174,30 @@ def create_layer_rating_settings(sender, **kwargs):
     created = kwargs['created']
     layer = kwargs['instance']
     if created:
-        # create layer participation settings
-        # task will be executed in background unless settings.CELERY_ALWAYS_EAGER is True
-        # if CELERY_ALWAYS_EAGER is False celery worker must be running otherwise task won't be executed
-        create_related_object.delay(LayerParticipationSettings, { 'layer': layer })
+        LayerParticipationSettings.objects.create(layer=layer)
+        LayerParticipationCount.objects.create(layer=layer)
+
 
+@receiver(node_counts_changed, sender=NodeRatingCount)
+def update_layer_participation_count(sender, **kwargs):
+    """ add the changes of the counts of a node to the counts of its layer """
+    layer_id = Node.objects.filter(pk=kwargs['node_id']).values_list('layer', flat=True).first()
+    # node has been deleted
+    if layer_id is None:
+        return
+    LayerParticipationCount.update_counts(layer_id, **kwargs['deltas'])
+
+
+@receiver(post_save, sender=Node)
+def move_layer_participation_count(sender, **kwargs):
+    """ move the counts of a node which has changed layer to the counts of its new layer """
+    if not kwargs['created']:
+        node = kwargs['instance']
+        LayerParticipationCount.move_node(node.pk, node.layer_id)
+
+
+@receiver(pre_delete, sender=Node)
+def remove_layer_participation_count(sender, **kwargs):
+    """ subtract the counts of a deleted node from the counts of its layer """
+    node = kwargs['instance']
+    LayerParticipationCount.remove_node(node.pk, node.layer_id)
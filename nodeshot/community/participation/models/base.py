@@ -1,18 +1,47 @@
-from django.db import models
+from django.db import models, transaction
+
+from .node_rating_count import NodeRatingCount
 
 
 class UpdateCountsMixin(models.Model):
     """
     Updates node_rating_count record each time an
-    Instance of an extended model is created or deleted
+    Instance of an extended model is created, changed or deleted
     """
+    # fields which affect counts: when one of them changes
+    # the deltas of the previous values are replaced with the new ones
+    counted_fields = ['node_id']
     
     class Meta:
         abstract = True
     
-    def update_count(self):
-        """ this method needs to be overwritten """
-        pass
+    def count_deltas(self, sign):
+        """
+        this method needs to be overwritten, returns the deltas of the counts of the node
+        (eg: {'likes': 1}), sign is 1 when the instance is added and -1 when it is removed
+        """
+        return {}
+    
+    def update_count(self, sign):
+        """ adds (sign=1) or removes (sign=-1) the instance from the counts of its node """
+        deltas = self.count_deltas(sign)
+        if deltas:
+            NodeRatingCount.increment(self.node_id, **deltas)
+    
+    def update_changed_count(self, previous):
+        """ replaces the deltas of the previous values with the deltas of the current ones """
+        if previous.node_id != self.node_id:
+            previous.update_count(-1)
+            self.update_count(1)
+            return
+        
+        deltas = previous.count_deltas(-1)
+        for field, delta in self.count_deltas(1).items():
+            deltas[field] = deltas.get(field, 0) + delta
+        deltas = dict((field, delta) for field, delta in deltas.items() if delta)
+        
+        if deltas:
+            NodeRatingCount.increment(self.node_id, **deltas)
     
     def save(self, *args, **kwargs):
         """ custom save method to update counts """
@@ -20,13 +49,24 @@ class UpdateCountsMixin(models.Model):
         # in case the comment exists the pk attribute is an int
         created = type(self.pk) is not int
         
-        super(UpdateCountsMixin, self).save(*args, **kwargs)
-        
-        # this operation must be performed after the parent save
-        if created:
-            self.update_count()
+        # counts are updated in the same transaction
+        with transaction.atomic():
+            previous = None
+            if not created:
+                # the row is locked so that concurrent changes are counted once
+                previous = self.__class__.objects.select_for_update().filter(pk=self.pk).first()
+            
+            super(UpdateCountsMixin, self).save(*args, **kwargs)
+            
+            # this operation must be performed after the parent save
+            if created:
+                self.update_count(1)
+            elif previous is not None and any(getattr(previous, field) != getattr(self, field)
+                                              for field in self.counted_fields):
+                self.update_changed_count(previous)
     
     def delete(self, *args, **kwargs):
         """ custom delete method to update counts """
-        super(UpdateCountsMixin, self).delete(*args, **kwargs)
-        self.update_count()
+        with transaction.atomic():
+            super(UpdateCountsMixin, self).delete(*args, **kwargs)
+            self.update_count(-1)
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, connection
 from django.conf import settings
 from django.utils.translation import ugettext_lazy as _
 from django.core.exceptions import ValidationError
@@ -23,11 +23,9 @@ class Comment(UpdateCountsMixin, BaseDate):
     def __unicode__(self):
         return self.text
     
-    def update_count(self):
-        """ updates comment count """
-        node_rating_count = self.node.rating_count
-        node_rating_count.comment_count = self.node.comment_set.count()
-        node_rating_count.save()
+    def count_deltas(self, sign):
+        """ comment count delta """
+        return { 'comment_count': sign }
     
     def clean(self , *args, **kwargs):
         """
@@ -46,3 +44,42 @@ class Comment(UpdateCountsMixin, BaseDate):
                 layer = node.layer
                 if  layer.participation_settings.comments_allowed is False:
                     raise ValidationError("Comments not allowed for this layer")
+
+    @classmethod
+    def prefetch_for_nodes(cls, nodes, limit=None):
+        """
+        retrieves the comments of many nodes with one query (at most the last "limit" comments
+        of each node) and stores them in the "prefetched_comments" attribute of each node
+        """
+        nodes = list(nodes)
+        if not nodes:
+            return
+
+        node_ids = [node.id for node in nodes]
+        comments = cls.objects.filter(node__in=node_ids).select_related('user')
+
+        if limit:
+            qn = connection.ops.quote_name
+            names = {
+                'table': qn(cls._meta.db_table),
+                'id': qn(cls._meta.pk.column),
+                'node': qn(cls._meta.get_field('node').column),
+                'node_ids': ', '.join(['%s'] * len(node_ids))
+            }
+            # rank comments of each node from the most recent one
+            comments = comments.extra(
+                where=["""%(table)s.%(id)s IN (
+                    SELECT %(id)s FROM (
+                        SELECT %(id)s, ROW_NUMBER() OVER (PARTITION BY %(node)s ORDER BY %(id)s DESC) AS position
+                        FROM %(table)s WHERE %(node)s IN (%(node_ids)s)
+                    ) AS ranked WHERE position <= %%s
+                )""" % names],
+                params=node_ids + [limit]
+            )
+
+        grouped = dict((node_id, []) for node_id in node_ids)
+        for comment in comments:
+            grouped[comment.node_id].append(comment)
+
+        for node in nodes:
+            node.prefetched_comments = grouped[node.id]
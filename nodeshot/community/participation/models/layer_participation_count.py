@@ -0,0 +1,154 @@
+from django.db import models, transaction
+from django.db.models import F, Sum
+from django.core.cache import cache
+
+from nodeshot.core.layers.models import Layer
+
+from .node_rating_count import NodeRatingCount
+from ..settings import LEADERBOARD_SIZE, LEADERBOARD_CACHE_TIMEOUT, LEADERBOARD_INVALIDATION_DELAY
+
+
+# cache keys of leaderboards (layer id, field) and of scheduled invalidations (layer id)
+LEADERBOARD_CACHE_KEY = 'participation_leaderboard_%s_%s'
+INVALIDATION_CACHE_KEY = 'participation_leaderboard_invalidation_%s'
+
+
+class LayerParticipationCount(models.Model):
+    """
+    Layer Participation Count
+    Sum of the participation counts of the nodes of a layer,
+    kept up to date each time the counts of one of its nodes change.
+    """
+    layer = models.OneToOneField(Layer, related_name='layer_participation_count')
+    likes = models.IntegerField(default=0)
+    dislikes = models.IntegerField(default=0)
+    rating_count = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    rating_avg = models.FloatField(default=0.0)
+    comment_count = models.IntegerField(default=0)
+
+    def __unicode__(self):
+        return self.layer.name
+
+    class Meta:
+        app_label = 'participation'
+        db_table = 'participation_layer_counts'
+
+    COUNT_FIELDS = NodeRatingCount.COUNT_FIELDS
+    # fields by which leaderboards can be sorted
+    LEADERBOARD_FIELDS = ('rating_avg', 'likes', 'comment_count')
+
+    @classmethod
+    def update_counts(cls, layer_id, **deltas):
+        """
+        atomically adds deltas to the counts of the specified layer
+        and schedules the invalidation of its leaderboards, see NodeRatingCount.update_counts
+        """
+        queryset = cls.objects.filter(layer_id=layer_id)
+
+        with transaction.atomic():
+            updated = queryset.update(**dict((field, F(field) + delta) for field, delta in deltas.items()))
+
+            # counts have not been created yet
+            if not updated:
+                cls.recount(layer_id)
+                return
+
+            if 'rating_count' in deltas or 'rating_sum' in deltas:
+                counts = queryset.values('rating_sum', 'rating_count')[0]
+                queryset.update(rating_avg=NodeRatingCount.average(counts['rating_sum'], counts['rating_count']))
+
+        cls.schedule_leaderboards_invalidation(layer_id)
+
+    @classmethod
+    def move_node(cls, node_id, layer_id):
+        """
+        moves the counts of the specified node from the counts of its previous layer
+        to the counts of layer_id, if the node has changed layer
+        """
+        with transaction.atomic():
+            counts = NodeRatingCount.objects.select_for_update()\
+                                            .filter(node=node_id)\
+                                            .exclude(layer=layer_id)\
+                                            .first()
+            if counts is None:
+                return
+
+            NodeRatingCount.objects.filter(pk=counts.pk).update(layer=layer_id)
+            deltas = dict((field, getattr(counts, field)) for field in cls.COUNT_FIELDS if getattr(counts, field))
+
+            if deltas:
+                cls.update_counts(counts.layer_id, **dict((field, -delta) for field, delta in deltas.items()))
+                cls.update_counts(layer_id, **deltas)
+
+    @classmethod
+    def remove_node(cls, node_id, layer_id):
+        """ subtracts the counts of the specified node (which is being deleted) from the counts of its layer """
+        counts = NodeRatingCount.objects.filter(node=node_id).values(*cls.COUNT_FIELDS).first()
+        deltas = dict((field, -value) for field, value in (counts or {}).items() if value)
+
+        # missing counts are created (without the node) when needed
+        if deltas and cls.objects.filter(layer_id=layer_id).exists():
+            cls.update_counts(layer_id, **deltas)
+
+    @classmethod
+    def recount(cls, layer_id):
+        """
+        sums again the participation counts of the nodes of the specified layer
+        (used to create missing counts and to repair drifted ones)
+        """
+        with transaction.atomic():
+            try:
+                counts = cls.objects.select_for_update().get(layer_id=layer_id)
+            except cls.DoesNotExist:
+                counts = cls(layer_id=layer_id)
+
+            sums = NodeRatingCount.objects.filter(node__layer=layer_id)\
+                                          .aggregate(*[Sum(field) for field in cls.COUNT_FIELDS])
+
+            for field in cls.COUNT_FIELDS:
+                setattr(counts, field, sums['%s__sum' % field] or 0)
+            counts.rating_avg = NodeRatingCount.average(counts.rating_sum, counts.rating_count)
+            counts.save()
+
+        cls.schedule_leaderboards_invalidation(layer_id)
+        return counts
+
+    @classmethod
+    def get_leaderboard(cls, layer_id, field='rating_avg'):
+        """
+        returns the counts (NodeRatingCount with their node) of the LEADERBOARD_SIZE published nodes
+        of the specified layer which have the highest value of field (the most recent nodes first in case of ties);
+        leaderboards are read from the (layer, field, node) indexes of NodeRatingCount
+        and are cached until the counts of the layer change
+        """
+        key = LEADERBOARD_CACHE_KEY % (layer_id, field)
+        leaderboard = cache.get(key)
+
+        if leaderboard is None:
+            leaderboard = list(NodeRatingCount.objects.filter(layer=layer_id, node__is_published=True)
+                                                      .select_related('node')
+                                                      .order_by('-%s' % field, '-node')[0:LEADERBOARD_SIZE])
+            cache.set(key, leaderboard, LEADERBOARD_CACHE_TIMEOUT)
+
+        return leaderboard
+
+    @classmethod
+    def schedule_leaderboards_invalidation(cls, layer_id):
+        """
+        invalidates the leaderboards of the specified layer LEADERBOARD_INVALIDATION_DELAY seconds from now,
+        once the transaction which changed its counts has been committed
+        (otherwise a concurrent request could cache the leaderboard again before the commit);
+        only one invalidation is scheduled for each layer
+        """
+        from ..tasks import invalidate_leaderboards
+
+        if cache.add(INVALIDATION_CACHE_KEY % layer_id, True, LEADERBOARD_INVALIDATION_DELAY):
+            invalidate_leaderboards.apply_async(args=[layer_id], countdown=LEADERBOARD_INVALIDATION_DELAY)
+
+    @classmethod
+    def invalidate_leaderboards(cls, layer_id):
+        """ deletes the cached leaderboards of the specified layer """
+        # changes from now on will schedule a new invalidation
+        cache.delete(INVALIDATION_CACHE_KEY % layer_id)
+        cache.delete_many([LEADERBOARD_CACHE_KEY % (layer_id, field) for field in cls.LEADERBOARD_FIELDS])
@@ -1,6 +1,17 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Count, Sum
+from django.core.cache import cache
 
 from nodeshot.core.nodes.models import Node
+from nodeshot.core.layers.models import Layer
+
+from ..settings import COUNTS_WRITE_BEHIND, COUNTS_FLUSH_INTERVAL
+from ..signals import node_counts_changed
+
+
+# cache keys of buffered deltas (node id, field) and of scheduled flushes (node id)
+BUFFER_CACHE_KEY = 'participation_counts_buffer_%s_%s'
+FLUSH_CACHE_KEY = 'participation_counts_flush_%s'
 
 
 class NodeRatingCount(models.Model):
@@ -9,15 +20,154 @@ class NodeRatingCount(models.Model):
     Keep track of participation counts of nodes.
     """
     node = models.OneToOneField(Node)
+    # layer of the node, leaderboards of layers are read from the indexes below
+    layer = models.ForeignKey(Layer, db_index=False)
     likes = models.IntegerField(default=0)
     dislikes = models.IntegerField(default=0)
     rating_count = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
     rating_avg = models.FloatField(default=0.0)
     comment_count = models.IntegerField(default=0)
-    
+
     def __unicode__(self):
         return self.node.name
-    
+
     class Meta:
         app_label = 'participation'
-        db_table = 'participation_node_counts'
\ No newline at end of file
+        db_table = 'participation_node_counts'
+        index_together = [
+            ('layer', 'rating_avg', 'node'),
+            ('layer', 'likes', 'node'),
+            ('layer', 'comment_count', 'node'),
+        ]
+
+    COUNT_FIELDS = ('likes', 'dislikes', 'rating_count', 'rating_sum', 'comment_count')
+
+    @staticmethod
+    def average(rating_sum, rating_count):
+        """ rating average, 0 if there are no ratings """
+        return float(rating_sum) / rating_count if rating_count else 0.0
+
+    @classmethod
+    def increment(cls, node_id, **deltas):
+        """
+        adds deltas to the counts of the specified node;
+        if COUNTS_WRITE_BEHIND is True deltas are buffered in the cache
+        and written every COUNTS_FLUSH_INTERVAL seconds by the flush_node_counts task
+        """
+        if not (COUNTS_WRITE_BEHIND and cls.buffer_counts(node_id, **deltas)):
+            cls.update_counts(node_id, **deltas)
+
+    @classmethod
+    def buffer_counts(cls, node_id, **deltas):
+        """
+        adds deltas to the buffer of the specified node and schedules a flush;
+        returns False if the cache backend does not support atomic increments
+        """
+        from ..tasks import flush_node_counts
+
+        try:
+            for field, delta in deltas.items():
+                key = BUFFER_CACHE_KEY % (node_id, field)
+                cache.add(key, 0, None)
+                cache.incr(key, delta)
+        except ValueError:
+            return False
+
+        # only one flush is scheduled for each node
+        if cache.add(FLUSH_CACHE_KEY % node_id, True, None):
+            flush_node_counts.apply_async(args=[node_id], countdown=COUNTS_FLUSH_INTERVAL)
+        return True
+
+    @classmethod
+    def has_buffered_counts(cls, node_id):
+        """ returns True if the node has buffered deltas which have not been written yet """
+        return COUNTS_WRITE_BEHIND and cache.get(FLUSH_CACHE_KEY % node_id) is not None
+
+    @classmethod
+    def flush_counts(cls, node_id):
+        """ writes the buffered deltas of the specified node with one update """
+        # deltas buffered from now on will schedule a new flush
+        cache.delete(FLUSH_CACHE_KEY % node_id)
+        deltas = {}
+
+        for field in cls.COUNT_FIELDS:
+            key = BUFFER_CACHE_KEY % (node_id, field)
+            value = cache.get(key)
+            if value:
+                # subtract instead of deleting to keep deltas added in the meanwhile
+                cache.decr(key, value)
+                deltas[field] = value
+
+        if deltas and cls.update_counts(node_id, **deltas) is False:
+            # node has been deleted in the meanwhile, its deltas are dropped
+            cache.delete_many([BUFFER_CACHE_KEY % (node_id, field) for field in cls.COUNT_FIELDS])
+
+    @classmethod
+    def update_counts(cls, node_id, **deltas):
+        """
+        atomically adds deltas to the counts of the specified node, eg:
+
+            NodeRatingCount.update_counts(node_id, likes=1)
+            NodeRatingCount.update_counts(node_id, rating_count=-1, rating_sum=-8)
+
+        rating_avg is recalculated from rating_sum and rating_count;
+        returns False if the node does not exist (anymore)
+        """
+        queryset = cls.objects.filter(node_id=node_id)
+
+        with transaction.atomic():
+            updated = queryset.update(**dict((field, F(field) + delta) for field, delta in deltas.items()))
+
+            if not updated:
+                # node has been deleted (eg: before buffered deltas were flushed)
+                if not Node.objects.filter(pk=node_id).exists():
+                    return False
+                # counts have not been created yet
+                cls.recount(node_id)
+                return True
+
+            # the row is locked by the previous update until the end of the transaction
+            if 'rating_count' in deltas or 'rating_sum' in deltas:
+                counts = queryset.values('rating_sum', 'rating_count')[0]
+                queryset.update(rating_avg=cls.average(counts['rating_sum'], counts['rating_count']))
+
+            node_counts_changed.send(sender=cls, node_id=node_id, deltas=deltas)
+
+        return True
+
+    @classmethod
+    def recount(cls, node_id):
+        """
+        counts again all the votes, ratings and comments of the specified node
+        (used to create missing counts and to repair drifted ones)
+        """
+        from .vote import Vote
+        from .rating import Rating
+        from .comment import Comment
+
+        with transaction.atomic():
+            try:
+                counts = cls.objects.select_for_update().get(node_id=node_id)
+            except cls.DoesNotExist:
+                counts = cls(node_id=node_id)
+            counts.layer_id = Node.objects.filter(pk=node_id).values_list('layer', flat=True)[0]
+
+            previous = dict((field, getattr(counts, field)) for field in cls.COUNT_FIELDS)
+            votes = Vote.objects.filter(node_id=node_id)
+            ratings = Rating.objects.filter(node_id=node_id).aggregate(count=Count('id'), sum=Sum('value'))
+
+            counts.likes = votes.filter(vote=1).count()
+            counts.dislikes = votes.filter(vote=-1).count()
+            counts.rating_count = ratings['count']
+            counts.rating_sum = ratings['sum'] or 0
+            counts.rating_avg = cls.average(counts.rating_sum, counts.rating_count)
+            counts.comment_count = Comment.objects.filter(node_id=node_id).count()
+            counts.save()
+
+            deltas = dict((field, getattr(counts, field) - value) for field, value in previous.items()
+                          if getattr(counts, field) != value)
+            if deltas:
+                node_counts_changed.send(sender=cls, node_id=node_id, deltas=deltas)
+
+        return counts
@@ -1,5 +1,4 @@
 from django.db import models
-from django.db.models import Avg
 from django.utils.translation import ugettext_lazy as _
 from django.conf import settings
 from django.core.exceptions import ValidationError
@@ -29,18 +28,11 @@ class Rating(UpdateCountsMixin, BaseDate):
     def __unicode__(self):
         return _('rating #%d for node %s') % (self.pk, self.node.name)
     
-    def update_count(self):
-        """ updates rating count and rating average """
-        node_rating_count = self.node.rating_count
-        node_rating_count.rating_count = self.node.rating_set.count()
-        node_rating_count.rating_avg = self.node.rating_set.aggregate(rate=Avg('value'))['rate']
-        
-        # if all ratings are deleted the value will be None!
-        if node_rating_count.rating_avg is None:
-            # set to 0 otherwise we'll get an exception
-            node_rating_count.rating_avg = 0
-
-        node_rating_count.save()
+    counted_fields = ['node_id', 'value']
+    
+    def count_deltas(self, sign):
+        """ rating count and rating sum deltas (rating average is recalculated from them) """
+        return { 'rating_count': sign, 'rating_sum': sign * self.value }
     
     def clean(self , *args, **kwargs):
         """
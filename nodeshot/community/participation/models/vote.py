@@ -31,12 +31,12 @@ class Vote(UpdateCountsMixin, BaseDate):
     def __unicode__(self):
         return _('vote #%d for node %s') % (self.pk, self.node.name)
     
-    def update_count(self):
-        """ updates likes and dislikes count """
-        node_rating_count = self.node.rating_count
-        node_rating_count.likes = self.node.vote_set.filter(vote=1).count()
-        node_rating_count.dislikes = self.node.vote_set.filter(vote=-1).count()
-        node_rating_count.save()
+    counted_fields = ['node_id', 'vote']
+    
+    def count_deltas(self, sign):
+        """ likes or dislikes delta """
+        field = 'likes' if self.vote == 1 else 'dislikes'
+        return { field: sign }
       
     def clean(self , *args, **kwargs):
         """
@@ -4,6 +4,7 @@ User = get_user_model()
 from rest_framework import serializers, pagination
 
 from nodeshot.core.nodes.models import Node
+from nodeshot.core.layers.models import Layer
 from nodeshot.community.profiles.serializers import ProfileRelationSerializer
 from .models import *
 
@@ -24,7 +25,9 @@ __all__ = [
     'NodeParticipationSettingsSerializer',
     'NodeSettingsSerializer',
     'LayerParticipationSettingsSerializer',
-    'LayerSettingsSerializer'
+    'LayerSettingsSerializer',
+    'LayerParticipationCountSerializer',
+    'LeaderboardSerializer'
 ]
 
 
@@ -66,7 +69,14 @@ class CommentSerializer(serializers.ModelSerializer):
 
 
 class NodeCommentSerializer(serializers.ModelSerializer):
-    comments = CommentSerializer(source='comment_set')
+    comments = serializers.SerializerMethodField('get_comments')
+
+    def get_comments(self, obj):
+        """ uses comments loaded by Comment.prefetch_for_nodes if available """
+        comments = getattr(obj, 'prefetched_comments', None)
+        if comments is None:
+            comments = obj.comment_set.select_related('user')
+        return CommentSerializer(comments, many=True).data
 
     class Meta:
         model = Node
@@ -162,6 +172,33 @@ class LayerParticipationSettingsSerializer(serializers.ModelSerializer):
         fields= ('name', 'slug', 'participation_settings')
 
 
+class LayerCountsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LayerParticipationCount
+        fields = ('likes', 'dislikes', 'rating_count',
+                  'rating_avg', 'comment_count')
+
+
+class LayerParticipationCountSerializer(serializers.ModelSerializer):
+    """ Layer participation totals """
+    participation = LayerCountsSerializer(source='participation_count')
+
+    class Meta:
+        model = Layer
+        fields = ('name', 'slug', 'participation')
+
+
+class LeaderboardSerializer(serializers.ModelSerializer):
+    """ Node of a leaderboard with its participation counts """
+    name = serializers.Field(source='node.name')
+    slug = serializers.Field(source='node.slug')
+
+    class Meta:
+        model = NodeRatingCount
+        fields = ('name', 'slug', 'likes', 'dislikes', 'rating_count',
+                  'rating_avg', 'comment_count')
+
+
 # ------ Add relationship to ExtensibleNodeSerializer ------ #
 
 from nodeshot.core.nodes.serializers import ExtensibleNodeSerializer
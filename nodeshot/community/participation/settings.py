@@ -0,0 +1,18 @@
+from django.conf import settings
+
+
+# buffer participation count deltas in the cache and write them to NodeRatingCount in batches
+COUNTS_WRITE_BEHIND = getattr(settings, 'NODESHOT_PARTICIPATION_COUNTS_WRITE_BEHIND', False)
+# seconds between the first buffered delta of a node and the write of its counts
+COUNTS_FLUSH_INTERVAL = getattr(settings, 'NODESHOT_PARTICIPATION_COUNTS_FLUSH_INTERVAL', 5)
+# number of rows inserted by each query when participation counts and settings are created for many nodes
+BULK_CREATE_BATCH_SIZE = getattr(settings, 'NODESHOT_PARTICIPATION_BULK_CREATE_BATCH_SIZE', 1000)
+# maximum number of comments (the most recent ones) of each node shown by the comment list endpoints
+COMMENTS_LIMIT = getattr(settings, 'NODESHOT_PARTICIPATION_COMMENTS_LIMIT', 10)
+# maximum number of nodes of each layer leaderboard (top rated, most liked, most commented)
+LEADERBOARD_SIZE = getattr(settings, 'NODESHOT_PARTICIPATION_LEADERBOARD_SIZE', 50)
+# seconds a layer leaderboard is cached, leaderboards are also invalidated when the counts of the layer change
+LEADERBOARD_CACHE_TIMEOUT = getattr(settings, 'NODESHOT_PARTICIPATION_LEADERBOARD_CACHE_TIMEOUT', 300)
+# seconds between a change of the counts of a layer and the invalidation of its leaderboards,
+# further changes in the meanwhile are covered by the same invalidation
+LEADERBOARD_INVALIDATION_DELAY = getattr(settings, 'NODESHOT_PARTICIPATION_LEADERBOARD_INVALIDATION_DELAY', 10)
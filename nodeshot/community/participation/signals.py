@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+
+# sent each time the participation counts of a node change,
+# deltas is a dictionary of count field -> difference (eg: {'likes': 1})
+node_counts_changed = Signal(providing_args=['node_id', 'deltas'])
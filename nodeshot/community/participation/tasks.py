@@ -1,12 +1,40 @@
 from celery import task
 
+from django.core import management
+
+
+@task()
+def reconcile_participation_counts():
+    """
+    repairs participation counts which have drifted
+    """
+    management.call_command('reconcile_participation_counts')
+
 
 # ------ Asynchronous tasks ------ #
 
 
+@task
+def flush_node_counts(node_id):
+    """
+    writes the participation count deltas buffered for the specified node
+    """
+    from .models import NodeRatingCount
+    NodeRatingCount.flush_counts(node_id)
+
+
+@task
+def invalidate_leaderboards(layer_id):
+    """
+    invalidates the cached leaderboards of the specified layer
+    """
+    from .models import LayerParticipationCount
+    LayerParticipationCount.invalidate_leaderboards(layer_id)
+
+
 @task
 def create_related_object(model, kwargs):
     """
     create object with specified kwargs in background
     """
-    model.objects.create(**kwargs)
\ No newline at end of file
+    model.objects.create(**kwargs)
@@ -4,15 +4,21 @@ Unit tests for participation app
 from django.contrib.auth import get_user_model
 User = get_user_model()
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.core.urlresolvers import reverse
+from django.core import management
+from django.core.cache import get_cache
 
 import simplejson as json
 
 from nodeshot.core.nodes.models import Node
+from nodeshot.core.nodes.signals import nodes_bulk_created
 from nodeshot.core.layers.models import Layer
 from nodeshot.core.base.tests import user_fixtures
 
-from .models import Comment, Rating, Vote
+from .models import Comment, Rating, Vote, NodeRatingCount, NodeParticipationSettings, LayerParticipationCount
+from .models import node_rating_count, layer_participation_count
 
 
 class ParticipationModelsTest(TestCase):
@@ -110,6 +116,231 @@ class ParticipationModelsTest(TestCase):
         self.assertEqual(0, node.rating_count.likes)
         self.assertEqual(0, node.rating_count.dislikes)
         
+    def test_update_changed_vote_and_rating(self):
+        """
+        Counts should be updated when an existing vote or rating is changed
+        """
+        vote = Vote(node_id=1, user_id=1, vote=1)
+        vote.save()
+        rating = Rating(node_id=1, user_id=1, value=3)
+        rating.save()
+        
+        vote.vote = -1
+        vote.save()
+        rating.value = 8
+        rating.save()
+        counts = NodeRatingCount.objects.get(node_id=1)
+        self.assertEqual(0, counts.likes)
+        self.assertEqual(1, counts.dislikes)
+        self.assertEqual(1, counts.rating_count)
+        self.assertEqual(8, counts.rating_sum)
+        self.assertEqual(8, counts.rating_avg)
+        
+        # saving again without changes does not alter counts
+        vote.save()
+        rating.save()
+        counts = NodeRatingCount.objects.get(node_id=1)
+        self.assertEqual(1, counts.dislikes)
+        self.assertEqual(8, counts.rating_sum)
+    
+    def test_reconcile_counts(self):
+        """
+        Counts are updated with deltas and repaired by reconcile_participation_counts
+        """
+        Rating(node_id=1, user_id=1, value=10).save()
+        Rating(node_id=1, user_id=2, value=5).save()
+        Vote(node_id=1, user_id=1, vote=1).save()
+        counts = NodeRatingCount.objects.get(node_id=1)
+        self.assertEqual(2, counts.rating_count)
+        self.assertEqual(15, counts.rating_sum)
+        self.assertEqual(7.5, counts.rating_avg)
+        self.assertEqual(1, counts.likes)
+
+        # counts drift
+        NodeRatingCount.objects.filter(node_id=1).update(likes=5, rating_count=1, rating_sum=3, rating_avg=3)
+        management.call_command('reconcile_participation_counts')
+        counts = NodeRatingCount.objects.get(node_id=1)
+        self.assertEqual(1, counts.likes)
+        self.assertEqual(0, counts.dislikes)
+        self.assertEqual(2, counts.rating_count)
+        self.assertEqual(15, counts.rating_sum)
+        self.assertEqual(7.5, counts.rating_avg)
+    
+    def test_write_behind_counts(self):
+        """
+        Count deltas are buffered in the cache and written by flush_counts
+        """
+        original_cache = node_rating_count.cache
+        cache = get_cache('django.core.cache.backends.locmem.LocMemCache')
+        node_rating_count.cache = cache
+        node_rating_count.COUNTS_WRITE_BEHIND = True
+        try:
+            # pretend a flush is already scheduled
+            cache.add(node_rating_count.FLUSH_CACHE_KEY % 1, True)
+            Vote(node_id=1, user_id=1, vote=1).save()
+            Vote(node_id=1, user_id=2, vote=1).save()
+            Rating(node_id=1, user_id=1, value=6).save()
+            # votes are saved but counts are not written yet
+            self.assertEqual(2, Vote.objects.filter(node_id=1).count())
+            counts = NodeRatingCount.objects.get(node_id=1)
+            self.assertEqual(0, counts.likes)
+            self.assertTrue(NodeRatingCount.has_buffered_counts(1))
+
+            NodeRatingCount.flush_counts(1)
+            counts = NodeRatingCount.objects.get(node_id=1)
+            self.assertEqual(2, counts.likes)
+            self.assertEqual(1, counts.rating_count)
+            self.assertEqual(6, counts.rating_avg)
+            self.assertFalse(NodeRatingCount.has_buffered_counts(1))
+            self.assertEqual(0, cache.get(node_rating_count.BUFFER_CACHE_KEY % (1, 'likes')))
+
+            # node deleted before the flush: its deltas are dropped
+            cache.add(node_rating_count.FLUSH_CACHE_KEY % 2, True)
+            Vote(node_id=2, user_id=1, vote=1).save()
+            Node.objects.get(pk=2).delete()
+            NodeRatingCount.flush_counts(2)
+            self.assertFalse(NodeRatingCount.objects.filter(node_id=2).exists())
+            self.assertIsNone(cache.get(node_rating_count.BUFFER_CACHE_KEY % (2, 'likes')))
+        finally:
+            node_rating_count.COUNTS_WRITE_BEHIND = False
+            node_rating_count.cache = original_cache
+    
+    def test_bulk_created_nodes(self):
+        """
+        Counts and settings of nodes inserted with bulk_create are created in bulk
+        """
+        Node.objects.bulk_create([
+            Node(name='bulk %d' % i, slug='bulk-%d' % i, layer_id=1, geometry='POINT (12.5 41.8)')
+            for i in range(3)
+        ])
+        nodes = list(Node.objects.filter(slug__startswith='bulk-'))
+        self.assertEqual(0, NodeRatingCount.objects.filter(node__in=nodes).count())
+
+        # reading participation does not create missing counts
+        url = reverse('api_node_participation', args=[nodes[0].slug])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(0, NodeRatingCount.objects.filter(node__in=nodes).count())
+
+        nodes_bulk_created.send(sender=Node, nodes=nodes)
+        self.assertEqual(3, NodeRatingCount.objects.filter(node__in=nodes).count())
+        self.assertEqual(3, NodeParticipationSettings.objects.filter(node__in=nodes).count())
+        # existing rows are skipped
+        nodes_bulk_created.send(sender=Node, nodes=nodes)
+        self.assertEqual(3, NodeRatingCount.objects.filter(node__in=nodes).count())
+    
+    def test_list_endpoints_query_count(self):
+        """
+        Number of queries of participation and comment lists does not depend on page size
+        """
+        for node in Node.objects.all()[0:3]:
+            for user_id in [1, 2]:
+                Comment(node=node, user_id=user_id, text='comment').save()
+                Vote(node=node, user_id=user_id, vote=1).save()
+
+        for url_name in ['api_all_nodes_participation', 'api_all_nodes_comments']:
+            url = reverse(url_name)
+            query_counts = []
+            for limit in [1, 3]:
+                with CaptureQueriesContext(connection) as context:
+                    response = self.client.get(url, { 'limit': limit })
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['nodes']), limit)
+                query_counts.append(len(context.captured_queries))
+            self.assertEqual(query_counts[0], query_counts[1])
+
+        # comments are limited and ordered
+        node = Node.objects.get(pk=1)
+        Comment.prefetch_for_nodes([node], limit=1)
+        self.assertEqual(len(node.prefetched_comments), 1)
+        self.assertEqual(node.prefetched_comments[0], Comment.objects.filter(node=node).order_by('-id')[0])
+
+    def test_layer_counts_and_leaderboard(self):
+        """
+        Layer counts follow the counts of its nodes, leaderboards are invalidated when they change
+        """
+        original_cache = layer_participation_count.cache
+        layer_participation_count.cache = get_cache('django.core.cache.backends.locmem.LocMemCache')
+        try:
+            layer = Layer.objects.get(pk=1)
+            Rating(node_id=1, user_id=1, value=4).save()
+            Rating(node_id=4, user_id=1, value=6).save()
+            Vote(node_id=4, user_id=1, vote=1).save()
+            Comment(node_id=1, user_id=1, text='comment').save()
+            # node counts store the layer of the node, leaderboards are read by layer
+            self.assertEqual(NodeRatingCount.objects.get(node_id=4).layer_id, Node.objects.get(pk=4).layer_id)
+            counts = LayerParticipationCount.objects.get(layer=layer)
+            self.assertEqual(1, counts.likes)
+            self.assertEqual(2, counts.rating_count)
+            self.assertEqual(5, counts.rating_avg)
+            self.assertEqual(1, counts.comment_count)
+
+            response = self.client.get(reverse('api_layer_participation_count', args=[layer.slug]))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['participation']['likes'], 1)
+
+            url = reverse('api_layer_leaderboard', args=[layer.slug])
+            response = self.client.get(url, { 'order': 'rating_avg', 'limit': 2 })
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([node['slug'] for node in response.data],
+                             [Node.objects.get(pk=4).slug, Node.objects.get(pk=1).slug])
+            # cached leaderboard is served without queries on counts
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(url, { 'order': 'rating_avg', 'limit': 2 })
+            self.assertFalse([q for q in context.captured_queries if 'participation_node_counts' in q['sql']])
+
+            # a change of the counts of a node invalidates the leaderboard
+            Rating(node_id=1, user_id=2, value=10).save()
+            Rating(node_id=1, user_id=3, value=10).save()
+            response = self.client.get(url, { 'order': 'rating_avg', 'limit': 2 })
+            self.assertEqual(response.data[0]['slug'], Node.objects.get(pk=1).slug)
+            response = self.client.get(url, { 'order': 'comment_count', 'limit': 1 })
+            self.assertEqual(response.data[0]['slug'], Node.objects.get(pk=1).slug)
+
+            # changes performed while an invalidation is scheduled do not schedule further ones
+            layer_participation_count.cache.add(layer_participation_count.INVALIDATION_CACHE_KEY % layer.pk, True)
+            Comment(node_id=4, user_id=1, text='comment').save()
+            Comment(node_id=4, user_id=1, text='comment').save()
+            response = self.client.get(url, { 'order': 'comment_count', 'limit': 1 })
+            self.assertEqual(response.data[0]['slug'], Node.objects.get(pk=1).slug)
+            # until the scheduled invalidation is performed
+            LayerParticipationCount.invalidate_leaderboards(layer.pk)
+            response = self.client.get(url, { 'order': 'comment_count', 'limit': 1 })
+            self.assertEqual(response.data[0]['slug'], Node.objects.get(pk=4).slug)
+
+            # counts drift when nodes are deleted without deleting their ratings one by one
+            LayerParticipationCount.objects.filter(layer=layer).update(likes=10)
+            management.call_command('reconcile_participation_counts')
+            self.assertEqual(1, LayerParticipationCount.objects.get(layer=layer).likes)
+        finally:
+            layer_participation_count.cache = original_cache
+
+    def test_layer_counts_of_moved_and_deleted_nodes(self):
+        """ Counts of nodes moved to another layer or deleted are removed from the counts of their layer """
+        Rating(node_id=4, user_id=1, value=6).save()
+        Vote(node_id=4, user_id=1, vote=1).save()
+        layer1 = Layer.objects.get(pk=1)
+        layer2 = Layer.objects.get(pk=2)
+        before1 = layer1.participation_count
+        before2 = layer2.participation_count
+
+        node = Node.objects.get(pk=4)
+        node.layer = layer2
+        node.save()
+        self.assertEqual(NodeRatingCount.objects.get(node=node).layer_id, layer2.pk)
+        counts1 = LayerParticipationCount.objects.get(layer=layer1)
+        counts2 = LayerParticipationCount.objects.get(layer=layer2)
+        self.assertEqual(counts1.likes, before1.likes - 1)
+        self.assertEqual(counts1.rating_sum, before1.rating_sum - 6)
+        self.assertEqual(counts2.likes, before2.likes + 1)
+        self.assertEqual(counts2.rating_count, before2.rating_count + 1)
+
+        node.delete()
+        counts2 = LayerParticipationCount.objects.get(layer=layer2)
+        self.assertEqual(counts2.likes, before2.likes)
+        self.assertEqual(counts2.rating_count, before2.rating_count)
+        self.assertEqual(counts2.rating_sum, before2.rating_sum)
+
     def test_node_comment_api(self):
         """
         Comments endpoint should be reachable with GET and return 404 if object is not found.
@@ -4,6 +4,8 @@ from django.conf.urls import patterns, url
 urlpatterns = patterns('nodeshot.community.participation.views',
     url(r'^layers/(?P<slug>[-\w]+)/comments/$', 'layer_nodes_comments', name='api_layer_nodes_comments'),
     url(r'^layers/(?P<slug>[-\w]+)/participation/$', 'layer_nodes_participation', name='api_layer_nodes_participation'),
+    url(r'^layers/(?P<slug>[-\w]+)/participation_count/$', 'layer_participation_count', name='api_layer_participation_count'),
+    url(r'^layers/(?P<slug>[-\w]+)/leaderboard/$', 'layer_leaderboard', name='api_layer_leaderboard'),
     url(r'^comments/$', 'all_nodes_comments', name='api_all_nodes_comments'),
     url(r'^participation/$','all_nodes_participation', name='api_all_nodes_participation'),
     url(r'^nodes/(?P<slug>[-\w]+)/comments/$', 'node_comments',name='api_node_comments'),
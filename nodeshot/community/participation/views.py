@@ -4,9 +4,11 @@ from django.contrib.auth import get_user_model
 User = get_user_model()
 
 from rest_framework import permissions, authentication, generics
+from rest_framework.response import Response
 
-from .models import Rating, Vote, Comment
+from .models import Rating, Vote, Comment, LayerParticipationCount
 from .serializers import *
+from .settings import COMMENTS_LIMIT, LEADERBOARD_SIZE
 
 from nodeshot.core.base.mixins import CustomDataMixin
 from nodeshot.core.nodes.models import Node
@@ -25,6 +27,24 @@ def get_queryset_or_404(queryset, kwargs):
     
     return obj
 
+
+class PrefetchCommentsMixin(object):
+    """
+    loads the last COMMENTS_LIMIT comments of the listed nodes with one query
+    instead of one query for each node (see NodeCommentSerializer)
+    """
+    def paginate_queryset(self, queryset, page_size=None):
+        page = super(PrefetchCommentsMixin, self).paginate_queryset(queryset, page_size)
+        if page is not None:
+            Comment.prefetch_for_nodes(page.object_list, limit=COMMENTS_LIMIT)
+        return page
+    
+    def get_serializer(self, instance=None, *args, **kwargs):
+        # not paginated lists
+        if kwargs.get('many') and instance is not None and not hasattr(instance, 'paginator'):
+            Comment.prefetch_for_nodes(instance, limit=COMMENTS_LIMIT)
+        return super(PrefetchCommentsMixin, self).get_serializer(instance, *args, **kwargs)
+
     
 class AllNodesParticipationList(generics.ListAPIView):
     """
@@ -33,6 +53,7 @@ class AllNodesParticipationList(generics.ListAPIView):
     authentication_classes = (authentication.SessionAuthentication,)
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
     model = Node
+    queryset = Node.objects.select_related('noderatingcount')
     serializer_class= NodeParticipationSerializer
     pagination_serializer_class = PaginationSerializer
     paginate_by_param = 'limit'
@@ -41,7 +62,7 @@ class AllNodesParticipationList(generics.ListAPIView):
 all_nodes_participation= AllNodesParticipationList.as_view()
 
 
-class AllNodesCommentList(generics.ListAPIView):
+class AllNodesCommentList(PrefetchCommentsMixin, generics.ListAPIView):
     """
     Retrieve comments  for all nodes
     """
@@ -56,7 +77,7 @@ class AllNodesCommentList(generics.ListAPIView):
 all_nodes_comments= AllNodesCommentList.as_view()
 
  
-class LayerNodesCommentList(generics.ListAPIView):
+class LayerNodesCommentList(PrefetchCommentsMixin, generics.ListAPIView):
     """
     Retrieve comments  for all nodes of a layer
     """
@@ -99,7 +120,7 @@ class LayerNodesParticipationList(generics.ListAPIView):
         layer = get_queryset_or_404(Layer.objects.published(), { 'slug': self.kwargs.get('slug', None) })
         
         # Get queryset of nodes related to layer
-        self.queryset = Node.objects.published().filter(layer_id=layer.id)
+        self.queryset = Node.objects.published().filter(layer_id=layer.id).select_related('noderatingcount')
         
         return self.list(request, *args, **kwargs)
     
@@ -113,6 +134,7 @@ class NodeParticipationDetail(generics.RetrieveAPIView):
     authentication_classes = (authentication.SessionAuthentication,)
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
     model = Node
+    queryset = Node.objects.select_related('noderatingcount')
     serializer_class = NodeParticipationSerializer
     
 node_participation = NodeParticipationDetail.as_view()
@@ -125,6 +147,7 @@ class NodeParticipationSettingsDetail(generics.RetrieveAPIView):
     authentication_classes = (authentication.SessionAuthentication,)
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
     model = Node
+    queryset = Node.objects.select_related('node_participation_settings')
     serializer_class = NodeParticipationSettingsSerializer
     
 node_participation_settings = NodeParticipationSettingsDetail.as_view()
@@ -137,11 +160,63 @@ class LayerParticipationSettingsDetail(generics.RetrieveAPIView):
     authentication_classes = (authentication.SessionAuthentication,)
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
     model = Layer
+    queryset = Layer.objects.select_related('layer_participation_settings')
     serializer_class = LayerParticipationSettingsSerializer
     
 layer_participation_settings = LayerParticipationSettingsDetail.as_view() 
 
 
+class LayerParticipationCountDetail(generics.RetrieveAPIView):
+    """
+    Retrieve the sum of the participation counts of the nodes of a layer
+    """
+    authentication_classes = (authentication.SessionAuthentication,)
+    permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
+    model = Layer
+    queryset = Layer.objects.published().select_related('layer_participation_count')
+    serializer_class = LayerParticipationCountSerializer
+    
+layer_participation_count = LayerParticipationCountDetail.as_view()
+
+
+class LayerLeaderboard(generics.ListAPIView):
+    """
+    Retrieve the published nodes of a layer with the highest participation counts
+    
+    Parameters:
+    
+     * `order`: one of `rating_avg` (default), `likes`, `comment_count`
+     * `limit`: number of nodes (default and maximum: NODESHOT_PARTICIPATION_LEADERBOARD_SIZE)
+    """
+    authentication_classes = (authentication.SessionAuthentication,)
+    permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
+    serializer_class = LeaderboardSerializer
+    
+    def get(self, request, *args, **kwargs):
+        """
+        Get leaderboard of specified existing layer
+        or otherwise return 404
+        """
+        # ensure layer exists
+        layer = get_queryset_or_404(Layer.objects.published(), { 'slug': self.kwargs.get('slug', None) })
+        
+        order = request.QUERY_PARAMS.get('order', 'rating_avg')
+        if order not in LayerParticipationCount.LEADERBOARD_FIELDS:
+            order = 'rating_avg'
+        
+        try:
+            limit = min(int(request.QUERY_PARAMS.get('limit', LEADERBOARD_SIZE)), LEADERBOARD_SIZE)
+        except ValueError:
+            limit = LEADERBOARD_SIZE
+        
+        # cached list, see LayerParticipationCount.get_leaderboard
+        leaderboard = LayerParticipationCount.get_leaderboard(layer.id, order)[0:max(limit, 0)]
+        
+        return Response(self.get_serializer(leaderboard, many=True).data)
+
+layer_leaderboard = LayerLeaderboard.as_view()
+
+
 class NodeCommentList(CustomDataMixin, generics.ListCreateAPIView):
     """
     Retrieve a **list** of comments for the specified node
@@ -237,6 +237,10 @@ CELERYBEAT_SCHEDULE = {
     'purge_notifications': {
         'task': 'nodeshot.community.notifications.tasks.purge_notifications',
         'schedule': timedelta(days=1),
+    },
+    'reconcile_participation_counts': {
+        'task': 'nodeshot.community.participation.tasks.reconcile_participation_counts',
+        'schedule': timedelta(days=1),
     }
 }
 
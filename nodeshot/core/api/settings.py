@@ -13,5 +13,6 @@ API_APPS_ENABLED = getattr(settings, 'NODESHOT_API_APPS_ENABLED', [
     'nodeshot.networking.net',
     'nodeshot.networking.links',
     'nodeshot.networking.services',
+    'nodeshot.interoperability',
     'nodeshot.open311'
 ])
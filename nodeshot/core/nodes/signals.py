@@ -1,3 +1,5 @@
 import django.dispatch
 
-node_status_changed = django.dispatch.Signal(providing_args=["instance", "old_status", "new_status"])
\ No newline at end of file
+node_status_changed = django.dispatch.Signal(providing_args=["instance", "old_status", "new_status"])
+# sent by importers which insert nodes with bulk_create (which does not send post_save)
+nodes_bulk_created = django.dispatch.Signal(providing_args=["nodes"])
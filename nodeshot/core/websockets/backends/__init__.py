@@ -0,0 +1,24 @@
+from importlib import import_module
+
+from ..settings import BACKEND
+
+
+__all__ = ['get_backend']
+
+
+_backend = None
+
+
+def get_backend():
+    """
+    returns the instance of the message bus backend specified
+    in settings.NODESHOT_WEBSOCKETS_BACKEND (one instance per process)
+    """
+    global _backend
+
+    if _backend is None:
+        module_path, class_name = BACKEND.rsplit('.', 1)
+        BackendClass = getattr(import_module(module_path), class_name)
+        _backend = BackendClass()
+
+    return _backend
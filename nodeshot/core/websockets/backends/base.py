@@ -0,0 +1,61 @@
+import uuid
+
+
+PIPES = ('public', 'private', 'events')
+
+
+class MessageTooLarge(ValueError):
+    """ raised by backends which can't deliver messages bigger than MAX_MESSAGE_SIZE """
+    pass
+
+
+class BaseBackend(object):
+    """
+    Message bus between django (or celery) processes and the websocket server.
+
+    Messages are published on one of the following pipes:
+        * public: message is broadcasted to all the connected clients
+        * events: JSON list of node events (see events.py)
+        * private: JSON message which is sent only to the client specified in its "user_id" key
+
+    Backends must implement:
+        * publish: called by django or celery processes, must not block for long
+        * listen: called by the websocket server, must register a handler on the tornado IOLoop
+          which invokes callback(pipe, message) as soon as a message is received (no polling)
+        * close: stops listening
+
+    More websocket server instances (processes or hosts) can listen on the same bus:
+    each instance receives all the public and events messages and writes them to its own clients,
+    while private messages are routed to the instances the recipient is connected to,
+    which are tracked through register_client and unregister_client (presence).
+    """
+    # unique id of the websocket server instance, set by "listen"
+    instance_id = None
+    # maximum size in bytes of a message, None if there's no limit
+    MAX_MESSAGE_SIZE = None
+
+    @staticmethod
+    def generate_instance_id():
+        return uuid.uuid4().hex
+
+    def publish(self, message, pipe='public'):
+        raise NotImplementedError('Not Implemented')
+
+    def listen(self, callback, io_loop):
+        raise NotImplementedError('Not Implemented')
+
+    def close(self):
+        pass
+
+    def register_client(self, user_id):
+        """ called by the websocket server when an authenticated client connects """
+        pass
+
+    def unregister_client(self, user_id):
+        """ called by the websocket server when the last connection of an authenticated client is closed """
+        pass
+
+    @staticmethod
+    def validate_pipe(pipe):
+        if pipe not in PIPES:
+            raise ValueError('pipe argument can be only one of: %s' % ', '.join(PIPES))
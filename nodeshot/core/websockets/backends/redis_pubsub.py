@@ -0,0 +1,144 @@
+import logging
+import simplejson as json
+
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+from ..settings import REDIS_URL, REDIS_PREFIX
+from .base import BaseBackend, PIPES
+
+
+logger = logging.getLogger(__name__)
+
+
+class RedisBackend(BaseBackend):
+    """
+    Message bus based on redis pub/sub, allows to run websocket servers on more hosts.
+
+    Channels:
+        * <prefix>.public and <prefix>.events: all the websocket server instances subscribe to them
+        * <prefix>.private.<instance_id>: private messages of the clients connected to an instance
+
+    Presence is stored in redis sets named <prefix>.presence.<user_id> which contain
+    the ids of the instances the user is connected to; instances which don't exist anymore
+    (eg: crashed) are removed from the set as soon as a message can't be delivered to them.
+    Instances which have just been disconnected from redis are removed as well,
+    therefore each instance registers again the presence of its clients when it reconnects.
+
+    Each websocket server registers the socket of its pub/sub connection on the IOLoop;
+    if the connection is lost it tries to reconnect every RECONNECT_DELAY seconds.
+    """
+    RECONNECT_DELAY = 1
+
+    def __init__(self, url=REDIS_URL, prefix=REDIS_PREFIX):
+        if redis is None:
+            raise ImproperlyConfigured('the redis websocket backend requires the "redis" python package')
+        self.client = redis.StrictRedis.from_url(url)
+        self.prefix = prefix
+        self.pubsub = None
+        self._fd = None
+        # ids of the users connected to this instance
+        self.clients = set()
+
+    def channel(self, name):
+        """ returns the name of the redis channel """
+        return '%s.%s' % (self.prefix, name)
+
+    def presence_key(self, user_id):
+        """ returns the name of the redis set which stores the instances the user is connected to """
+        return '%s.presence.%s' % (self.prefix, user_id)
+
+    def publish(self, message, pipe='public'):
+        """ returns True if at least one websocket server received the message """
+        self.validate_pipe(pipe)
+
+        if pipe != 'private':
+            return self.client.publish(self.channel(pipe), message) > 0
+
+        # route private messages to the instances the user is connected to
+        key = self.presence_key(json.loads(message)['user_id'])
+        delivered = False
+
+        for instance_id in self.client.smembers(key):
+            if self.client.publish(self.channel('private.%s' % instance_id), message) > 0:
+                delivered = True
+            else:
+                self.client.srem(key, instance_id)
+
+        return delivered
+
+    def register_client(self, user_id):
+        self.clients.add(user_id)
+        self.client.sadd(self.presence_key(user_id), self.instance_id)
+
+    def unregister_client(self, user_id):
+        self.clients.discard(user_id)
+        self.client.srem(self.presence_key(user_id), self.instance_id)
+
+    def _register_clients(self):
+        """ registers again the presence of all the clients of this instance """
+        if not self.clients:
+            return
+        pipeline = self.client.pipeline(transaction=False)
+        for user_id in self.clients:
+            pipeline.sadd(self.presence_key(user_id), self.instance_id)
+        pipeline.execute()
+
+    def listen(self, callback, io_loop):
+        self.instance_id = self.generate_instance_id()
+        self.callback = callback
+        self.io_loop = io_loop
+        self._connect()
+
+    def _channels(self):
+        """ channels the websocket server subscribes to """
+        channels = [self.channel(pipe) for pipe in PIPES if pipe != 'private']
+        return channels + [self.channel('private.%s' % self.instance_id)]
+
+    def _connect(self):
+        try:
+            self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            self.pubsub.subscribe(*self._channels())
+            # presence might have been removed while disconnected (see "publish")
+            self._register_clients()
+        except redis.ConnectionError as e:
+            logger.error('could not connect to redis: %s' % e)
+            self.io_loop.add_timeout(self.io_loop.time() + self.RECONNECT_DELAY, self._connect)
+            return
+
+        # the connection of the pub/sub object is established by subscribe
+        self._fd = self.pubsub.connection._sock.fileno()
+        self.io_loop.add_handler(self._fd, self._on_readable, self.io_loop.READ)
+        # messages which might have been buffered while subscribing
+        self._on_readable(self._fd, None)
+
+    def _on_readable(self, fd, events):
+        pipes = dict((self.channel(pipe), pipe) for pipe in PIPES if pipe != 'private')
+        try:
+            # read everything which is available without blocking
+            while self.pubsub.connection.can_read():
+                message = self.pubsub.get_message()
+                if message is None:
+                    continue
+                pipe = pipes.get(message['channel'], 'private')
+                self.callback(pipe, message['data'])
+        except redis.ConnectionError as e:
+            logger.error('lost connection to redis: %s' % e)
+            self._disconnect()
+            self.io_loop.add_timeout(self.io_loop.time() + self.RECONNECT_DELAY, self._connect)
+
+    def _disconnect(self):
+        if self._fd is not None:
+            self.io_loop.remove_handler(self._fd)
+            self._fd = None
+        if self.pubsub is not None:
+            self.pubsub.reset()
+            self.pubsub = None
+
+    def close(self):
+        if self.pubsub is not None:
+            self._disconnect()
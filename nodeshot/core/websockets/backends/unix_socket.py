@@ -0,0 +1,117 @@
+import os
+import glob
+import errno
+import socket
+import logging
+
+from ..settings import UNIX_SOCKET
+from .base import BaseBackend, MessageTooLarge
+
+
+logger = logging.getLogger(__name__)
+
+
+class UnixSocketBackend(BaseBackend):
+    """
+    Local message bus, doesn't need any external service.
+
+    Each websocket server process binds a unix datagram socket named
+    <UNIX_SOCKET>.<instance_id> and registers it on the IOLoop;
+    each message is sent as one datagram to all the sockets in the following format:
+
+        <pipe>\\n<message>
+
+    Presence is not tracked: private messages reach all the processes of the host,
+    which discard messages of clients which are not connected to them.
+    Use the redis backend to run websocket servers on more hosts.
+
+    Messages published while no websocket server is running are discarded,
+    messages bigger than MAX_MESSAGE_SIZE bytes raise MessageTooLarge.
+    """
+    # maximum size of a message (excluding the pipe)
+    MAX_MESSAGE_SIZE = 65536
+    # size of the datagrams read by the server: message plus the longest pipe and the newline
+    RECV_SIZE = MAX_MESSAGE_SIZE + 16
+    # seconds a publisher waits when the queue of the server is full
+    PUBLISH_TIMEOUT = 1
+
+    def __init__(self, path=UNIX_SOCKET):
+        self.path = path
+        self._publisher = None
+        self._listener = None
+        self._io_loop = None
+
+    def publish(self, message, pipe='public'):
+        """
+        returns True if the message has been delivered to at least one websocket server,
+        raises MessageTooLarge if the message does not fit in one datagram
+        """
+        self.validate_pipe(pipe)
+
+        if isinstance(message, unicode):
+            message = message.encode('utf-8')
+
+        if len(message) > self.MAX_MESSAGE_SIZE:
+            raise MessageTooLarge('websocket message of %d bytes exceeds the limit of %d bytes' %
+                                  (len(message), self.MAX_MESSAGE_SIZE))
+
+        if self._publisher is None:
+            self._publisher = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._publisher.settimeout(self.PUBLISH_TIMEOUT)
+
+        data = '%s\n%s' % (pipe, message)
+        delivered = False
+
+        for path in glob.glob('%s.*' % self.path):
+            try:
+                self._publisher.sendto(data, path)
+                delivered = True
+            except socket.error as e:
+                # socket left by a crashed process
+                if e.args[0] == errno.ECONNREFUSED:
+                    self._remove(path)
+                # datagram bigger than the send buffer of the socket
+                elif e.args[0] == errno.EMSGSIZE:
+                    raise MessageTooLarge('websocket message of %d bytes exceeds the socket buffer' % len(data))
+                else:
+                    logger.warning('could not deliver websocket message to %s: %s' % (path, e))
+
+        return delivered
+
+    def listen(self, callback, io_loop):
+        self.instance_id = self.generate_instance_id()
+        self.socket_path = '%s.%s' % (self.path, self.instance_id)
+
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._listener.setblocking(0)
+        self._listener.bind(self.socket_path)
+        self._io_loop = io_loop
+
+        def on_readable(fd, events):
+            # read all the queued messages
+            while True:
+                try:
+                    data = self._listener.recv(self.RECV_SIZE)
+                except socket.error as e:
+                    if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        return
+                    raise
+                pipe, message = data.split('\n', 1)
+                callback(pipe, message)
+
+        io_loop.add_handler(self._listener.fileno(), on_readable, io_loop.READ)
+
+    def close(self):
+        if self._listener is None:
+            return
+        self._io_loop.remove_handler(self._listener.fileno())
+        self._listener.close()
+        self._listener = None
+        self._remove(self.socket_path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,221 @@
+"""
+Structured node events, published on the "events" pipe of the message bus as JSON lists like:
+
+    [{
+        "type": "node.added",  # or node.changed, node.status_changed, node.deleted
+        "slug": "node-slug",
+        "name": "node name",
+        "layer": "layer-slug",
+        "status": "status-slug",  # not present in node.deleted
+        "old_status": "status-slug",  # node.status_changed only
+        "geometry": {...},  # GeoJSON, node.added and node.changed only
+        "point": [lng, lat]
+    }]
+
+Events of the same node are coalesced both by publishers (see "start_batching")
+and by the websocket server, which sends them to clients in frames like:
+
+    {"type": "events", "events": [...]}
+
+Lists are split so that each message fits in the MAX_MESSAGE_SIZE of the backend;
+the geometry of an event which would not fit in a message by itself is omitted
+(clients can retrieve it from the API).
+"""
+import logging
+import simplejson as json
+from threading import local
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .settings import EVENT_BATCH_SIZE
+from .backends import get_backend
+from .tasks import send_message
+
+
+logger = logging.getLogger(__name__)
+
+
+__all__ = [
+    'node_event',
+    'coalesce',
+    'EventBuffer',
+    'split_events',
+    'publish_events',
+    'publish_event',
+    'start_batching',
+    'stop_batching'
+]
+
+
+# used to determine the type of coalesced events
+EVENT_RANKS = {
+    'node.status_changed': 1,
+    'node.changed': 2,
+    'node.added': 3
+}
+
+
+def node_event(node, event_type, **kwargs):
+    """ returns the event of the specified type for node """
+    event = {
+        'type': event_type,
+        'slug': node.slug,
+        'name': node.name,
+        'point': list(node.point.coords[0:2])
+    }
+    if 'nodeshot.core.layers' in settings.INSTALLED_APPS:
+        event['layer'] = _related_slug(node, 'layer')
+    if event_type != 'node.deleted':
+        event['status'] = _related_slug(node, 'status')
+    if event_type in ['node.added', 'node.changed']:
+        event['geometry'] = json.loads(node.geometry.json)
+    event.update(kwargs)
+    return event
+
+
+def _related_slug(node, field_name):
+    """
+    returns the slug of the layer or status of node;
+    while batching the slugs of all the layers or statuses are loaded once
+    instead of loading the related object of each node
+    """
+    field = node._meta.get_field(field_name)
+    pk = getattr(node, field.attname)
+    if pk is None:
+        return None
+
+    slugs = getattr(_state, 'slugs', None)
+    # not batching or related object already loaded
+    if slugs is None or hasattr(node, field.get_cache_name()):
+        return getattr(node, field_name).slug
+
+    # reload if the object has been created after the slugs were loaded
+    if pk not in slugs.get(field_name, {}):
+        slugs[field_name] = dict(field.rel.to._default_manager.values_list('id', 'slug'))
+    return slugs[field_name].get(pk)
+
+
+def coalesce(previous, event):
+    """
+    merges two subsequent events of the same node,
+    returns None if they cancel each other out (eg: added and then deleted)
+    """
+    if event['type'] == 'node.deleted':
+        return None if previous['type'] == 'node.added' else event
+
+    if previous['type'] == 'node.deleted':
+        return event
+
+    merged = dict(previous)
+    merged.update(event)
+    merged['type'] = max(previous['type'], event['type'], key=EVENT_RANKS.get)
+    # keep the status the node had before the first change
+    if 'old_status' in previous:
+        merged['old_status'] = previous['old_status']
+    return merged
+
+
+class EventBuffer(object):
+    """ ordered buffer of events which coalesces events of the same node """
+
+    def __init__(self):
+        self.events = OrderedDict()
+
+    def __len__(self):
+        return len(self.events)
+
+    def add(self, event):
+        slug = event['slug']
+        previous = self.events.pop(slug, None)
+        if previous is not None:
+            event = coalesce(previous, event)
+        if event is not None:
+            self.events[slug] = event
+
+    def pop_all(self):
+        """ returns the buffered events and empties the buffer """
+        events = self.events.values()
+        self.events = OrderedDict()
+        return events
+
+
+def split_events(events, max_size=None):
+    """
+    serializes events in JSON lists of at most max_size bytes (one list if max_size is None),
+    the geometry of events which would exceed max_size by themselves is omitted
+    """
+    if not events:
+        return []
+    if max_size is None:
+        return [json.dumps(events)]
+
+    messages = []
+    chunk = []
+    # brackets of the list
+    size = 2
+
+    for event in events:
+        data = json.dumps(event)
+        if len(data) + 2 > max_size and 'geometry' in event:
+            event = dict(event)
+            del event['geometry']
+            data = json.dumps(event)
+        # a comma separates each event from the previous one
+        if chunk and size + len(data) + 1 > max_size:
+            messages.append('[%s]' % ','.join(chunk))
+            chunk = []
+            size = 2
+        size += len(data) + (1 if chunk else 0)
+        chunk.append(data)
+
+    messages.append('[%s]' % ','.join(chunk))
+    return messages
+
+
+def publish_events(events):
+    """
+    publishes a list of events on the message bus, in as many messages as needed;
+    errors of the bus are logged so that they don't make the change of the nodes fail
+    """
+    for message in split_events(events, get_backend().MAX_MESSAGE_SIZE):
+        try:
+            send_message(message, pipe='events')
+        except Exception as e:
+            logger.error('could not publish node events: %s' % e)
+
+
+_state = local()
+
+
+def publish_event(event):
+    """ publishes event, or buffers it if batching is active in the current thread """
+    buffer = getattr(_state, 'buffer', None)
+
+    if buffer is None:
+        publish_events([event])
+        return
+
+    buffer.add(event)
+    if len(buffer) >= EVENT_BATCH_SIZE:
+        publish_events(buffer.pop_all())
+
+
+def start_batching():
+    """
+    events published by the current thread are buffered and published
+    in batches of EVENT_BATCH_SIZE events, use during bulk operations
+    """
+    if getattr(_state, 'buffer', None) is None:
+        _state.buffer = EventBuffer()
+        # slugs of layers and statuses by id, see _related_slug
+        _state.slugs = {}
+
+
+def stop_batching():
+    """ publishes buffered events and stops batching """
+    buffer = getattr(_state, 'buffer', None)
+    _state.buffer = None
+    _state.slugs = None
+    if buffer is not None:
+        publish_events(buffer.pop_all())
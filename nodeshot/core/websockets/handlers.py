@@ -1,26 +1,89 @@
 import uuid
+import logging
+import simplejson as json
+from collections import deque
+
+import tornado.ioloop
 import tornado.websocket
 
+from .backends import get_backend
+from .subscriptions import SubscriptionIndex
+from .metrics import metrics
+from .settings import COMPRESSION, CLIENT_QUEUE_SIZE, SLOW_CLIENT_POLICY, ANNOUNCE_CLIENTS
+
+
+logger = logging.getLogger(__name__)
+
 
 class WebSocketHandler(tornado.websocket.WebSocketHandler):
     """
     simple websocket server for bidirectional communication between client and server
+
+    each client has a bounded queue of outbound messages and only one write in flight:
+    when the queue of a slow client is full SLOW_CLIENT_POLICY is applied,
+    either the oldest message is dropped or the client is disconnected
     """
-    
-    # public means non authenticated
-    # private means authenticated
-    channels = {
-        'public': {},
-        'private': {}
+
+    # all the connected clients
+    clients = set()
+    # authenticated clients (user_id -> client)
+    private_clients = {}
+    # topic subscriptions
+    subscriptions = SubscriptionIndex()
+    # clients which did not subscribe to any topic receive all the topic messages
+    unsubscribed = set()
+    # counters of messages which could not be delivered to slow clients
+    stats = {
+        'dropped': 0,
+        'disconnected': 0
     }
-    
-    def send_message(self, *args):
-        """ alias to write_message """
-        self.write_message(*args)
-    
+
+    def get_compression_options(self):
+        """ enables permessage-deflate if COMPRESSION setting is True """
+        return {} if COMPRESSION else None
+
+    def send_message(self, message):
+        """ enqueues message, which will be written as soon as previous messages have been flushed """
+        if self.closed:
+            return
+
+        if len(self.queue) >= CLIENT_QUEUE_SIZE:
+            if SLOW_CLIENT_POLICY == 'disconnect':
+                self.stats['disconnected'] += 1
+                self.closed = True
+                self.queue.clear()
+                # closing is deferred because callers might be looping over clients
+                tornado.ioloop.IOLoop.current().add_callback(self.close)
+                logger.info('disconnected slow client %s' % self.id)
+                return
+            self.queue.popleft()
+            self.stats['dropped'] += 1
+
+        self.queue.append(message)
+        metrics.messages_out.increment()
+
+        if not self.writing:
+            self._write_queue()
+
+    def _write_queue(self):
+        """ writes queued messages until a write can't be flushed immediately """
+        self.writing = False
+
+        while self.queue and not self.closed:
+            try:
+                future = self.write_message(self.queue.popleft())
+            except tornado.websocket.WebSocketClosedError:
+                self.queue.clear()
+                return
+            # older tornado versions don't return a future
+            if future is not None and not future.done():
+                self.writing = True
+                future.add_done_callback(lambda future: self._write_queue())
+                return
+
     def add_client(self, user_id=None):
         """
-        Adds current instance to public or private channel.
+        Adds current instance to the registry of connected clients.
         If user_id is specified it will be added to the private channel,
         If user_id is not specified it will be added to the public one instead.
         """
@@ -30,77 +93,140 @@ class WebSocketHandler(tornado.websocket.WebSocketHandler):
             user_id = uuid.uuid1().hex
         else:
             self.channel = 'private'
-        
+
         self.id = user_id
-        self.channels[self.channel][self.id] = self
-        print 'Client connected to the %s channel.' % self.channel
-    
+        self.queue = deque()
+        self.writing = False
+        self.closed = False
+        self.clients.add(self)
+        self.unsubscribed.add(self)
+
+        if self.channel == 'private':
+            self.private_clients[self.id] = self
+            # presence is shared with the other websocket server instances
+            get_backend().register_client(self.id)
+
+        logger.debug('client connected to the %s channel' % self.channel)
+
     def remove_client(self):
         """ removes a client """
-        del self.channels[self.channel][self.id]
-    
+        self.closed = True
+        self.queue.clear()
+        self.clients.discard(self)
+        self.subscriptions.unsubscribe(self)
+        self.unsubscribed.discard(self)
+        # the same user might have connected again in the meanwhile
+        if self.channel == 'private' and self.private_clients.get(self.id) is self:
+            del self.private_clients[self.id]
+            get_backend().unregister_client(self.id)
+
     @classmethod
     def broadcast(cls, message):
         """ broadcast message to all connected clients """
-        clients = cls.get_clients()
-        # loop over every client and send message
-        for id, client in clients.iteritems():
+        for client in cls.clients:
             client.send_message(message)
-    
+
     @classmethod
-    def send_private_message(self, user_id, message):
+    def send_events(cls, events):
+        """
+        send node events (see events.py) in one frame per client,
+        clients receive only the events of the topics they are subscribed to
+        """
+        if not events:
+            return
+
+        recipients = {}
+        for event in events:
+            for client in cls.subscriptions.match(layer=event.get('layer'), node=event['slug'], point=event.get('point')):
+                recipients.setdefault(client, []).append(event)
+
+        for client, client_events in recipients.iteritems():
+            client.send_message(json.dumps({ 'type': 'events', 'events': client_events }))
+
+        # frame is serialized only once for clients which receive everything
+        if cls.unsubscribed:
+            frame = json.dumps({ 'type': 'events', 'events': events })
+            for client in cls.unsubscribed:
+                client.send_message(frame)
+
+    def subscribe(self, layers=(), nodes=(), bbox=None):
+        """ subscribe to topics, the client will receive only the node events of its topics """
+        self.subscriptions.subscribe(self, layers=layers, nodes=nodes, bbox=bbox)
+        self.unsubscribed.discard(self)
+
+    def unsubscribe(self):
+        """ remove all the subscriptions, the client will receive all the messages """
+        self.subscriptions.unsubscribe(self)
+        self.unsubscribed.add(self)
+
+    @classmethod
+    def send_private_message(cls, user_id, message):
         """
         Send a message to a specific client.
         Returns True if successful, False otherwise
         """
-        try:
-            client = self.channels['private'][str(user_id)]
-        except KeyError:
-            print '====debug===='
-            print self.channels['private']
-            print 'client with id %s not found' % user_id
+        client = cls.private_clients.get(str(user_id))
+
+        if client is None:
+            logger.debug('client with id %s not found' % user_id)
             return False
-        
+
         client.send_message(message)
-        print 'message sent to client #%s' % user_id
         return True
-    
+
     @classmethod
-    def get_clients(self):
-        """ return a merge of public and private clients """
-        public = self.channels['public']
-        private = self.channels['private']
-        return dict(public.items() + private.items())
-    
+    def announce(cls, message):
+        """ broadcasts the number of connected clients if ANNOUNCE_CLIENTS setting is True """
+        if not ANNOUNCE_CLIENTS:
+            return
+        client_count = len(cls.clients)
+        cls.broadcast(message % (client_count, 'client' if client_count <= 1 else 'clients'))
+
     def open(self):
         """ method which is called every time a new client connects """
-        print 'Connection opened.'
-        
         # retrieve user_id if specified
         user_id = self.get_argument("user_id", None)
         # add client to list of connected clients
         self.add_client(user_id)
         # welcome message
         self.send_message("Welcome to nodeshot websocket server.")
-        # new client connected message
-        client_count = len(self.get_clients().keys())
-        new_client_message = 'New client connected, now we have %d %s!' % (client_count, 'client' if client_count <= 1 else 'clients')
         # broadcast new client connected message to all connected clients
-        self.broadcast(new_client_message)
-        
-        print self.channels['private']
+        self.announce('New client connected, now we have %d %s!')
 
     def on_message(self, message):
-        """ method which is called every time the server gets a message from a client """
+        """
+        method which is called every time the server gets a message from a client;
+        clients can subscribe to topics by sending JSON messages like:
+
+            {"action": "subscribe", "layers": ["rome"], "nodes": ["node-slug"], "bbox": [12.3, 41.7, 12.7, 42.0]}
+
+        all keys except "action" are optional, {"action": "unsubscribe"} removes all the subscriptions
+        """
+        metrics.messages_received.increment()
+
         if message == "help":
             self.send_message("Need help, huh?")
-        print 'Message received: \'%s\'' % message
+        elif message.startswith('{'):
+            self.handle_action(message)
+
+    def handle_action(self, message):
+        """ performs subscribe and unsubscribe actions """
+        try:
+            data = json.loads(message)
+            action = data['action']
+            if action == 'subscribe':
+                self.subscribe(layers=data.get('layers', []),
+                               nodes=data.get('nodes', []),
+                               bbox=data.get('bbox'))
+            elif action == 'unsubscribe':
+                self.unsubscribe()
+            else:
+                raise ValueError('unknown action %s' % action)
+        except (ValueError, KeyError, TypeError, OverflowError) as e:
+            self.send_message('invalid message: %s' % e)
 
     def on_close(self):
         """ method which is called every time a client disconnects """
-        print 'Connection closed.'
+        logger.debug('client disconnected from the %s channel' % self.channel)
         self.remove_client()
-        
-        client_count = len(self.get_clients().keys())
-        new_client_message = '1 client disconnected, now we have %d %s!' % (client_count, 'client' if client_count <= 1 else 'clients')
-        self.broadcast(new_client_message)
+        self.announce('1 client disconnected, now we have %d %s!')
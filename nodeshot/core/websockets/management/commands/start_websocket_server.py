@@ -1,11 +1,37 @@
+from optparse import make_option
+
 from django.core.management.base import BaseCommand
 
 from nodeshot.core.websockets.server import start as start_server
+from nodeshot.core.websockets import ADDRESS, PORT
 
 
 class Command(BaseCommand):
     help = "Start Tornado WebSocket Server"
 
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--port',
+            action='store',
+            dest='port',
+            type='int',
+            default=PORT,
+            help='Listening port, defaults to settings.NODESHOT_WEBSOCKETS_LISTENING_PORT'),
+        make_option(
+            '--address',
+            action='store',
+            dest='address',
+            default=ADDRESS,
+            help='Listening address, defaults to settings.NODESHOT_WEBSOCKETS_LISTENING_ADDRESS'),
+        make_option(
+            '--processes',
+            action='store',
+            dest='processes',
+            type='int',
+            default=1,
+            help='Number of server processes sharing the listening port, 0 means one per CPU'),
+    )
+
     def handle(self, *args, **options):
         """ Go baby go! """
-        start_server()
+        start_server(port=options['port'], address=options['address'], processes=options['processes'])
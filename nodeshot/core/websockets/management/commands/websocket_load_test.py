@@ -0,0 +1,115 @@
+import time
+import simplejson as json
+from optparse import make_option
+
+import tornado.gen
+import tornado.ioloop
+import tornado.websocket
+
+from django.core.management.base import BaseCommand
+
+from nodeshot.core.websockets.backends import get_backend
+from nodeshot.core.websockets import ADDRESS, PORT
+
+
+class Command(BaseCommand):
+    help = """
+    Load test a running websocket server:
+    connects many clients, publishes timestamped messages on the public pipe
+    and reports how many messages were delivered and their latency
+    """
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--url',
+            action='store',
+            dest='url',
+            default='ws://%s:%s/' % (ADDRESS, PORT),
+            help='URL of the websocket server'),
+        make_option(
+            '--clients',
+            action='store',
+            dest='clients',
+            type='int',
+            default=100,
+            help='Number of clients to connect'),
+        make_option(
+            '--messages',
+            action='store',
+            dest='messages',
+            type='int',
+            default=100,
+            help='Number of messages to publish'),
+        make_option(
+            '--interval',
+            action='store',
+            dest='interval',
+            type='float',
+            default=0.01,
+            help='Seconds between each message'),
+        make_option(
+            '--timeout',
+            action='store',
+            dest='timeout',
+            type='float',
+            default=10,
+            help='Seconds to wait for the last messages to be delivered'),
+    )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.latencies = []
+        self.connections = []
+        tornado.ioloop.IOLoop.current().run_sync(self.run)
+        self.report()
+
+    @tornado.gen.coroutine
+    def run(self):
+        options = self.options
+
+        for i in range(options['clients']):
+            connection = yield tornado.websocket.websocket_connect(options['url'])
+            self.connections.append(connection)
+            self.read(connection)
+        self.stdout.write('%d clients connected\n' % len(self.connections))
+
+        backend = get_backend()
+        for i in range(options['messages']):
+            backend.publish(json.dumps({ 'load_test': i, 'time': time.time() }), 'public')
+            yield tornado.gen.sleep(options['interval'])
+
+        # wait for the last messages to be delivered
+        deadline = time.time() + options['timeout']
+        while len(self.latencies) < self.expected and time.time() < deadline:
+            yield tornado.gen.sleep(0.1)
+
+        for connection in self.connections:
+            connection.close()
+        backend.close()
+
+    @property
+    def expected(self):
+        return len(self.connections) * self.options['messages']
+
+    @tornado.gen.coroutine
+    def read(self, connection):
+        """ reads messages until the connection is closed, records latency of load test messages """
+        while True:
+            message = yield connection.read_message()
+            if message is None:
+                break
+            if '"load_test"' not in message:
+                continue
+            self.latencies.append(time.time() - json.loads(message)['time'])
+
+    def report(self):
+        latencies = sorted(self.latencies)
+        self.stdout.write('delivered %d of %d messages\n' % (len(latencies), self.expected))
+
+        if not latencies:
+            return
+
+        for label, percentile in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+            index = min(int(len(latencies) * percentile), len(latencies) - 1)
+            self.stdout.write('%s latency: %.1f ms\n' % (label, latencies[index] * 1000))
+        self.stdout.write('max latency: %.1f ms\n' % (latencies[-1] * 1000))
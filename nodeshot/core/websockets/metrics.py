@@ -0,0 +1,146 @@
+"""
+in-memory metrics of the websocket server process, exposed by server.MetricsHandler
+"""
+import time
+from collections import deque
+
+from .settings import METRICS_RATE_WINDOW
+
+
+__all__ = [
+    'RateCounter',
+    'Histogram',
+    'Metrics',
+    'metrics'
+]
+
+
+class RateCounter(object):
+    """
+    counts events and computes their average rate per second
+    over the last ``window`` complete seconds
+    """
+
+    def __init__(self, window=METRICS_RATE_WINDOW):
+        self.window = window
+        self.total = 0
+        # [second, count] pairs, oldest first
+        self.seconds = deque()
+
+    def increment(self, amount=1, now=None):
+        second = int(now if now is not None else time.time())
+        self.total += amount
+        if self.seconds and self.seconds[-1][0] == second:
+            self.seconds[-1][1] += amount
+        else:
+            self.seconds.append([second, amount])
+        self._expire(second)
+
+    def _expire(self, second):
+        while self.seconds and self.seconds[0][0] < second - self.window:
+            self.seconds.popleft()
+
+    def rate(self, now=None):
+        """ average per second, the current (incomplete) second is excluded """
+        second = int(now if now is not None else time.time())
+        self._expire(second)
+        count = sum(c for s, c in self.seconds if s < second)
+        return float(count) / self.window
+
+    def as_dict(self, now=None):
+        return {
+            'total': self.total,
+            'per_second': self.rate(now)
+        }
+
+
+class Histogram(object):
+    """
+    histogram of durations in seconds, buckets are cumulative
+    (each bucket counts the observations lower or equal to its upper bound)
+    """
+
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def as_dict(self):
+        buckets = dict((str(bound), count) for bound, count in zip(self.buckets, self.counts))
+        buckets['+Inf'] = self.count
+        return {
+            'buckets': buckets,
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max
+        }
+
+
+class Metrics(object):
+    """ metrics of the current websocket server process """
+
+    def __init__(self):
+        self.started = time.time()
+        # messages received from the message bus
+        self.messages_in = RateCounter()
+        # messages received from clients
+        self.messages_received = RateCounter()
+        # messages queued for delivery to clients
+        self.messages_out = RateCounter()
+        # time spent dispatching a message of each pipe to the clients
+        self.fanout = {}
+
+    def observe_fanout(self, pipe, started):
+        """ records the time elapsed since started for the specified pipe """
+        if pipe not in self.fanout:
+            self.fanout[pipe] = Histogram()
+        self.fanout[pipe].observe(time.time() - started)
+
+    def as_dict(self, handler):
+        """
+        returns a JSON serializable snapshot of the metrics;
+        handler is the WebSocketHandler class, its clients are inspected to
+        count clients per channel and measure the depth of outbound queues
+        """
+        channels = { 'public': 0, 'private': 0 }
+        queued = max_queue = writing = 0
+
+        for client in handler.clients:
+            channels[client.channel] += 1
+            depth = len(client.queue)
+            queued += depth
+            max_queue = max(max_queue, depth)
+            writing += client.writing
+
+        return {
+            'uptime': time.time() - self.started,
+            'clients': dict(channels, total=len(handler.clients)),
+            'messages': {
+                'in': self.messages_in.as_dict(),
+                'received': self.messages_received.as_dict(),
+                'out': self.messages_out.as_dict()
+            },
+            'queues': {
+                'total': queued,
+                'max': max_queue,
+                'writing': writing
+            },
+            'fanout': dict((pipe, histogram.as_dict()) for pipe, histogram in self.fanout.items()),
+            'dropped': handler.stats['dropped'],
+            'disconnected': handler.stats['disconnected']
+        }
+
+
+metrics = Metrics()
@@ -5,27 +5,25 @@ from django.conf import settings
 from nodeshot.core.nodes.signals import node_status_changed
 from nodeshot.core.nodes.models import Node
 
-from ..tasks import send_message
+from ..events import node_event, publish_event, start_batching, stop_batching
 
 
-# ------ NODE CREATED ------ #
+# ------ NODE CREATED OR CHANGED ------ #
 
 @receiver(post_save, sender=Node)
-def node_created_handler(sender, **kwargs):
-    if kwargs['created']:
-        obj = kwargs['instance']
-        message = 'node "%s" has been added' % obj.name
-        send_message.delay(message)
+def node_saved_handler(sender, **kwargs):
+    obj = kwargs['instance']
+    event_type = 'node.added' if kwargs['created'] else 'node.changed'
+    publish_event(node_event(obj, event_type))
 
 # ------ NODE STATUS CHANGED ------ #
 
 @receiver(node_status_changed)
 def node_status_changed_handler(**kwargs):
     obj = kwargs['instance']
-    obj.old_status = kwargs['old_status'].name
-    obj.new_status = kwargs['new_status'].name
-    message = 'node "%s" changed its status from "%s" to "%s"' % (obj.name, obj.old_status, obj.new_status)
-    send_message.delay(message)
+    publish_event(node_event(obj, 'node.status_changed',
+                             status=kwargs['new_status'].slug,
+                             old_status=kwargs['old_status'].slug))
 
 
 # ------ NODE DELETED ------ #
@@ -33,31 +31,32 @@ def node_status_changed_handler(**kwargs):
 @receiver(pre_delete, sender=Node)
 def node_deleted_handler(sender, **kwargs):
     obj = kwargs['instance']
-    message = 'node "%s" has been deleted' % obj.name
-    send_message.delay(message)
+    publish_event(node_event(obj, 'node.deleted'))
 
 
 # ------ DISCONNECT UTILITY ------ #
 
 def disconnect():
     """ disconnect signals """
-    post_save.disconnect(node_created_handler, sender=Node)
+    post_save.disconnect(node_saved_handler, sender=Node)
     node_status_changed.disconnect(node_status_changed_handler)
     pre_delete.disconnect(node_deleted_handler, sender=Node)
 
 
 def reconnect():
     """ reconnect signals """
-    post_save.connect(node_created_handler, sender=Node)
+    post_save.connect(node_saved_handler, sender=Node)
     node_status_changed.connect(node_status_changed_handler)
     pre_delete.connect(node_deleted_handler, sender=Node)
 
 
+# during bulk operations (see pause_disconnectable_signals)
+# events are published in batches instead of being suppressed
 from nodeshot.core.base.settings import DISCONNECTABLE_SIGNALS
 DISCONNECTABLE_SIGNALS.append(
     {
-        'disconnect': disconnect,
-        'reconnect': reconnect
+        'disconnect': start_batching,
+        'reconnect': stop_batching
     }
 )
 setattr(settings, 'NODESHOT_DISCONNECTABLE_SIGNALS', DISCONNECTABLE_SIGNALS)
@@ -6,22 +6,34 @@ from django.core.urlresolvers import reverse
 from django.conf import settings
 
 from nodeshot.community.notifications.models import Notification
+from nodeshot.community.notifications.signals import notifications_created
 from ..tasks import send_message
 
 
 # ------ NEW NOTIFICATIONS ------ #
 
+def notification_message(obj):
+    return {
+        'user_id': str(obj.to_user_id),
+        'model': 'notification',
+        'type': obj.type,
+        'url': reverse('api_notification_detail', args=[obj.id])
+    }
+
+
 @receiver(post_save, sender=Notification)
 def new_notification_handler(sender, **kwargs):
     if kwargs['created']:
         obj = kwargs['instance']
-        message = {
-            'user_id': str(obj.to_user.id),
-            'model': 'notification',
-            'type': obj.type,
-            'url': reverse('api_notification_detail', args=[obj.id])
-        }
-        send_message(json.dumps(message), pipe='private')
+        send_message(json.dumps(notification_message(obj)), pipe='private')
+
+
+@receiver(notifications_created, sender=Notification)
+def bulk_notifications_handler(sender, **kwargs):
+    """ notifications inserted in bulk by create_notifications """
+    for obj in kwargs['notifications']:
+        if obj.id is not None:
+            send_message(json.dumps(notification_message(obj)), pipe='private')
 
 
 # ------ DISCONNECT UTILITY ------ #
@@ -29,11 +41,13 @@ def new_notification_handler(sender, **kwargs):
 def disconnect():
     """ disconnect signals """
     post_save.disconnect(new_notification_handler, sender=Notification)
+    notifications_created.disconnect(bulk_notifications_handler, sender=Notification)
 
 
 def reconnect():
     """ reconnect signals """
     post_save.connect(new_notification_handler, sender=Notification)
+    notifications_created.connect(bulk_notifications_handler, sender=Notification)
 
 
 from nodeshot.core.base.settings import DISCONNECTABLE_SIGNALS
@@ -1,90 +1,120 @@
 import time
 import simplejson as json
-from threading import Thread
 
 import tornado.web
 import tornado.ioloop
+import tornado.netutil
+import tornado.process
+import tornado.httpserver
 
 from .handlers import WebSocketHandler
-from . import ADDRESS, PORT, PUBLIC_PIPE, PRIVATE_PIPE  # contained in __init__.py
+from .backends import get_backend
+from .events import EventBuffer
+from .metrics import metrics
+from .settings import EVENT_BATCH_WINDOW, METRICS_ALLOWED_IPS
+from . import ADDRESS, PORT  # contained in __init__.py
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """
+    returns the metrics of this server process in JSON:
+    clients per channel, messages per second, outbound queue depths,
+    fan-out time histograms and messages dropped because of slow clients
+    """
+
+    def get(self):
+        if self.request.remote_ip not in METRICS_ALLOWED_IPS:
+            raise tornado.web.HTTPError(403)
+        data = metrics.as_dict(WebSocketHandler)
+        data['instance_id'] = get_backend().instance_id
+        # node events waiting for the end of the batch window
+        data['queues']['events'] = len(event_buffer)
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps(data))
 
 
 application = tornado.web.Application([
     (r'/', WebSocketHandler),
+    (r'/metrics', MetricsHandler),
 ])
 
 
-def public_broadcaster():
+# node events received during the current batch window
+event_buffer = EventBuffer()
+event_flush_scheduled = False
+
+
+def flush_events():
+    """ sends the events coalesced during the batch window """
+    global event_flush_scheduled
+    event_flush_scheduled = False
+    started = time.time()
+    WebSocketHandler.send_events(event_buffer.pop_all())
+    metrics.observe_fanout('events', started)
+
+
+def on_bus_message(pipe, message):
     """
-    Thread which runs in parallel and constantly checks for new messages
-    in the public pipe and broadcasts them publicly to all connected clients.
+    called by the message bus backend every time a message is published:
+        * public messages are broadcasted to all the clients connected to this instance
+        * node events are coalesced for EVENT_BATCH_WINDOW seconds and then sent in one frame
+        * private messages are sent to the client specified in "user_id"
+          (if client is not connected to this instance the message is discarded)
     """
-    while __websocket_server_running__:
-        pipein = open(PUBLIC_PIPE, 'r')
-        line = pipein.readline().replace('\n', '').replace('\r', '')
-        if line != '':
-            WebSocketHandler.broadcast(line)
-            print line
-            
-            remaining_lines = pipein.read()
-            pipein.close()
-            pipeout = open(PUBLIC_PIPE, 'w')
-            pipeout.write(remaining_lines)
-            pipeout.close()
-        else:
-            pipein.close()
-        
-        time.sleep(0.05)
-
-public_broadcaster_thread = Thread(target=public_broadcaster, args=[])
-public_broadcaster_thread.deamon = True
-
-
-def private_messenger():
+    metrics.messages_in.increment()
+
+    if pipe == 'events':
+        global event_flush_scheduled
+        for event in json.loads(message):
+            event_buffer.add(event)
+        if not event_flush_scheduled:
+            event_flush_scheduled = True
+            io_loop = tornado.ioloop.IOLoop.current()
+            io_loop.add_timeout(io_loop.time() + EVENT_BATCH_WINDOW, flush_events)
+        # fan-out time is measured when the batch is flushed
+        return
+
+    started = time.time()
+
+    if pipe == 'public':
+        WebSocketHandler.broadcast(message)
+    else:
+        message = json.loads(message)
+        WebSocketHandler.send_private_message(user_id=message['user_id'],
+                                              message=message)
+
+    metrics.observe_fanout(pipe, started)
+
+
+def start(port=PORT, address=ADDRESS, processes=1):
     """
-    Thread which runs in parallel and constantly checks for new messages
-    in the private pipe and sends them to the specific client.
-    If client is not connected the message is discarded.
+    starts the websocket server;
+    if processes is greater than 1 (or 0, which means one per CPU) the listening
+    socket is shared by the specified number of forked processes,
+    each process is a different instance of the message bus (see backends.base)
     """
-    while __websocket_server_running__:
-        pipein = open(PRIVATE_PIPE, 'r')
-        line = pipein.readline().replace('\n', '').replace('\r', '')
-        if line != '':
-            message = json.loads(line)
-            WebSocketHandler.send_private_message(user_id=message['user_id'],
-                                                  message=message)
-            print line
-            
-            remaining_lines = pipein.read()
-            pipein.close()
-            pipeout = open(PRIVATE_PIPE, 'w')
-            pipeout.write(remaining_lines)
-            pipeout.close()
-        else:
-            pipein.close()
-        
-        time.sleep(0.05)
-
-private_messenger_thread = Thread(target=private_messenger, args=[])
-private_messenger_thread.deamon = True
-
-
-def start():    
-    global __websocket_server_running__
-    __websocket_server_running__ = True
-    
-    application.listen(PORT, address=ADDRESS)
+    sockets = tornado.netutil.bind_sockets(port, address=address)
+
+    if processes != 1:
+        tornado.process.fork_processes(processes)
+
+    # IOLoop and backend must be created after forking
+    server = tornado.httpserver.HTTPServer(application)
+    server.add_sockets(sockets)
     websocktserver = tornado.ioloop.IOLoop.instance()
-    
+    backend = get_backend()
+
     try:
-        print "\nStarted Tornado Wesocket Server at ws://%s:%s\n" % (ADDRESS, PORT)
-        
-        public_broadcaster_thread.start()
-        private_messenger_thread.start()
+        print "\nStarted Tornado Wesocket Server at ws://%s:%s\n" % (address, port)
+
+        backend.listen(on_bus_message, websocktserver)
         websocktserver.start()
     # on exit
     except (KeyboardInterrupt, SystemExit):
-        __websocket_server_running__ = False
+        # clean presence
+        for user_id in WebSocketHandler.private_clients.keys():
+            backend.unregister_client(user_id)
+        backend.close()
         websocktserver.stop()
-        
+
         print "\nStopped Tornado Wesocket Server\n"
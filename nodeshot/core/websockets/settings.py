@@ -2,8 +2,6 @@ import os
 from django.conf import settings
 
 
-PUBLIC_PIPE = getattr(settings, 'NODESHOT_WEBSOCKETS_PUBLIC_PIPE', '%s/nodeshot.websockets.public' % os.path.dirname(settings.SITE_ROOT))
-PRIVATE_PIPE = getattr(settings, 'NODESHOT_WEBSOCKETS_PRIVATE_PIPE', '%s/nodeshot.websockets.private' % os.path.dirname(settings.SITE_ROOT))
 DOMAIN = settings.DOMAIN
 PATH = getattr(settings, 'NODESHOT_WEBSOCKETS_PATH', '')
 LISTENING_ADDRESS = getattr(settings, 'NODESHOT_WEBSOCKETS_LISTENING_ADDRESS', '0.0.0.0')
@@ -12,3 +10,31 @@ REGISTER = getattr(settings, 'NODESHOT_WEBSOCKETS_REGISTER', (
     'nodeshot.core.websockets.registrars.nodes',
     'nodeshot.core.websockets.registrars.notifications',
 ))
+# message bus which delivers messages from django and celery to the websocket server
+BACKEND = getattr(settings, 'NODESHOT_WEBSOCKETS_BACKEND', 'nodeshot.core.websockets.backends.unix_socket.UnixSocketBackend')
+# unix socket backend: path of the datagram socket bound by the websocket server
+UNIX_SOCKET = getattr(settings, 'NODESHOT_WEBSOCKETS_UNIX_SOCKET', '%s/nodeshot.websockets.sock' % os.path.dirname(settings.SITE_ROOT))
+# redis backend: connection URL and prefix of the pub/sub channels
+REDIS_URL = getattr(settings, 'NODESHOT_WEBSOCKETS_REDIS_URL', 'redis://localhost:6379/0')
+REDIS_PREFIX = getattr(settings, 'NODESHOT_WEBSOCKETS_REDIS_PREFIX', 'nodeshot.websockets')
+# size in degrees of the cells of the grid which indexes bbox subscriptions
+GRID_CELL_SIZE = getattr(settings, 'NODESHOT_WEBSOCKETS_GRID_CELL_SIZE', 0.5)
+# bbox subscriptions spanning more cells than this are checked against every message instead of being indexed
+MAX_BBOX_CELLS = getattr(settings, 'NODESHOT_WEBSOCKETS_MAX_BBOX_CELLS', 400)
+# node events received by the websocket server within this number of seconds are coalesced and sent in one frame
+EVENT_BATCH_WINDOW = getattr(settings, 'NODESHOT_WEBSOCKETS_EVENT_BATCH_WINDOW', 0.1)
+# maximum number of node events buffered by publishers during bulk operations (see events.start_batching),
+# batches are published in as many messages as needed to respect the message size limit of the backend
+EVENT_BATCH_SIZE = getattr(settings, 'NODESHOT_WEBSOCKETS_EVENT_BATCH_SIZE', 500)
+# enables the permessage-deflate extension for clients which support it
+COMPRESSION = getattr(settings, 'NODESHOT_WEBSOCKETS_COMPRESSION', False)
+# maximum number of messages waiting to be written to a client
+CLIENT_QUEUE_SIZE = getattr(settings, 'NODESHOT_WEBSOCKETS_CLIENT_QUEUE_SIZE', 100)
+# what to do when the queue of a slow client is full: "drop" the oldest message or "disconnect" the client
+SLOW_CLIENT_POLICY = getattr(settings, 'NODESHOT_WEBSOCKETS_SLOW_CLIENT_POLICY', 'drop')
+# broadcast a message to all the clients each time a client connects or disconnects
+ANNOUNCE_CLIENTS = getattr(settings, 'NODESHOT_WEBSOCKETS_ANNOUNCE_CLIENTS', True)
+# seconds over which messages per second are averaged by the metrics endpoint
+METRICS_RATE_WINDOW = getattr(settings, 'NODESHOT_WEBSOCKETS_METRICS_RATE_WINDOW', 10)
+# IP addresses allowed to read the metrics endpoint (/metrics)
+METRICS_ALLOWED_IPS = getattr(settings, 'NODESHOT_WEBSOCKETS_METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
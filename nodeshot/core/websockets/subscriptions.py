@@ -0,0 +1,123 @@
+from math import floor, isinf, isnan
+
+from .settings import GRID_CELL_SIZE, MAX_BBOX_CELLS
+
+
+__all__ = ['SubscriptionIndex']
+
+
+class SubscriptionIndex(object):
+    """
+    Index of the topics websocket clients are subscribed to:
+        * layers (by slug)
+        * nodes (by slug)
+        * a bounding box (eg: the viewport of a map), indexed in a grid
+          of GRID_CELL_SIZE degrees; bounding boxes which span more than
+          MAX_BBOX_CELLS cells are kept in a separate set of wide subscriptions
+
+    Finding the subscribers of a message costs work proportional
+    to the number of subscribers of its topics, not to the number of clients.
+    """
+
+    def __init__(self, cell_size=GRID_CELL_SIZE, max_bbox_cells=MAX_BBOX_CELLS):
+        self.cell_size = cell_size
+        self.max_bbox_cells = max_bbox_cells
+        # topic -> set of clients, topics are ('layer', slug) or ('node', slug) tuples
+        self.topics = {}
+        # (x, y) cell -> set of clients
+        self.grid = {}
+        # clients whose bbox covers too many cells
+        self.wide = set()
+        # client -> dict of subscriptions
+        self.subscriptions = {}
+
+    def __contains__(self, client):
+        return client in self.subscriptions
+
+    def subscribe(self, client, layers=(), nodes=(), bbox=None):
+        """
+        adds subscriptions of client;
+        bbox is a (min_lng, min_lat, max_lng, max_lat) sequence and replaces the previous one
+        """
+        subscriptions = self.subscriptions.setdefault(client, {
+            'topics': set(),
+            'bbox': None,
+            'cells': []
+        })
+
+        for topic in [('layer', slug) for slug in layers] + [('node', slug) for slug in nodes]:
+            self.topics.setdefault(topic, set()).add(client)
+            subscriptions['topics'].add(topic)
+
+        if bbox is not None:
+            self._remove_bbox(client)
+            values = [float(value) for value in bbox]
+            if any(isinf(value) or isnan(value) for value in values):
+                raise ValueError('invalid bbox: %s' % bbox)
+            min_lng, min_lat, max_lng, max_lat = values
+            if min_lng > max_lng or min_lat > max_lat:
+                raise ValueError('invalid bbox: %s' % bbox)
+            # the grid covers the world only (maps may return longitudes beyond 180 degrees)
+            min_lng, max_lng = [min(max(value, -180.0), 180.0) for value in (min_lng, max_lng)]
+            min_lat, max_lat = [min(max(value, -90.0), 90.0) for value in (min_lat, max_lat)]
+            subscriptions['bbox'] = (min_lng, min_lat, max_lng, max_lat)
+            min_x, min_y = self._cell(min_lng, min_lat)
+            max_x, max_y = self._cell(max_lng, max_lat)
+            if (max_x - min_x + 1) * (max_y - min_y + 1) > self.max_bbox_cells:
+                self.wide.add(client)
+            else:
+                for x in xrange(min_x, max_x + 1):
+                    for y in xrange(min_y, max_y + 1):
+                        self.grid.setdefault((x, y), set()).add(client)
+                        subscriptions['cells'].append((x, y))
+
+    def unsubscribe(self, client):
+        """ removes all the subscriptions of client """
+        subscriptions = self.subscriptions.get(client)
+        if subscriptions is None:
+            return
+        for topic in subscriptions['topics']:
+            self._discard(self.topics, topic, client)
+        self._remove_bbox(client)
+        del self.subscriptions[client]
+
+    def match(self, layer=None, node=None, point=None):
+        """
+        returns the set of clients subscribed to the specified layer slug,
+        node slug or to a bbox which contains point, a (lng, lat) sequence
+        """
+        clients = set()
+
+        if layer is not None:
+            clients.update(self.topics.get(('layer', layer), ()))
+        if node is not None:
+            clients.update(self.topics.get(('node', node), ()))
+        if point is not None:
+            lng, lat = point[0], point[1]
+            candidates = self.grid.get(self._cell(lng, lat), set()) | self.wide
+            for client in candidates:
+                min_lng, min_lat, max_lng, max_lat = self.subscriptions[client]['bbox']
+                if min_lng <= lng <= max_lng and min_lat <= lat <= max_lat:
+                    clients.add(client)
+
+        return clients
+
+    def _cell(self, lng, lat):
+        return int(floor(lng / self.cell_size)), int(floor(lat / self.cell_size))
+
+    def _remove_bbox(self, client):
+        subscriptions = self.subscriptions[client]
+        for cell in subscriptions['cells']:
+            self._discard(self.grid, cell, client)
+        self.wide.discard(client)
+        subscriptions['cells'] = []
+        subscriptions['bbox'] = None
+
+    @staticmethod
+    def _discard(index, key, client):
+        clients = index.get(key)
+        if clients is None:
+            return
+        clients.discard(client)
+        if not clients:
+            del index[key]
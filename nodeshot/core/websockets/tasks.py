@@ -1,21 +1,15 @@
 from celery import task
-from .settings import PUBLIC_PIPE, PRIVATE_PIPE
+
+from .backends import get_backend
+from .backends.base import PIPES
 
 
 @task
 def send_message(message, pipe='public'):
     """
-    writes message to pipe
+    publishes message on the message bus of the websocket server
     """
-    if pipe not in ['public', 'private']:
-        raise ValueError('pipe argument can be only "public" or "private"')
-    else:
-        pipe = pipe.upper()
-
-    pipe_path = PUBLIC_PIPE if pipe == 'PUBLIC' else PRIVATE_PIPE
-
-    # create file if it doesn't exist, append contents
-    pipeout = open(pipe_path, 'a')
+    if pipe not in PIPES:
+        raise ValueError('pipe argument can be only one of: %s' % ', '.join(PIPES))
 
-    pipeout.write('%s\n' % message)
-    pipeout.close()
+    get_backend().publish(message, pipe)
@@ -1,9 +1,83 @@
+import os
+import tempfile
+
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from tornado.ioloop import IOLoop
+from tornado.concurrent import Future
 
 from nodeshot.core.base.tests import user_fixtures, BaseTestCase
 from nodeshot.core.nodes.models import Node
 
 from django.core import management
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+import simplejson as json
+
+from .backends.unix_socket import UnixSocketBackend
+from .backends.redis_pubsub import RedisBackend
+from .backends.base import BaseBackend, MessageTooLarge
+from .subscriptions import SubscriptionIndex
+from .events import EventBuffer, node_event, split_events, start_batching, stop_batching
+from .handlers import WebSocketHandler
+from .metrics import RateCounter, Histogram, Metrics
+from . import handlers, backends
+
+
+class BrokenBackend(BaseBackend):
+    """ message bus which is not available """
+    def publish(self, message, pipe='public'):
+        raise IOError('message bus not available')
+
+
+class FakeRedis(object):
+    """ in memory replacement of the few redis commands used by RedisBackend """
+    def __init__(self):
+        self.sets = {}
+        # number of instances subscribed to each channel
+        self.receivers = 1
+        self.fds = os.pipe()
+
+    def sadd(self, key, value):
+        self.sets.setdefault(key, set()).add(value)
+
+    def srem(self, key, value):
+        self.sets.get(key, set()).discard(value)
+
+    def smembers(self, key):
+        return set(self.sets.get(key, set()))
+
+    def publish(self, channel, message):
+        return self.receivers
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        pass
+
+    def pubsub(self, **kwargs):
+        return FakePubSub(self.fds[0])
+
+
+class FakePubSub(object):
+    def __init__(self, fd):
+        self.connection = self
+        self._sock = self
+        self.fd = fd
+
+    def fileno(self):
+        return self.fd
+
+    def subscribe(self, *channels):
+        pass
+
+    def can_read(self):
+        return False
+
+    def reset(self):
+        pass
 
 
 class TestWebsockets(BaseTestCase):
@@ -16,7 +90,293 @@ class TestWebsockets(BaseTestCase):
         user_fixtures,
         'test_layers.json',
         'test_status.json',
+        'test_nodes.json',
     ]
     
     #def test_start_websocket_server(self):
     #    self.assertTrue(False, 'TODO')
+
+    def test_unix_socket_backend(self):
+        path = os.path.join(tempfile.mkdtemp(), 'websockets.sock')
+        io_loop = IOLoop()
+        received = []
+
+        def callback(pipe, message):
+            received.append((pipe, message))
+            if len(received) == 4:
+                io_loop.stop()
+
+        # server not running, message discarded
+        self.assertFalse(UnixSocketBackend(path).publish('lost'))
+
+        # two instances listening on the same bus
+        servers = [UnixSocketBackend(path), UnixSocketBackend(path)]
+        for server in servers:
+            server.listen(callback, io_loop)
+        self.assertNotEqual(servers[0].instance_id, servers[1].instance_id)
+
+        publisher = UnixSocketBackend(path)
+        self.assertTrue(publisher.publish('public message'))
+        self.assertTrue(publisher.publish('{"user_id": "1"}', pipe='private'))
+        with self.assertRaises(ValueError):
+            publisher.publish('wrong', pipe='wrong')
+
+        # stop anyway after 2 seconds
+        io_loop.add_timeout(io_loop.time() + 2, io_loop.stop)
+        io_loop.start()
+        for server in servers:
+            server.close()
+        io_loop.close()
+
+        # each instance got each message
+        self.assertEqual(sorted(received), [
+            ('private', '{"user_id": "1"}'),
+            ('private', '{"user_id": "1"}'),
+            ('public', 'public message'),
+            ('public', 'public message')
+        ])
+        for server in servers:
+            self.assertFalse(os.path.exists(server.socket_path))
+
+    def test_redis_backend_presence(self):
+        try:
+            backend = RedisBackend()
+        except ImproperlyConfigured:
+            self.skipTest('redis is not installed')
+        backend.client = FakeRedis()
+        io_loop = IOLoop()
+        key = backend.presence_key('1')
+        try:
+            backend.listen(lambda pipe, message: None, io_loop)
+            backend.register_client('1')
+            self.assertEqual(backend.client.smembers(key), set([backend.instance_id]))
+            self.assertTrue(backend.publish('{"user_id": "1"}', pipe='private'))
+
+            # messages published while the instance is disconnected from redis remove its presence
+            backend._disconnect()
+            backend.client.receivers = 0
+            self.assertFalse(backend.publish('{"user_id": "1"}', pipe='private'))
+            self.assertEqual(backend.client.smembers(key), set())
+
+            # which is registered again when the instance reconnects
+            backend.client.receivers = 1
+            backend._connect()
+            self.assertEqual(backend.client.smembers(key), set([backend.instance_id]))
+            self.assertTrue(backend.publish('{"user_id": "1"}', pipe='private'))
+
+            # clients which have disconnected are not registered again
+            backend.unregister_client('1')
+            backend._disconnect()
+            backend._connect()
+            self.assertEqual(backend.client.smembers(key), set())
+        finally:
+            backend.close()
+            io_loop.close()
+            for fd in backend.client.fds:
+                os.close(fd)
+
+    def test_subscription_index(self):
+        index = SubscriptionIndex(cell_size=1, max_bbox_cells=4)
+        index.subscribe('layer-client', layers=['rome'])
+        index.subscribe('node-client', nodes=['fusolab'])
+        index.subscribe('bbox-client', bbox=[12.3, 41.7, 12.7, 42.0])
+        index.subscribe('wide-client', bbox=[-180, -90, 180, 90])
+
+        self.assertEqual(index.match(layer='rome', node='other', point=(0, 0)), set(['layer-client', 'wide-client']))
+        self.assertEqual(index.match(node='fusolab'), set(['node-client']))
+        self.assertEqual(index.match(point=(12.5, 41.9)), set(['bbox-client', 'wide-client']))
+        self.assertEqual(index.match(point=(12.8, 41.9)), set(['wide-client']))
+
+        # bbox is replaced by the new one
+        index.subscribe('bbox-client', bbox=[9.1, 45.4, 9.2, 45.5])
+        self.assertEqual(index.match(point=(12.5, 41.9)), set(['wide-client']))
+        self.assertEqual(index.match(point=(9.15, 45.45)), set(['bbox-client', 'wide-client']))
+
+        for client in ['layer-client', 'node-client', 'bbox-client', 'wide-client']:
+            self.assertIn(client, index)
+            index.unsubscribe(client)
+        self.assertEqual(index.match(layer='rome', node='fusolab', point=(9.15, 45.45)), set())
+        # index is empty
+        self.assertEqual(index.topics, {})
+        self.assertEqual(index.grid, {})
+
+        with self.assertRaises(ValueError):
+            index.subscribe('client', bbox=[12.7, 41.7, 12.3, 42.0])
+        # non finite coordinates
+        for value in ['Infinity', '-Infinity', 'NaN', 1e400]:
+            with self.assertRaises(ValueError):
+                index.subscribe('client', bbox=[12.3, 41.7, value, 42.0])
+        # huge coordinates are limited to the world
+        index.subscribe('client', bbox=[1e300, 1e300, 1e301, 1e301])
+        index.unsubscribe('client')
+
+        # invalid subscriptions are reported to the client
+        client = WebSocketHandler.__new__(WebSocketHandler)
+        messages = []
+        client.send_message = messages.append
+        client.handle_action('{"action": "subscribe", "bbox": [12.3, 41.7, 1e400, 42.0]}')
+        self.assertIn('invalid message', messages[0])
+        client.subscriptions.unsubscribe(client)
+
+    def test_event_buffer(self):
+        node = Node.objects.all()[0]
+        added = node_event(node, 'node.added')
+        self.assertEqual(added['slug'], node.slug)
+        self.assertEqual(added['layer'], node.layer.slug)
+        self.assertEqual(added['geometry']['type'], node.geometry.geom_type)
+        self.assertNotIn('geometry', node_event(node, 'node.status_changed'))
+
+        buffer = EventBuffer()
+        # added + changed = added
+        buffer.add(added)
+        buffer.add(dict(added, type='node.changed', name='changed'))
+        events = buffer.pop_all()
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['type'], 'node.added')
+        self.assertEqual(events[0]['name'], 'changed')
+        self.assertEqual(len(buffer), 0)
+
+        # added + deleted = nothing
+        buffer.add(added)
+        buffer.add({ 'type': 'node.deleted', 'slug': node.slug })
+        self.assertEqual(buffer.pop_all(), [])
+
+        # status changed twice, the first old status is kept
+        buffer.add({ 'type': 'node.status_changed', 'slug': 'a', 'status': 'active', 'old_status': 'potential' })
+        buffer.add({ 'type': 'node.status_changed', 'slug': 'a', 'status': 'planned', 'old_status': 'active' })
+        buffer.add({ 'type': 'node.deleted', 'slug': 'b' })
+        events = buffer.pop_all()
+        self.assertEqual(events[0]['status'], 'planned')
+        self.assertEqual(events[0]['old_status'], 'potential')
+        self.assertEqual(events[1]['type'], 'node.deleted')
+
+    def test_batched_node_events_queries(self):
+        nodes = list(Node.objects.all())
+        expected = [node_event(node, 'node.changed') for node in nodes]
+        nodes = list(Node.objects.all())
+        start_batching()
+        try:
+            with CaptureQueriesContext(connection) as context:
+                events = [node_event(node, 'node.changed') for node in nodes]
+        finally:
+            stop_batching()
+        # layers and statuses are loaded once, not once per node
+        self.assertGreater(len(nodes), 2)
+        self.assertLessEqual(len(context.captured_queries), 2)
+        self.assertEqual(events, expected)
+
+    def test_node_events_bus_errors(self):
+        original_backend = backends._backend
+        backends._backend = BrokenBackend()
+        try:
+            # errors of the message bus do not make changes of nodes fail
+            node = Node.objects.all()[0]
+            node.name = 'bus not available'
+            node.save()
+            node.delete()
+        finally:
+            backends._backend = original_backend
+        self.assertFalse(Node.objects.filter(name='bus not available').exists())
+
+    def test_split_events(self):
+        max_size = UnixSocketBackend.MAX_MESSAGE_SIZE
+        geometry = { 'type': 'LineString', 'coordinates': [[12.5 + i / 1000.0, 41.9] for i in range(20)] }
+        events = [{ 'type': 'node.added', 'slug': 'node-%d' % i, 'geometry': geometry } for i in range(500)]
+        self.assertGreater(len(json.dumps(events)), max_size)
+
+        messages = split_events(events, max_size)
+        self.assertGreater(len(messages), 1)
+        for message in messages:
+            self.assertLessEqual(len(message), max_size)
+        # all the events, in the same order
+        self.assertEqual([event for message in messages for event in json.loads(message)], events)
+
+        # geometry which doesn't fit in a message is omitted
+        huge = { 'type': 'node.added', 'slug': 'huge',
+                 'geometry': { 'type': 'LineString', 'coordinates': [[12.5, 41.9]] * 10000 } }
+        messages = split_events([events[0], huge], max_size)
+        self.assertEqual(json.loads(messages[-1])[-1], { 'type': 'node.added', 'slug': 'huge' })
+        self.assertEqual(split_events(events[0:2]), [json.dumps(events[0:2])])
+
+        # oversized messages are not sent
+        path = os.path.join(tempfile.mkdtemp(), 'websockets.sock')
+        with self.assertRaises(MessageTooLarge):
+            UnixSocketBackend(path).publish(json.dumps(events), pipe='events')
+
+    def test_slow_client_queue(self):
+        # handler which is not bound to any connection
+        client = WebSocketHandler.__new__(WebSocketHandler)
+        futures = []
+        def write_message(message):
+            future = Future()
+            futures.append((message, future))
+            return future
+        client.write_message = write_message
+        client.close = lambda: None
+        client.add_client()
+        dropped = WebSocketHandler.stats['dropped']
+
+        try:
+            self.assertIn(client, WebSocketHandler.clients)
+            # first message is written, the others wait for it to be flushed
+            for i in range(handlers.CLIENT_QUEUE_SIZE + 6):
+                client.send_message(str(i))
+            self.assertEqual(len(futures), 1)
+            self.assertEqual(len(client.queue), handlers.CLIENT_QUEUE_SIZE)
+            # oldest messages have been dropped
+            self.assertEqual(WebSocketHandler.stats['dropped'] - dropped, 5)
+            self.assertEqual(client.queue[0], '6')
+            # next message is written when the previous one is flushed
+            futures[0][1].set_result(None)
+            self.assertEqual(len(futures), 2)
+            self.assertEqual(futures[1][0], '6')
+
+            # disconnect policy
+            handlers.SLOW_CLIENT_POLICY = 'disconnect'
+            client.send_message('a')
+            client.send_message('b')
+            self.assertTrue(client.closed)
+            self.assertEqual(len(client.queue), 0)
+        finally:
+            handlers.SLOW_CLIENT_POLICY = 'drop'
+            client.remove_client()
+
+        self.assertNotIn(client, WebSocketHandler.clients)
+
+    def test_metrics(self):
+        counter = RateCounter(window=2)
+        counter.increment(now=100.1)
+        counter.increment(2, now=100.5)
+        counter.increment(now=101.2)
+        self.assertEqual(counter.total, 4)
+        # current second is excluded
+        self.assertEqual(counter.rate(now=101.5), 1.5)
+        self.assertEqual(counter.rate(now=102), 2.0)
+        # old seconds expire
+        self.assertEqual(counter.rate(now=104), 0.0)
+        self.assertEqual(counter.as_dict(now=104)['total'], 4)
+
+        histogram = Histogram(buckets=(0.01, 0.1))
+        histogram.observe(0.005)
+        histogram.observe(0.05)
+        histogram.observe(2)
+        data = histogram.as_dict()
+        self.assertEqual(data['buckets'], { '0.01': 1, '0.1': 2, '+Inf': 3 })
+        self.assertEqual(data['max'], 2)
+
+        client = WebSocketHandler.__new__(WebSocketHandler)
+        client.write_message = lambda message: Future()
+        client.add_client()
+        try:
+            for i in range(3):
+                client.send_message(str(i))
+            metrics = Metrics()
+            metrics.observe_fanout('public', 0)
+            data = metrics.as_dict(WebSocketHandler)
+            self.assertEqual(data['clients']['public'], 1)
+            self.assertEqual(data['clients']['total'], 1)
+            self.assertEqual(data['queues']['total'], 2)
+            self.assertEqual(data['queues']['writing'], 1)
+            self.assertEqual(data['fanout']['public']['count'], 1)
+        finally:
+            client.remove_client()
@@ -3,7 +3,7 @@ from django.contrib import admin
 from nodeshot.core.layers.admin import  LayerAdmin
 from nodeshot.core.nodes.admin import NodeAdmin
 
-from .models import LayerExternal, NodeExternal
+from .models import LayerExternal, NodeExternal, SyncRun
 from .settings import settings
 
 
@@ -27,3 +27,21 @@ class NodeExternalInline(admin.StackedInline):
     extra = 0
 
 NodeAdmin.inlines.append(NodeExternalInline)
+
+
+class SyncRunAdmin(admin.ModelAdmin):
+    list_display = ('layer', 'synchronizer', 'status', 'started', 'retrieve_time',
+                    'parse_time', 'save_time', 'total_time', 'processed', 'query_count')
+    list_filter = ('status', 'layer', 'synchronizer')
+    list_select_related = True
+    date_hierarchy = 'started'
+    ordering = ('-started',)
+
+    def get_readonly_fields(self, request, obj=None):
+        """ sync runs are recorded by synchronizers, they're not meant to be edited """
+        return [field.name for field in self.model._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+admin.site.register(SyncRun, SyncRunAdmin)
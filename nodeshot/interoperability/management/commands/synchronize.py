@@ -1,8 +1,14 @@
+import time
+from Queue import Empty
+from multiprocessing import Process, Queue
+
 from django.core.management.base import BaseCommand, CommandError
 from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist
+from django.db import connection
 from django.db.models import Q
 
 from nodeshot.core.layers.models import Layer
+from nodeshot.interoperability.utils import SlugIndex, SlugIndexManager, LayerLock
 
 from importlib import import_module
 from optparse import make_option
@@ -23,6 +29,23 @@ class Command(BaseCommand):
                  e.g. --exclude=layer1-slug,layer2-slug,layer3-slug\n\
                  (works only if no layer has been specified)'
         ),
+        make_option(
+            '--workers',
+            action='store',
+            dest='workers',
+            type='int',
+            default=1,
+            help='Number of layers synchronized concurrently, each one in its own process (default: 1)'
+        ),
+        make_option(
+            '--timeout',
+            action='store',
+            dest='timeout',
+            type='int',
+            default=0,
+            help='Maximum number of seconds a layer can take to synchronize\n\
+                 (works only with --workers greater than 1, 0 means no timeout)'
+        ),
     )
 
     def retrieve_layers(self, *args, **options):
@@ -81,6 +104,8 @@ class Command(BaseCommand):
         """ execute synchronize command """
         # store verbosity level in instance attribute for later use
         self.verbosity = int(options.get('verbosity'))
+        workers = int(options.get('workers') or 1)
+        timeout = int(options.get('timeout') or 0)
         
         # blank line
         self.stdout.write('\r\n')
@@ -94,42 +119,164 @@ class Command(BaseCommand):
         else:
             self.verbose('going to process %d layers...' % len(layers))
         
-        # loop over
-        for layer in layers:
-            # retrieve interop class if available
-            try:
-                interop = layer.external.interoperability
-            except (ObjectDoesNotExist, AttributeError):
-                self.stdout.write('External Layer %s does not have an interoperability class specified\n\r' % layer.name)
-                continue
-            
-            # if no interop jump to next layer
-            if interop == 'None':
-                self.stdout.write('External Layer %s does not have an interoperability class specified\n\r' % layer.name)
-                continue
+        if workers > 1:
+            self.process_concurrently(list(layers), workers, timeout)
+        else:
+            # slug index shared by all the layers processed during this run
+            slug_index = SlugIndex()
             
-            if layer.external.config is None:
-                self.stdout.write('Layer %s does not have a config yet\n\r' % layer.name)
-                continue
+            # loop over
+            for layer in layers:
+                self.synchronize_layer(layer, slug_index, self.stdout.write)
+        
+        self.stdout.write('\r\n')
+    
+    def synchronize_layer(self, layer, slug_index, write):
+        """
+        synchronize one layer, returns one of the following statuses:
+        "success", "skipped", "locked", "error"
+        
+        :param write: function used to write output
+        """
+        # retrieve interop class if available
+        try:
+            interop = layer.external.interoperability
+        except (ObjectDoesNotExist, AttributeError):
+            write('External Layer %s does not have an interoperability class specified\n\r' % layer.name)
+            return 'skipped'
+        
+        # if no interop jump to next layer
+        if interop == 'None':
+            write('External Layer %s does not have an interoperability class specified\n\r' % layer.name)
+            return 'skipped'
+        
+        if layer.external.config is None:
+            write('Layer %s does not have a config yet\n\r' % layer.name)
+            return 'skipped'
+        
+        # else go ahead and import module
+        interop_module = import_module(interop)
+        # retrieve class name (split and get last piece)
+        class_name = interop.split('.')[-1]
+        # retrieve class
+        interop_class = getattr(interop_module, class_name)
+        write('imported module %s\r\n' % interop_module.__file__)
+        
+        # ensure layer is not being synchronized by someone else
+        lock = LayerLock(layer.id)
+        if not lock.acquire():
+            write('Layer "%s" is already being synchronized, skipping\r\n' % layer.slug)
+            return 'locked'
+        
+        # try running
+        try:
+            instance = interop_class(layer, verbosity=self.verbosity, slug_index=slug_index)
+            write('Processing layer "%s"\r\n' % layer.slug)
+            messages = instance.process()
+        except ImproperlyConfigured, e:
+            write('Validation error: %s\r\n' % e)
+            return 'error'
+        finally:
+            lock.release()
+        
+        for message in messages:
+            write('%s\n\r' % message)
+        
+        return 'success'
+    
+    def process_concurrently(self, layers, workers, timeout):
+        """
+        synchronize layers concurrently, each one in its own process:
+            * at most "workers" layers are processed at the same time
+            * failures are isolated: an exception or a crash affects only its layer
+            * layers which take longer than "timeout" seconds are terminated
+            * output of each layer is written when the layer is complete,
+              followed by a summary of the run
+            * slugs are reserved in one index shared by all the processes
+        """
+        owners = SlugIndex.load_owners()
+        # child processes must not share the DB connection of the parent
+        connection.close()
+        
+        manager = SlugIndexManager()
+        manager.start()
+        try:
+            self._process_concurrently(layers, workers, timeout, manager.SlugIndex(owners))
+        finally:
+            manager.shutdown()
+    
+    def _process_concurrently(self, layers, workers, timeout, slug_index):
+        """ see process_concurrently """
+        results = Queue()
+        pending = list(layers)
+        # layer slug -> (process, start time)
+        running = {}
+        # layer slug -> status
+        statuses = {}
+        
+        while pending or running:
+            # start new processes if there are free workers
+            while pending and len(running) < workers:
+                layer = pending.pop(0)
+                process = Process(target=synchronize_layer_process, args=(self, layer, slug_index, results))
+                process.start()
+                running[layer.slug] = (process, time.time())
             
-            # else go ahead and import module
-            interop_module = import_module(interop)
-            # retrieve class name (split and get last piece)
-            class_name = interop.split('.')[-1]
-            # retrieve class
-            interop_class = getattr(interop_module, class_name)
-            self.stdout.write('imported module %s\r\n' % interop_module.__file__)
+            # collect output of completed layers
+            self._collect_results(results, statuses, timeout=0.5)
             
-            # try running
-            try:
-                instance = interop_class(layer, verbosity=self.verbosity)
-                self.stdout.write('Processing layer "%s"\r\n' % layer.slug)
-                messages = instance.process()
-            except ImproperlyConfigured, e:
-                self.stdout.write('Validation error: %s\r\n' % e)
-                continue
+            for slug, (process, started) in running.items():
+                if slug in statuses:
+                    process.join()
+                    del running[slug]
+                elif not process.is_alive():
+                    # give a last chance to the output to come through
+                    self._collect_results(results, statuses, timeout=1)
+                    if slug not in statuses:
+                        statuses[slug] = 'error'
+                        self.stdout.write('Layer "%s" exited unexpectedly with code %s\r\n' % (slug, process.exitcode))
+                    del running[slug]
+                elif timeout and time.time() - started > timeout:
+                    process.terminate()
+                    process.join()
+                    statuses[slug] = 'timeout'
+                    self.stdout.write('Layer "%s" timed out after %d seconds\r\n' % (slug, timeout))
+                    del running[slug]
         
-            for message in messages:
-                self.stdout.write('%s\n\r' % message)
+        summary = dict((status, 0) for status in ['success', 'error', 'timeout', 'locked', 'skipped'])
+        for status in statuses.values():
+            summary[status] += 1
         
-        self.stdout.write('\r\n')
+        self.stdout.write('%d layers processed: %d succeeded, %d failed, %d timed out, %d locked, %d skipped\r\n' % (
+            len(statuses),
+            summary['success'],
+            summary['error'],
+            summary['timeout'],
+            summary['locked'],
+            summary['skipped']
+        ))
+    
+    def _collect_results(self, results, statuses, timeout):
+        """ write output of the layers which are complete """
+        try:
+            slug, status, output = results.get(timeout=timeout)
+            while True:
+                statuses[slug] = status
+                self.stdout.write(output)
+                slug, status, output = results.get_nowait()
+        except Empty:
+            pass
+
+
+def synchronize_layer_process(command, layer, slug_index, results):
+    """ target of the processes started by Command.process_concurrently """
+    output = []
+    
+    try:
+        status = command.synchronize_layer(layer, slug_index, output.append)
+    except Exception as e:
+        status = 'error'
+        output.append('Error while processing layer "%s": %s\r\n' % (layer.slug, e))
+    
+    results.put((layer.slug, status, ''.join(output)))
+    connection.close()
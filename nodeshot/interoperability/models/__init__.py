@@ -11,9 +11,13 @@ check_dependencies(
 
 from .layer_external import LayerExternal
 from .node_external import NodeExternal
+from .fetch_cache import FetchCache
+from .sync_run import SyncRun
+from .node_sync_hash import NodeSyncHash
+from .push_operation import PushOperation
 
 
-__all__ = ['LayerExternal', 'NodeExternal']
+__all__ = ['LayerExternal', 'NodeExternal', 'FetchCache', 'SyncRun', 'NodeSyncHash', 'PushOperation']
 
 
 # ------ patch LayerNodesList view to support external layers ------ #
@@ -0,0 +1,30 @@
+from django.db import models
+from django.utils.translation import ugettext_lazy as _
+
+from .layer_external import LayerExternal
+
+
+class FetchCache(models.Model):
+    """
+    Stores validators of the last response fetched for an External Layer,
+    used by HttpRetrieverMixin to perform conditional HTTP requests
+    """
+    layer_external = models.OneToOneField(LayerExternal, verbose_name=_('external layer'), related_name='fetch_cache')
+    url = models.TextField(_('url'), blank=True)
+    etag = models.CharField(_('ETag'), max_length=255, blank=True)
+    last_modified = models.CharField(_('Last-Modified'), max_length=64, blank=True)
+    content_hash = models.CharField(_('content hash'), max_length=40, blank=True,
+                                    help_text=_('SHA1 hash of the response body'))
+    config_hash = models.CharField(_('configuration hash'), max_length=40, blank=True,
+                                   help_text=_('SHA1 hash of the configuration of the external layer, '
+                                               'cached validators are used only if the configuration did not change'))
+    updated = models.DateTimeField(_('updated on'), auto_now=True)
+
+    class Meta:
+        app_label = 'interoperability'
+        db_table = 'layers_external_fetch_cache'
+        verbose_name = _('fetch cache')
+        verbose_name_plural = _('fetch cache')
+
+    def __unicode__(self):
+        return 'fetch cache of %s' % self.layer_external.layer.name
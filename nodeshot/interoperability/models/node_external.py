@@ -45,7 +45,8 @@ class NodeExternal(models.Model):
 from django.dispatch import receiver
 from django.db.models.signals import pre_delete, post_save
 
-from ..tasks import push_changes_to_external_layers
+from .push_operation import PushOperation
+from ..tasks import schedule_push_flush
 
 
 @receiver(post_save, sender=Node)
@@ -58,7 +59,8 @@ def save_external_nodes(sender, **kwargs):
     if node.layer.is_external is False or not hasattr(node.layer, 'external') or node.layer.external.interoperability is None:
         return False
     
-    push_changes_to_external_layers.delay(node=node, external_layer=node.layer.external, operation=operation)
+    if PushOperation.enqueue(node, operation) is not None:
+        schedule_push_flush(node.layer.external.pk)
 
 
 @receiver(pre_delete, sender=Node)
@@ -70,6 +72,8 @@ def delete_external_nodes(sender, **kwargs):
     if node.layer.is_external is False or not hasattr(node.layer, 'external') or node.layer.external.interoperability is None:
         return False
     
-    if hasattr(node, 'external') and node.external.external_id:
-        # TODO: uniform here
-        push_changes_to_external_layers.delay(node=node.external.external_id, external_layer=node.layer.external, operation='delete')
+    external_id = node.external.external_id if hasattr(node, 'external') else ''
+
+    # pending operations of nodes which have never been pushed are just discarded
+    if PushOperation.enqueue(node, 'delete', external_id=external_id) is not None:
+        schedule_push_flush(node.layer.external.pk)
@@ -0,0 +1,29 @@
+from django.db import models
+from django.utils.translation import ugettext_lazy as _
+
+from nodeshot.core.nodes.models import Node
+
+
+class NodeSyncHash(models.Model):
+    """
+    Fingerprints of the external record from which a node has been synchronized,
+    used by GenericGisSynchronizer to skip unchanged records without loading
+    the node and without performing GEOS comparisons
+    """
+    node = models.OneToOneField(Node, verbose_name=_('node'), related_name='sync_hash')
+    geometry_hash = models.CharField(_('geometry hash'), max_length=40,
+                                     help_text=_('SHA1 hash of the geometry coordinates rounded at a fixed precision'))
+    record_hash = models.CharField(_('record hash'), max_length=40,
+                                   help_text=_('SHA1 hash of the whole mapped record, geometry hash included'))
+    node_updated = models.DateTimeField(_('node updated on'), null=True,
+                                        help_text=_('value of node.updated when the hashes have been stored, '
+                                                    'if the node has been edited since then the hashes are ignored'))
+
+    class Meta:
+        app_label = 'interoperability'
+        db_table = 'nodes_sync_hash'
+        verbose_name = _('node sync hash')
+        verbose_name_plural = _('node sync hashes')
+
+    def __unicode__(self):
+        return 'sync hash of %s' % self.node.name
@@ -0,0 +1,142 @@
+from datetime import timedelta
+
+from django.db import models, transaction, IntegrityError
+from django.utils.translation import ugettext_lazy as _
+
+from nodeshot.core.base.utils import choicify, now
+
+from .layer_external import LayerExternal
+
+
+PUSH_OPERATIONS = {
+    'add': 'add',
+    'change': 'change',
+    'delete': 'delete',
+}
+
+
+class PushOperation(models.Model):
+    """
+    Pending outbound operation (add, change or delete of a node) which has
+    to be pushed to an external layer; there's at most one pending operation
+    per node, subsequent operations on the same node are coalesced (see "enqueue").
+    """
+    layer_external = models.ForeignKey(LayerExternal, verbose_name=_('external layer'), related_name='push_queue')
+    # not a foreign key because delete operations outlive their node
+    node_id = models.IntegerField(_('node id'))
+    operation = models.CharField(_('operation'), max_length=6, choices=choicify(PUSH_OPERATIONS))
+    external_id = models.CharField(_('external id'), max_length=255, blank=True,
+                                   help_text=_('ID of the node on the external layer, used by delete operations'))
+    attempts = models.PositiveSmallIntegerField(_('failed attempts'), default=0)
+    next_attempt = models.DateTimeField(_('next attempt'), default=now, db_index=True)
+    # incremented each time the operation is coalesced with a new one
+    version = models.PositiveIntegerField(_('version'), default=0)
+    # True while the operation is being pushed, see "complete"
+    pushing = models.BooleanField(_('being pushed'), default=False)
+    added = models.DateTimeField(_('added on'), auto_now_add=True)
+
+    class Meta:
+        app_label = 'interoperability'
+        db_table = 'layers_external_push_queue'
+        unique_together = ('layer_external', 'node_id')
+        ordering = ['id']
+        verbose_name = _('push operation')
+        verbose_name_plural = _('push queue')
+
+    def __unicode__(self):
+        return '%s of node %s' % (self.operation, self.node_id)
+
+    @staticmethod
+    def coalesce(pending, operation):
+        """
+        returns the operation which results from performing "operation"
+        when "pending" is still waiting in the queue, None means nothing to do
+        """
+        if pending == 'add':
+            # the node has never been pushed
+            return None if operation == 'delete' else 'add'
+        return operation
+
+    @classmethod
+    def enqueue(cls, node, operation, external_id=''):
+        """
+        adds an operation to the queue of the external layer of the node
+        and coalesces it with the pending operation of the same node, if any;
+        returns the pending PushOperation or None if nothing has to be pushed
+        """
+        layer_external = node.layer.external
+
+        try:
+            return cls._enqueue(layer_external, node.pk, operation, external_id)
+        # another process enqueued the first operation of the same node in the meanwhile
+        except IntegrityError:
+            return cls._enqueue(layer_external, node.pk, operation, external_id)
+
+    @classmethod
+    def _enqueue(cls, layer_external, node_id, operation, external_id):
+        with transaction.atomic():
+            try:
+                pending = cls.objects.select_for_update().get(layer_external=layer_external, node_id=node_id)
+            except cls.DoesNotExist:
+                pending = None
+
+            # the operation which is being pushed is assumed to succeed,
+            # the outcome of the push is taken into account by "complete"
+            pushing = pending is not None and pending.pushing
+            operation = cls.coalesce(pending.operation if pending and not pushing else None, operation)
+
+            # nodes which have no external id can't be deleted from the external layer
+            # (unless they are being added right now, see "flush_push_queue")
+            if operation == 'delete' and not external_id and not pushing:
+                operation = None
+
+            if operation is None:
+                if pending is not None:
+                    pending.delete()
+                return None
+
+            if pending is None:
+                pending = cls(layer_external=layer_external, node_id=node_id)
+
+            pending.operation = operation
+            pending.external_id = external_id
+            pending.attempts = 0
+            pending.next_attempt = now()
+            pending.version += 1
+            pending.save()
+
+        return pending
+
+    def complete(self, pushed, retry_delay=None):
+        """
+        removes the operation from the queue once it has been pushed (or dropped)
+        or, if retry_delay is specified, postpones it of retry_delay seconds;
+        operations enqueued on the same node while this one was being pushed
+        are kept and rebased on the outcome of the push
+
+        :param pushed: whether the push succeeded
+        :param retry_delay: seconds to wait before the next attempt, None to dequeue
+        """
+        with transaction.atomic():
+            try:
+                pending = self.__class__.objects.select_for_update().get(pk=self.pk)
+            # coalesced with an operation which leaves nothing to do
+            except self.__class__.DoesNotExist:
+                return
+
+            # changed while being pushed
+            if pending.version != self.version:
+                if not pushed:
+                    pending.operation = self.coalesce(self.operation, pending.operation)
+                if pending.operation is None:
+                    pending.delete()
+                else:
+                    pending.pushing = False
+                    pending.save()
+            elif retry_delay is None:
+                pending.delete()
+            else:
+                pending.attempts += 1
+                pending.next_attempt = now() + timedelta(seconds=retry_delay)
+                pending.pushing = False
+                pending.save()
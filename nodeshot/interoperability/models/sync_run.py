@@ -0,0 +1,53 @@
+from django.db import models
+from django.utils.translation import ugettext_lazy as _
+
+from nodeshot.core.base.utils import choicify
+
+
+SYNC_RUN_STATUS = {
+    'success': 'success',
+    'not modified': 'not_modified',
+    'error': 'error',
+}
+
+
+class SyncRun(models.Model):
+    """
+    Stores statistics of each synchronization of an external layer
+    (wall time of each phase, downloaded bytes, item counts, queries, memory)
+    in order to spot slow phases and performance regressions over time
+    """
+    layer = models.ForeignKey('layers.Layer', verbose_name=_('layer'), related_name='sync_runs')
+    synchronizer = models.CharField(_('synchronizer'), max_length=128)
+    status = models.CharField(_('status'), max_length=16, choices=choicify(SYNC_RUN_STATUS), default='success')
+    started = models.DateTimeField(_('started on'), db_index=True)
+    # wall time in seconds
+    retrieve_time = models.FloatField(_('retrieve time'), null=True, blank=True)
+    parse_time = models.FloatField(_('parse time'), null=True, blank=True,
+                                   help_text=_('in streaming mode parsing happens while saving'))
+    save_time = models.FloatField(_('save time'), null=True, blank=True)
+    total_time = models.FloatField(_('total time'), null=True, blank=True)
+    bytes_downloaded = models.BigIntegerField(_('bytes downloaded'), null=True, blank=True)
+    # item counts, available only for synchronizers which report them
+    processed = models.IntegerField(_('processed items'), null=True, blank=True)
+    added = models.IntegerField(_('added nodes'), null=True, blank=True)
+    changed = models.IntegerField(_('changed nodes'), null=True, blank=True)
+    deleted = models.IntegerField(_('deleted nodes'), null=True, blank=True)
+    unmodified = models.IntegerField(_('unmodified nodes'), null=True, blank=True)
+    query_count = models.IntegerField(_('query count'), null=True, blank=True)
+    # ru_maxrss is the peak since the process started, not the peak of the synchronization
+    process_peak_memory = models.IntegerField(_('process peak memory (KB)'), null=True, blank=True,
+                                              help_text=_('peak resident memory reached by the process which performed '
+                                                          'the synchronization since it started, including previous '
+                                                          'synchronizations performed by the same process'))
+    message = models.TextField(_('message'), blank=True)
+
+    class Meta:
+        app_label = 'interoperability'
+        db_table = 'layers_external_sync_run'
+        ordering = ['-started']
+        verbose_name = _('sync run')
+        verbose_name_plural = _('sync runs')
+
+    def __unicode__(self):
+        return '%s sync run of %s' % (self.layer.name, self.started)
@@ -0,0 +1,28 @@
+from rest_framework import serializers, pagination
+
+from .models import SyncRun
+
+
+__all__ = [
+    'SyncRunSerializer',
+    'PaginatedSyncRunSerializer'
+]
+
+
+class SyncRunSerializer(serializers.ModelSerializer):
+    """ synchronization run serializer """
+    layer = serializers.SlugRelatedField(slug_field='slug', read_only=True)
+
+    class Meta:
+        model = SyncRun
+        fields = (
+            'id', 'layer', 'synchronizer', 'status', 'started',
+            'retrieve_time', 'parse_time', 'save_time', 'total_time',
+            'bytes_downloaded', 'processed', 'added', 'changed',
+            'deleted', 'unmodified', 'query_count', 'process_peak_memory', 'message'
+        )
+
+
+class PaginatedSyncRunSerializer(pagination.PaginationSerializer):
+    class Meta:
+        object_serializer_class = SyncRunSerializer
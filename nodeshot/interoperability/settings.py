@@ -20,3 +20,19 @@ SYNCHRONIZERS = DEFAULT_SYNCHRONIZERS + getattr(settings, 'NODESHOT_SYNCHRONIZER
 
 CITYSDK_TOURISM_TEST_CONFIG = getattr(settings, 'NODESHOT_CITYSDK_TOURISM_TEST_CONFIG', False)
 CITYSDK_MOBILITY_TEST_CONFIG = getattr(settings, 'NODESHOT_CITYSDK_MOBILITY_TEST_CONFIG', False)
+# maximum number of nodes inserted per query by the "bulk_save" sync mode
+BULK_BATCH_SIZE = getattr(settings, 'NODESHOT_INTEROPERABILITY_BULK_BATCH_SIZE', 500)
+# number of external items which are parsed and converted at a time during synchronization
+CHUNK_SIZE = getattr(settings, 'NODESHOT_INTEROPERABILITY_CHUNK_SIZE', 1000)
+# number of bytes read at a time from the external source in streaming mode
+STREAMING_CHUNK_SIZE = getattr(settings, 'NODESHOT_INTEROPERABILITY_STREAMING_CHUNK_SIZE', 65536)
+# decimal places of the coordinates taken into account by geometry hashes (7 is roughly 1 cm)
+GEOMETRY_HASH_PRECISION = getattr(settings, 'NODESHOT_INTEROPERABILITY_GEOMETRY_HASH_PRECISION', 7)
+# seconds to wait before pushing local changes to external layers, changes happening in the meanwhile are coalesced
+PUSH_DELAY = getattr(settings, 'NODESHOT_INTEROPERABILITY_PUSH_DELAY', 2)
+# maximum number of operations pushed to an external layer at a time
+PUSH_BATCH_SIZE = getattr(settings, 'NODESHOT_INTEROPERABILITY_PUSH_BATCH_SIZE', 50)
+# failed push operations are retried with exponential backoff (PUSH_RETRY_DELAY * 2^attempts seconds)
+# and dropped after PUSH_MAX_ATTEMPTS failures
+PUSH_RETRY_DELAY = getattr(settings, 'NODESHOT_INTEROPERABILITY_PUSH_RETRY_DELAY', 30)
+PUSH_MAX_ATTEMPTS = getattr(settings, 'NODESHOT_INTEROPERABILITY_PUSH_MAX_ATTEMPTS', 5)
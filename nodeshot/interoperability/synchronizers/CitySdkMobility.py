@@ -27,6 +27,9 @@ class CitySdkMobilityMixin(object):
         'citysdk_password',
     ]
 
+    # session token shared by the operations of a batch (see "push")
+    session = None
+
     def __init__(self, *args, **kwargs):
         super(CitySdkMobilityMixin, self).__init__(*args, **kwargs)
         self._init_config()
@@ -86,6 +89,24 @@ class CitySdkMobilityMixin(object):
 
         return session
 
+    def push(self, operations):
+        """ authenticate once for the whole batch of operations """
+        self.session = self.get_session()
+        try:
+            return super(CitySdkMobilityMixin, self).push(operations)
+        finally:
+            self.release_session(self.session)
+            self.session = None
+
+    def _acquire_session(self):
+        """ returns the session token of the current batch or a new one """
+        return self.session or self.get_session()
+
+    def _release_session(self, session):
+        """ releases the session token unless it belongs to the current batch """
+        if session != self.session:
+            self.release_session(session)
+
     def release_session(self, session):
         release_url = '%srelease_session' % self.citysdk_url
         response = requests.get(
@@ -135,7 +156,7 @@ class CitySdkMobilityMixin(object):
 
     def add(self, node, authenticate=True):
         """ Add a new record into CitySDK db """
-        session = self.get_session()
+        session = self._acquire_session()
 
         citysdk_record = self.convert_format(node)
         citysdk_api_url = '%snodes/%s' % (self.citysdk_url, self.config['citysdk_layer'])
@@ -148,7 +169,7 @@ class CitySdkMobilityMixin(object):
             headers={ 'Content-type': 'application/json', 'X-Auth': session }
         )
 
-        self.release_session(session)
+        self._release_session(session)
 
         if response.status_code != 200:
             message = 'ERROR while creating "%s". Response: %s' % (node.name, response.content)
@@ -177,7 +198,7 @@ class CitySdkMobilityMixin(object):
 
     def change(self, node, authenticate=True):
         """ Add a new record into CitySDK db """
-        session = self.get_session()
+        session = self._acquire_session()
 
         citysdk_record = self.convert_format(node, create_type='update')
         citysdk_api_url = '%snodes/%s' % (self.citysdk_url, self.config['citysdk_layer'])
@@ -190,7 +211,7 @@ class CitySdkMobilityMixin(object):
             headers={ 'Content-type': 'application/json', 'X-Auth': session }
         )
 
-        self.release_session(session)
+        self._release_session(session)
 
         if response.status_code != 200:
             message = 'ERROR while updating record "%s" through CitySDK API\n%s' % (node.name, response.content)
@@ -211,7 +232,7 @@ class CitySdkMobilityMixin(object):
 
     def delete(self, external_id, authenticate=True):
         """ Delete record from CitySDK db """
-        session = self.get_session()
+        session = self._acquire_session()
 
         citysdk_api_url = '%s%s/%s' % (
             self.citysdk_url,
@@ -226,7 +247,7 @@ class CitySdkMobilityMixin(object):
             headers={ 'Content-type': 'application/json', 'X-Auth': session }
         )
 
-        self.release_session(session)
+        self._release_session(session)
 
         if response.status_code != 200:
             message = 'Failed to delete a record through the CitySDK HTTP API'
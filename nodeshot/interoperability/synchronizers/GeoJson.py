@@ -1,6 +1,7 @@
 import simplejson as json
 from django.contrib.gis.geos import GEOSGeometry
 from .base import GenericGisSynchronizer
+from ..utils import iter_geojson_features
 
 
 class GeoJson(GenericGisSynchronizer):
@@ -8,6 +9,11 @@ class GeoJson(GenericGisSynchronizer):
     
     def parse(self):
         """ parse geojson and ensure is collection """
+        # streaming mode: features are yielded one at a time while the response is read
+        if self.config.get('streaming', False):
+            self.parsed_data = iter_geojson_features(self.iter_response())
+            return
+        
         try:
             self.parsed_data = json.loads(self.data)
         except Exception as e:
@@ -8,7 +8,8 @@ class GeoRss(XMLParserMixin, GenericGisSynchronizer):
     def key_mapping(self, ):
         key_map = self.config.get('map', {})
         
-        if 'summary' in self.data:
+        # in streaming mode data is not available in advance
+        if self.data is not None and 'summary' in self.data:
             description_default_key = 'summary'
         else:
             description_default_key = 'description'
@@ -31,6 +32,10 @@ class GeoRss(XMLParserMixin, GenericGisSynchronizer):
         """ parse data """
         super(GeoRss, self).parse()
         
+        # iterparse backend already yields RSS items and ATOM entries
+        if self.use_iterparse:
+            return
+        
         # support RSS and ATOM
         tag_name = 'item' if '<item>' in self.data else 'entry'
         
@@ -8,6 +8,8 @@ class OpenWisp(XMLParserMixin, GenericGisSynchronizer):
     def parse(self):
         """ parse data """
         super(OpenWisp, self).parse()
+        if self.use_iterparse:
+            return
         self.parsed_data = self.parsed_data.getElementsByTagName('item')
 
     def parse_item(self, item):
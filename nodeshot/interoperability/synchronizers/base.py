@@ -1,15 +1,23 @@
 import requests
+import hashlib
 import simplejson as json
 from xml.dom import minidom
+from xml.etree import cElementTree as ElementTree
+from cStringIO import StringIO
 from dateutil import parser as DateParser
 
+from django.db import transaction
 from django.core.exceptions import ImproperlyConfigured
 from django.template.defaultfilters import slugify
-from django.contrib.auth import get_user_model
-User = get_user_model()
+from django.contrib.gis.geos.collections import GeometryCollection
 
-from nodeshot.core.base.utils import pause_disconnectable_signals, resume_disconnectable_signals
-from nodeshot.core.nodes.models import Node, Status
+from nodeshot.core.base.utils import pause_disconnectable_signals, resume_disconnectable_signals, now
+from nodeshot.core.nodes.models import Node
+from nodeshot.core.nodes.signals import nodes_bulk_created
+
+from ..models import FetchCache, NodeSyncHash
+from ..settings import BULK_BATCH_SIZE, CHUNK_SIZE, STREAMING_CHUNK_SIZE
+from ..utils import SlugIndex, LookupCache, SyncRunRecorder, IterStream, chunks, bulk_update, geometry_hash, record_hash
 
 
 __all__ = [
@@ -39,12 +47,17 @@ class BaseSynchronizer(object):
 
     REQUIRED_CONFIG_KEYS = []
 
+    # might be set to True by retrieve_data if the external source did not change since last run
+    not_modified = False
+
     def __init__(self, layer, *args, **kwargs):
         """
         :layer models.Model: instance of Layer we want to convert
         """
         self.layer = layer
         self.verbosity = kwargs.get('verbosity', 1)
+        # index of the slugs which are already taken, might be shared with other synchronizers
+        self.shared_slug_index = kwargs.get('slug_index')
         self.config = json.loads(layer.external.config)
 
     def validate(self):
@@ -71,6 +84,33 @@ class BaseSynchronizer(object):
         """ anything that should be executed after the import is complete goes here """
         pass
 
+    def push(self, operations):
+        """
+        pushes a batch of local changes to the external layer
+        by calling the "add", "change" and "delete" methods, if supported;
+        synchronizers which need authentication may extend this method
+        in order to authenticate once per batch.
+
+        :param operations: list of (operation, target) tuples, where target is either
+                           a Node instance (add, change) or an external id (delete);
+                           target is None if the node does not exist anymore
+        :returns: list of booleans indicating which operations succeeded
+                  (unsupported operations are considered done)
+        """
+        results = []
+
+        for operation, target in operations:
+            if target is None or not hasattr(self, operation):
+                results.append(True)
+                continue
+            try:
+                results.append(getattr(self, operation)(target) is not False)
+            except Exception as e:
+                self.verbose('error while pushing %s operation: %s' % (operation, e))
+                results.append(False)
+
+        return results
+
     def process(self):
         """
         This is the method that does everything automatically (at least attempts to).
@@ -81,30 +121,54 @@ class BaseSynchronizer(object):
             2. Parse the data
             3. Save the data locally
             4. Call "after_complete" method (which might be implemented by children classes)
+
+        If "retrieve_data" flags the external source as not modified steps 2-4 are skipped.
+
+        Timing of each phase and other statistics are stored in a SyncRun.
         """
-        self.before_start()
-        self.retrieve_data()
-        self.parse()
+        recorder = SyncRunRecorder(self)
 
-        # TRICK: disable new_nodes_allowed_for_layer validation
         try:
-            Node._additional_validation.remove('new_nodes_allowed_for_layer')
-        except ValueError as e:
-            print "WARNING! got exception: %s" % e
-        # avoid sending zillions of notifications
-        pause_disconnectable_signals()
+            self.before_start()
 
-        self.save()
+            with recorder.phase('retrieve'):
+                self.retrieve_data()
 
-        # Re-enable new_nodes_allowed_for_layer validation
-        try:
-            Node._additional_validation.insert(0, 'new_nodes_allowed_for_layer')
-        except ValueError as e:
-            print "WARNING! got exception: %s" % e
-        # reconnect signals
-        resume_disconnectable_signals()
+            if self.not_modified:
+                self.message = """
+            external source not modified since last synchronization, nothing to do
+            """
+                recorder.finish('not_modified', self.message)
+                return [self.message]
+
+            with recorder.phase('parse'):
+                self.parse()
+
+            # TRICK: disable new_nodes_allowed_for_layer validation
+            try:
+                Node._additional_validation.remove('new_nodes_allowed_for_layer')
+            except ValueError as e:
+                print "WARNING! got exception: %s" % e
+            # avoid sending zillions of notifications
+            pause_disconnectable_signals()
+
+            with recorder.phase('save'):
+                self.save()
+
+            # Re-enable new_nodes_allowed_for_layer validation
+            try:
+                Node._additional_validation.insert(0, 'new_nodes_allowed_for_layer')
+            except ValueError as e:
+                print "WARNING! got exception: %s" % e
+            # reconnect signals
+            resume_disconnectable_signals()
+
+            self.after_complete()
+        except Exception as e:
+            recorder.finish('error', unicode(e))
+            raise
 
-        self.after_complete()
+        recorder.finish('success', self.message)
 
         # return message as a list because more than one messages might be returned
         return [self.message]
@@ -127,28 +191,203 @@ class BaseSynchronizer(object):
 
 
 class HttpRetrieverMixin(object):
-    """ Retrieve external data through HTTP """
+    """
+    Retrieve external data through HTTP
+
+    If the "conditional_fetch" config key is true ETag, Last-Modified and a hash of the
+    response body are stored in FetchCache after each successful run and
+    the next requests are conditional: if the server replies "304 Not Modified"
+    or the body did not change, parsing and saving are skipped.
+    """
 
     def retrieve_data(self):
-        """ retrieve data from an HTTP URL """
+        """
+        retrieve data from an HTTP URL
+
+        if the "streaming" config key is true the response body is not read,
+        parsers which support streaming will read it incrementally through "iter_response"
+        """
         # shortcuts for readability
         url = self.config.get('url')
         verify_SSL = self.config.get('verify_SSL', True)
+        streaming = self.config.get('streaming', False)
+        headers = self._get_conditional_headers(url)
+        self.not_modified = False
+
+        # do HTTP request
+        self.response = requests.get(url, verify=verify_SSL, stream=streaming, headers=headers)
+        self.bytes_downloaded = 0
+
+        if self.response.status_code == 304:
+            self.not_modified = True
+            return
+
+        # in streaming mode content is read incrementally by the parser
+        self.data = None if streaming else self.response.content
+
+        if self.data is not None:
+            self.bytes_downloaded = len(self.data)
+
+        self._check_fetch_cache(url)
+
+    def iter_response(self):
+        """ iterates over the chunks of the response body (streaming mode only) """
+        for chunk in self.response.iter_content(STREAMING_CHUNK_SIZE):
+            self.bytes_downloaded += len(chunk)
+            yield chunk
+
+    def process(self):
+        """ store fetch cache only if the synchronization completed successfully """
+        messages = super(HttpRetrieverMixin, self).process()
+        self._save_fetch_cache()
+        return messages
+
+    def _get_conditional_headers(self, url):
+        """ returns conditional request headers (conditional_fetch mode only) """
+        self.fetch_cache = None
 
-        # do HTTP request and store content
-        self.data = requests.get(url, verify=verify_SSL).content
+        if not self.config.get('conditional_fetch', False):
+            return {}
+
+        try:
+            self.fetch_cache = FetchCache.objects.get(layer_external=self.layer.external)
+        except FetchCache.DoesNotExist:
+            self.fetch_cache = FetchCache(layer_external=self.layer.external)
+            return {}
+
+        # validators of another URL or of another configuration are useless
+        if self.fetch_cache.url != url or self.fetch_cache.config_hash != self._get_config_hash():
+            return {}
+
+        headers = {}
+        if self.fetch_cache.etag:
+            headers['If-None-Match'] = self.fetch_cache.etag
+        if self.fetch_cache.last_modified:
+            headers['If-Modified-Since'] = self.fetch_cache.last_modified
+        return headers
+
+    def _check_fetch_cache(self, url):
+        """ compare the hash of the response body with the cached one (conditional_fetch mode only) """
+        if self.fetch_cache is None:
+            return
+
+        # body is not available in advance in streaming mode
+        content_hash = hashlib.sha1(self.data).hexdigest() if self.data is not None else ''
+
+        if content_hash and self.fetch_cache.url == url and self.fetch_cache.content_hash == content_hash\
+           and self.fetch_cache.config_hash == self._get_config_hash():
+            self.not_modified = True
+
+        self.fetch_cache.url = url
+        self.fetch_cache.etag = self.response.headers.get('ETag', '')
+        self.fetch_cache.last_modified = self.response.headers.get('Last-Modified', '')
+        self.fetch_cache.content_hash = content_hash
+
+    def _get_config_hash(self):
+        """ SHA1 hash of the synchronizer class and of the configuration of the external layer """
+        external = self.layer.external
+        data = u'%s\n%s' % (external.interoperability, external.config or '')
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def _save_fetch_cache(self):
+        if self.fetch_cache is not None:
+            # configuration might have been changed by the synchronizer during the run
+            self.fetch_cache.config_hash = self._get_config_hash()
+            self.fetch_cache.save()
 
 
 class XMLParserMixin(object):
-    """ XML Parsing utility methods """
+    """
+    XML Parsing utility methods
+
+    Two parsing backends are available:
+        * minidom (default): builds the whole DOM
+        * iterparse: enabled with the "iterparse" config key (implied by "streaming"),
+          streams ITEM_TAGS elements one at a time, see "iterparse" method
+    """
+    # tags of the elements which are considered items by the iterparse backend
+    ITEM_TAGS = ['item', 'entry']
+
+    @property
+    def use_iterparse(self):
+        return bool(self.config.get('iterparse', False) or self.config.get('streaming', False))
 
     def parse(self):
         """ parse data """
-        self.parsed_data = minidom.parseString(self.data)
+        if self.use_iterparse:
+            self.parsed_data = self.iterparse()
+        else:
+            self.parsed_data = minidom.parseString(self.data)
+
+    def iterparse(self):
+        """
+        generator which parses the XML incrementally and yields one dictionary for
+        each ITEM_TAGS element; the dictionary maps the tags contained in the element
+        (eg: "title", "georss:point") to the text of their first occurrence,
+        so that "get_text" does not need to search the subtree for each field.
+        Elements are freed as soon as they have been processed.
+        """
+        # streaming mode
+        if self.data is None:
+            source = IterStream(self.iter_response())
+        else:
+            source = StringIO(self.data)
+
+        # namespace uri -> prefix
+        namespaces = {}
+        # stack of open elements, needed to free processed items
+        parents = []
+
+        for event, element in ElementTree.iterparse(source, events=('start-ns', 'start', 'end')):
+            if event == 'start-ns':
+                prefix, uri = element
+                namespaces[uri] = prefix
+                continue
+
+            if event == 'start':
+                parents.append(element)
+                continue
+
+            parents.pop()
+
+            if self._qualified_tag(element.tag, namespaces) not in self.ITEM_TAGS:
+                continue
+
+            item = {}
+            for child in element.iter():
+                if child is element:
+                    continue
+                item.setdefault(self._qualified_tag(child.tag, namespaces), unicode(child.text or ''))
+
+            # free memory
+            element.clear()
+            if parents:
+                parents[-1].remove(element)
+
+            yield item
+
+    @staticmethod
+    def _qualified_tag(tag, namespaces):
+        """ converts "{uri}name" in "prefix:name" """
+        if not tag.startswith('{'):
+            return tag
+        uri, name = tag[1:].split('}', 1)
+        prefix = namespaces.get(uri)
+        return '%s:%s' % (prefix, name) if prefix else name
 
     @staticmethod
     def get_text(item, tag, default=False):
         """ returns text content of an xml tag """
+        # item extracted by iterparse
+        if isinstance(item, dict):
+            try:
+                return item[tag]
+            except KeyError as e:
+                if default is not False:
+                    return default
+                else:
+                    raise IndexError(e)
+
         try:
             xmlnode = item.getElementsByTagName(tag)[0].firstChild
         except IndexError as e:
@@ -201,15 +440,32 @@ class GenericGisSynchronizer(HttpRetrieverMixin, BaseSynchronizer):
         """
         raise NotImplementedError("Not Implemented")
 
-    def _convert_item(self, item):
+    def _convert_items(self, items):
+        """
+        generator which converts items through "_convert_item";
+        items are processed in chunks of CHUNK_SIZE items,
+        the items of each chunk are parsed first so that their users can be resolved with one query
+
+        :param items: iterable (or generator) of objects representing items to parse
+        """
+        for chunk in chunks(items, CHUNK_SIZE):
+            chunk = [self.parse_item(item) for item in chunk]
+            self.lookup_cache.prefetch_users(item['user'] for item in chunk)
+
+            for item in chunk:
+                yield self._convert_item(item, parse=False)
+
+    def _convert_item(self, item, parse=True):
         """
         take a parsed item as input and returns a python dictionary
         the keys will be saved into the Node model
         either in their respective fields or in the hstore "data" field
 
         :param item: object representing parsed item
+        :param parse: whether item still needs to be parsed through "parse_item"
         """
-        item = self.parse_item(item)
+        if parse:
+            item = self.parse_item(item)
 
         # name is required
         if not item['name']:
@@ -219,13 +475,7 @@ class GenericGisSynchronizer(HttpRetrieverMixin, BaseSynchronizer):
             item['status'] = self.default_status
 
         # get status or get default status or None
-        try:
-            item['status'] = Status.objects.get(slug__iexact=item['status'])
-        except Status.DoesNotExist:
-            try:
-                item['status'] = Status.objects.filter(is_default=True)[0]
-            except IndexError:
-                item['status'] = None
+        item['status'] = self.lookup_cache.get_status(item['status'])
 
         # slugify slug
         item['slug'] = slugify(item['name'])
@@ -237,10 +487,7 @@ class GenericGisSynchronizer(HttpRetrieverMixin, BaseSynchronizer):
             item['is_published'] = ''
 
         # get user or None
-        try:
-            item['user'] = User.objects.get(username=item['user'])
-        except User.DoesNotExist:
-            item['user'] = None
+        item['user'] = self.lookup_cache.get_user(item['user'])
 
         if not item['elev']:
             item['elev'] = None
@@ -312,48 +559,51 @@ class GenericGisSynchronizer(HttpRetrieverMixin, BaseSynchronizer):
          * ensure new nodes do not take a name/slug which is already used
          * validate through django before saving
          * use good defaults
+
+        items are processed in chunks (see "_convert_items"), so that
+        also generators of items (streaming mode) can be consumed.
+
+        items whose record hash did not change since the last run
+        are skipped without loading the node (see "_hash_item").
+
+        if the "bulk_save" config key is true the set based engine
+        implemented in the "bulk_save" method is used instead
         """
-        self.key_mapping()
+        if self.config.get('bulk_save', False):
+            return self.bulk_save()
+
+        self._init_run()
         # retrieve all items
         items = self.parsed_data
 
-        # init empty lists
-        added_nodes = []
-        changed_nodes = []
-        unmodified_nodes = []
+        # init counters
+        added_nodes_count = 0
+        changed_nodes_count = 0
+        unmodified_nodes_count = 0
+        processed_count = 0
 
         # retrieve a list of all the slugs of this layer
         layer_nodes_slug_list = Node.objects.filter(layer=self.layer).values_list('slug', flat=True)
-        # keep a list of all the nodes of other layers
-        other_layers_slug_list = Node.objects.exclude(layer=self.layer).values_list('slug', flat=True)
-        # init empty list of slug of external nodes that will be needed to perform delete operations
-        processed_slug_list = []
+        # init empty set of slug of external nodes that will be needed to perform delete operations
+        processed_slug_list = set()
         deleted_nodes_count = 0
 
         # loop over every item
-        for item in items:
+        for item in self._convert_items(items):
+            processed_count += 1
 
-            item = self._convert_item(item)
+            self._ensure_unique_name(item)
+            hashes = self._hash_item(item)
 
-            number = 1
-            original_name = item['name']
-            needed_different_name = False
-
-            while True:
-                # items might have the same name... so we add a number..
-                if item['slug'] in processed_slug_list or item['slug'] in other_layers_slug_list:
-                    needed_different_name = True
-                    number = number + 1
-                    item['name'] = "%s - %d" % (original_name, number)
-                    item['slug'] = slugify(item['name'])
-                else:
-                    if needed_different_name:
-                        self.verbose('needed a different name for %s, trying "%s"' % (original_name, item['name']))
-                    break
+            # record did not change since last run
+            if self._is_unchanged(item, hashes):
+                unmodified_nodes_count += 1
+                self.verbose('node "%s" unmodified' % item['name'])
+                processed_slug_list.add(item['slug'])
+                continue
 
             # default values
             added = False
-            changed = False
 
             try:
                 # edit existing node
@@ -364,35 +614,7 @@ class GenericGisSynchronizer(HttpRetrieverMixin, BaseSynchronizer):
                 node.layer = self.layer
                 added = True
 
-            # loop over fields and store data only if necessary
-            for field in Node._meta.fields:
-                # geometry is a special case, skip
-                if field.name == 'geometry':
-                    continue
-                # skip if field is not present in values
-                if field.name not in item.keys():
-                    continue
-                # shortcut for value
-                value = item[field.name]
-                # if value is different than what we have
-                if getattr(node, field.name) != value and value is not None:
-                    # set value
-                    setattr(node, field.name, value)
-                    # indicates that a DB query is necessary
-                    changed = True
-
-            if added is True or (node.geometry.equals(item['geometry']) is False\
-                                 and node.geometry.equals_exact(item['geometry']) is False):
-                node.geometry = item['geometry']
-                changed = True
-
-            node.data = node.data or {}
-
-            # store any additional key/value in HStore data field
-            for key, value in item['data'].items():
-                if node.data[key] != value:
-                    node.data[key] = value
-                    changed = True
+            changed = len(self._update_node(node, item, added, self._geometry_unchanged(item, hashes))) > 0
 
             # perform save or update only if necessary
             if added or changed:
@@ -406,33 +628,338 @@ class GenericGisSynchronizer(HttpRetrieverMixin, BaseSynchronizer):
                     # TODO: are we sure we want to interrupt the execution?
                     raise Exception('error while processing "%s": %s' % (node.name, e))
 
+            self._store_hashes([(node, hashes)])
+
             if added:
-                added_nodes.append(node)
+                added_nodes_count += 1
                 self.verbose('new node saved with name "%s"' % node.name)
             elif changed:
-                changed_nodes.append(node)
+                changed_nodes_count += 1
                 self.verbose('node "%s" updated' % node.name)
             else:
-                unmodified_nodes.append(node)
+                unmodified_nodes_count += 1
                 self.verbose('node "%s" unmodified' % node.name)
 
             # fill node list container
-            processed_slug_list.append(node.slug)
+            processed_slug_list.add(node.slug)
 
         # delete old nodes
         for local_node in layer_nodes_slug_list:
             # if local node not found in external nodes
             if local_node not in processed_slug_list:
-                # store node name to print it later
-                node_name = node.name
                 # retrieve from DB and delete
                 node = Node.objects.get(slug=local_node)
                 node.delete()
+                self.slug_index.release([local_node])
                 # then increment count that will be included in message
                 deleted_nodes_count = deleted_nodes_count + 1
-                self.verbose('node "%s" deleted' % node_name)
+                self.verbose('node "%s" deleted' % node.name)
+
+        self._build_message(
+            added=added_nodes_count,
+            changed=changed_nodes_count,
+            deleted=deleted_nodes_count,
+            unmodified=unmodified_nodes_count,
+            processed=processed_count
+        )
+
+    def bulk_save(self):
+        """
+        set based variant of "save", enabled through the "bulk_save" config key:
+
+         1. load all the nodes of the layer in one query (dict keyed by slug)
+         2. compute the added, changed and deleted sets in memory
+         3. apply them in a single transaction with bulk_create,
+            one UPDATE ... FROM (VALUES ...) per set of changed columns
+            and one DELETE ... WHERE slug IN (...)
+         4. generate the same report of "save"
+
+        added and changed nodes are flushed every BULK_BATCH_SIZE nodes,
+        so that memory usage does not grow with the size of the external source.
+
+        Node.save() is bypassed, therefore the post_save receivers and
+        the node_status_changed signal are not triggered for the synchronized nodes.
+        """
+        self._init_run()
+        # retrieve all items
+        items = self.parsed_data
+
+        # retrieve all the nodes of this layer in one query
+        local_nodes = dict((node.slug, node) for node in Node.objects.filter(layer=self.layer))
+        # slug of external nodes, needed to compute the nodes which have to be deleted
+        processed_slug_list = set()
+
+        # nodes waiting to be flushed
+        added_nodes = []
+        # list of (node, changed_fields) tuples
+        changed_nodes = []
+        # list of (node, hashes) tuples
+        node_hashes = []
+
+        added_nodes_count = 0
+        changed_nodes_count = 0
+        unmodified_nodes_count = 0
+        processed_count = 0
+
+        with transaction.atomic():
+            for item in self._convert_items(items):
+                processed_count += 1
+
+                self._ensure_unique_name(item)
+                hashes = self._hash_item(item)
+
+                # record did not change since last run
+                if self._is_unchanged(item, hashes):
+                    unmodified_nodes_count += 1
+                    self.verbose('node "%s" unmodified' % item['name'])
+                    processed_slug_list.add(item['slug'])
+                    continue
+
+                node = local_nodes.get(item['slug'])
+                added = node is None
+
+                if added:
+                    node = Node()
+                    node.layer = self.layer
+
+                changed_fields = self._update_node(node, item, added, self._geometry_unchanged(item, hashes))
+
+                if added or changed_fields:
+                    try:
+                        # uniqueness has already been ensured by _ensure_unique_name
+                        node.full_clean(validate_unique=False)
+                    except Exception as e:
+                        raise Exception('error while processing "%s": %s' % (node.name, e))
+                    self._prepare_bulk_node(node)
+
+                if added:
+                    added_nodes.append(node)
+                    added_nodes_count += 1
+                    self.verbose('new node with name "%s" will be added' % node.name)
+                elif changed_fields:
+                    changed_nodes.append((node, changed_fields))
+                    changed_nodes_count += 1
+                    self.verbose('node "%s" will be updated' % node.name)
+                else:
+                    unmodified_nodes_count += 1
+                    self.verbose('node "%s" unmodified' % node.name)
+
+                processed_slug_list.add(node.slug)
+                node_hashes.append((node, hashes))
 
-        # message that will be returned
+                if len(node_hashes) >= BULK_BATCH_SIZE:
+                    self._bulk_flush(added_nodes, changed_nodes, node_hashes)
+                    added_nodes, changed_nodes, node_hashes = [], [], []
+
+            self._bulk_flush(added_nodes, changed_nodes, node_hashes)
+
+            deleted_slug_list = [slug for slug in local_nodes.keys() if slug not in processed_slug_list]
+
+            if deleted_slug_list:
+                Node.objects.filter(layer=self.layer, slug__in=deleted_slug_list).delete()
+
+        self.slug_index.release(deleted_slug_list)
+
+        for slug in deleted_slug_list:
+            self.verbose('node "%s" deleted' % local_nodes[slug].name)
+
+        self._build_message(
+            added=added_nodes_count,
+            changed=changed_nodes_count,
+            deleted=len(deleted_slug_list),
+            unmodified=unmodified_nodes_count,
+            processed=processed_count
+        )
+
+    def _bulk_flush(self, added_nodes, changed_nodes, node_hashes):
+        """
+        write pending nodes of "bulk_save":
+         * added nodes are inserted with bulk_create and notified with the nodes_bulk_created signal
+         * changed nodes are updated only in the columns which changed,
+           with one query for each set of changed columns (see utils.bulk_update)
+         * hashes of all the processed nodes are stored (see "_store_hashes")
+        """
+        if added_nodes:
+            Node.objects.bulk_create(added_nodes, batch_size=BULK_BATCH_SIZE)
+            # bulk_create does not set primary keys
+            ids = dict(Node.objects.filter(layer=self.layer, slug__in=[node.slug for node in added_nodes])
+                                   .values_list('slug', 'id'))
+            for node in added_nodes:
+                node.id = ids[node.slug]
+            nodes_bulk_created.send(sender=Node, nodes=added_nodes)
+
+        # nodes which changed in the same fields are updated together, one query per batch
+        groups = {}
+        for node, changed_fields in changed_nodes:
+            groups.setdefault(tuple(sorted(changed_fields)), []).append(node)
+        for changed_fields, nodes in groups.items():
+            bulk_update(Node, nodes, changed_fields, batch_size=BULK_BATCH_SIZE)
+
+        self._store_hashes(node_hashes)
+
+    def _init_run(self):
+        """ init attributes which live for the duration of a sync run """
+        self.key_mapping()
+        # the slug index is built once per sync run and might be shared with other layers
+        self.slug_index = self.shared_slug_index or SlugIndex()
+        # cache of the status and user lookups performed by _convert_item
+        self.lookup_cache = LookupCache()
+        # hashes stored during the previous run, loaded with one query: slug -> NodeSyncHash
+        queryset = NodeSyncHash.objects.filter(node__layer=self.layer).select_related('node')
+        queryset = queryset.only('geometry_hash', 'record_hash', 'node_updated', 'node__slug', 'node__updated')
+        self.stored_hashes = dict((sync_hash.node.slug, sync_hash) for sync_hash in queryset)
+
+    def _hash_item(self, item):
+        """
+        returns a (geometry_hash, record_hash) tuple
+        which fingerprints the converted item
+        """
+        geometry = geometry_hash(item['geometry'])
+        return geometry, record_hash(item, geometry)
+
+    def _get_stored_hashes(self, item):
+        """
+        returns the hashes stored for the item during the previous run
+        or None if they are missing or if the node has been edited locally since then
+        """
+        stored = self.stored_hashes.get(item['slug'])
+        if stored is None or stored.node_updated != stored.node.updated:
+            return None
+        return stored
+
+    def _is_unchanged(self, item, hashes):
+        """ True if the item is identical to the one synchronized during the previous run """
+        stored = self._get_stored_hashes(item)
+        return stored is not None and stored.record_hash == hashes[1]
+
+    def _geometry_unchanged(self, item, hashes):
+        """ True if the geometry is identical to the one synchronized during the previous run """
+        stored = self._get_stored_hashes(item)
+        return stored is not None and stored.geometry_hash == hashes[0]
+
+    def _store_hashes(self, node_hashes):
+        """
+        stores the hashes of a list of (node, hashes) tuples:
+        new hashes are inserted in one query, existing hashes which changed are updated in one query
+        """
+        new_hashes = []
+        changed_hashes = []
+
+        for node, (geometry, record) in node_hashes:
+            values = {
+                'geometry_hash': geometry,
+                'record_hash': record,
+                'node_updated': node.updated
+            }
+            stored = self.stored_hashes.get(node.slug)
+
+            if stored is None:
+                new_hashes.append(NodeSyncHash(node_id=node.id, **values))
+            elif (stored.geometry_hash, stored.record_hash, stored.node_updated) != (geometry, record, node.updated):
+                for field, value in values.items():
+                    setattr(stored, field, value)
+                changed_hashes.append(stored)
+
+        if new_hashes:
+            NodeSyncHash.objects.bulk_create(new_hashes, batch_size=BULK_BATCH_SIZE)
+
+        bulk_update(NodeSyncHash, changed_hashes, ['geometry_hash', 'record_hash', 'node_updated'],
+                    batch_size=BULK_BATCH_SIZE)
+
+    def _ensure_unique_name(self, item):
+        """
+        items might have the same name of other nodes,
+        in that case a number is added to name and slug;
+        the resulting slug is reserved in the slug index
+        """
+        number = 1
+        original_name = item['name']
+        needed_different_name = False
+
+        while True:
+            # items might have the same name... so we add a number..
+            if not self.slug_index.claim(item['slug'], self.layer.id):
+                needed_different_name = True
+                number = number + 1
+                item['name'] = "%s - %d" % (original_name, number)
+                item['slug'] = slugify(item['name'])
+            else:
+                if needed_different_name:
+                    self.verbose('needed a different name for %s, trying "%s"' % (original_name, item['name']))
+                break
+
+    def _update_node(self, node, item, added, geometry_unchanged=False):
+        """
+        store item values in node only if necessary
+        returns the list of the names of the fields which have been changed
+
+        if "geometry_unchanged" is True the GEOS comparison of geometries is skipped
+        """
+        changed_fields = []
+
+        # loop over fields and store data only if necessary
+        for field in Node._meta.fields:
+            # geometry is a special case, skip
+            if field.name == 'geometry':
+                continue
+            # skip if field is not present in values
+            if field.name not in item.keys():
+                continue
+            # shortcut for value
+            value = item[field.name]
+            # if value is different than what we have
+            if getattr(node, field.name) != value and value is not None:
+                # set value
+                setattr(node, field.name, value)
+                # indicates that a DB query is necessary
+                changed_fields.append(field.name)
+
+        if added is True or (geometry_unchanged is False\
+                             and node.geometry.equals(item['geometry']) is False\
+                             and node.geometry.equals_exact(item['geometry']) is False):
+            node.geometry = item['geometry']
+            changed_fields.append('geometry')
+
+        node.data = node.data or {}
+
+        # store any additional key/value in HStore data field
+        for key, value in item['data'].items():
+            if node.data[key] != value:
+                node.data[key] = value
+                if 'data' not in changed_fields:
+                    changed_fields.append('data')
+
+        return changed_fields
+
+    def _prepare_bulk_node(self, node):
+        """
+        replicates what Node.save() would do on nodes
+        which are going to be written with bulk queries
+        """
+        # geometry collection check
+        if isinstance(node.geometry, GeometryCollection) and 0 < len(node.geometry) < 2:
+            node.geometry = node.geometry[0]
+
+        # default status
+        if not node.status and not node.status_id:
+            default_status = self.lookup_cache.get_default_status()
+            if default_status is not None:
+                node.status = default_status
+
+        # dates
+        if node.added is None or node.updated is None:
+            node.updated = now()
+
+    def _build_message(self, added, changed, deleted, unmodified, processed):
+        """ build report message that will be returned """
+        # stored in SyncRun
+        self.report = {
+            'added': added,
+            'changed': changed,
+            'deleted': deleted,
+            'unmodified': unmodified,
+            'processed': processed
+        }
         self.message = """
             %s nodes added
             %s nodes changed
@@ -440,13 +967,16 @@ class GenericGisSynchronizer(HttpRetrieverMixin, BaseSynchronizer):
             %s nodes unmodified
             %s total external records processed
             %s total local nodes for this layer
+            %s lookup cache hits, %s lookup cache misses
         """ % (
-            len(added_nodes),
-            len(changed_nodes),
-            deleted_nodes_count,
-            len(unmodified_nodes),
-            len(items),
-            Node.objects.filter(layer=self.layer).count()
+            added,
+            changed,
+            deleted,
+            unmodified,
+            processed,
+            Node.objects.filter(layer=self.layer).count(),
+            self.lookup_cache.hits,
+            self.lookup_cache.misses
         )
 
 
@@ -1,6 +1,16 @@
 from celery import task
+from celery.utils.log import get_logger
 from importlib import import_module
 from django.core import management
+from django.core.cache import cache
+from django.db import transaction
+
+from .settings import PUSH_DELAY, PUSH_BATCH_SIZE, PUSH_RETRY_DELAY, PUSH_MAX_ATTEMPTS
+
+logger = get_logger(__name__)
+
+# cache key of the flag which indicates that a flush of the push queue of an external layer is scheduled
+PUSH_FLUSH_CACHE_KEY = 'interoperability_push_flush_%s'
 
 
 @task()
@@ -45,4 +55,98 @@ def push_changes_to_external_layers(node, external_layer, operation):
     
     # call method only if supported
     if hasattr(instance, operation):
-        getattr(instance, operation)(node)
\ No newline at end of file
+        getattr(instance, operation)(node)
+
+def schedule_push_flush(layer_external_id, countdown=PUSH_DELAY):
+    """
+    schedules "flush_push_queue" for the specified external layer
+    unless a flush is already scheduled
+    """
+    if cache.add(PUSH_FLUSH_CACHE_KEY % layer_external_id, True, countdown):
+        flush_push_queue.apply_async(args=[layer_external_id], countdown=countdown)
+
+
+@task(bind=True)
+def flush_push_queue(self, layer_external_id):
+    """
+    Pushes the pending operations of an external layer in batches of PUSH_BATCH_SIZE
+    through one synchronizer instance (see BaseSynchronizer.push).
+    Failed operations are retried with exponential backoff up to PUSH_MAX_ATTEMPTS times.
+
+    :param layer_external_id: primary key of the LayerExternal instance
+    :type layer_external_id: int
+    """
+    # see comment in push_changes_to_external_layers
+    from nodeshot.core.base.utils import now
+    from nodeshot.core.nodes.models import Node
+    from .models import LayerExternal, NodeExternal, PushOperation
+    from .utils import LayerLock
+
+    # operations enqueued from now on will schedule another flush
+    cache.delete(PUSH_FLUSH_CACHE_KEY % layer_external_id)
+
+    try:
+        layer_external = LayerExternal.objects.select_related('layer').get(pk=layer_external_id)
+    except LayerExternal.DoesNotExist:
+        return
+
+    lock = LayerLock(layer_external.layer_id, namespace=LayerLock.PUSH_NAMESPACE)
+    # another worker is flushing the queue of this layer
+    if not lock.acquire():
+        schedule_push_flush(layer_external_id)
+        return
+
+    try:
+        synchronizer = layer_external.synchronizer
+        queue = PushOperation.objects.filter(layer_external=layer_external)
+
+        # interoperability has been disabled in the meanwhile
+        if not synchronizer:
+            queue.delete()
+            return
+
+        while True:
+            # operations enqueued while the batch is being pushed are not coalesced
+            # with the ones being pushed, see PushOperation.complete
+            with transaction.atomic():
+                operations = list(queue.select_for_update().filter(next_attempt__lte=now())[0:PUSH_BATCH_SIZE])
+                queue.filter(pk__in=[op.pk for op in operations]).update(pushing=True)
+
+            if not operations:
+                break
+
+            nodes = Node.objects.in_bulk([op.node_id for op in operations if op.operation != 'delete'])
+            # deletes enqueued while their node was being added could not know its external id
+            missing = [op.node_id for op in operations if op.operation == 'delete' and not op.external_id]
+            external_ids = dict(NodeExternal.objects.filter(node__in=missing).values_list('node', 'external_id'))
+            batch = []
+
+            for operation in operations:
+                if operation.operation == 'delete':
+                    target = operation.external_id or external_ids.get(operation.node_id) or None
+                else:
+                    target = nodes.get(operation.node_id)
+                batch.append((operation.operation, target))
+
+            try:
+                results = synchronizer.push(batch)
+            # eg: authentication failure
+            except Exception as e:
+                logger.error('error while pushing to %s: %s' % (layer_external.layer, e))
+                results = [False] * len(batch)
+
+            for operation, success in zip(operations, results):
+                if success or operation.attempts + 1 >= PUSH_MAX_ATTEMPTS:
+                    if not success:
+                        logger.error('dropping %s after %d failed attempts' % (operation, PUSH_MAX_ATTEMPTS))
+                    operation.complete(success)
+                else:
+                    operation.complete(success, retry_delay=PUSH_RETRY_DELAY * 2 ** operation.attempts)
+    finally:
+        lock.release()
+
+    # schedule retries (eager execution would retry immediately, forever)
+    pending = list(queue.order_by('next_attempt').values_list('next_attempt', flat=True)[0:1])
+    if pending and not self.request.is_eager:
+        countdown = max((pending[0] - now()).total_seconds(), PUSH_DELAY)
+        schedule_push_flush(layer_external_id, countdown=countdown)
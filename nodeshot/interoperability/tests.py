@@ -2,6 +2,7 @@
 nodeshot.interoperability unit tests
 """
 
+import os
 import sys
 import simplejson as json
 import requests
@@ -9,23 +10,27 @@ from time import sleep
 from cStringIO import StringIO
 from datetime import date, timedelta
 
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from django.core import management
 from django.core.urlresolvers import reverse
 from django.core.exceptions import ValidationError
 from django.contrib.gis.geos import Point, GEOSGeometry
 from django.conf import settings
+from django.db import connection
 
 from nodeshot.core.layers.models import Layer
 from nodeshot.core.nodes.models import Node
 from nodeshot.core.base.tests import user_fixtures
 
-from .models import LayerExternal
+from .models import LayerExternal, FetchCache, NodeSyncHash, PushOperation
+from .utils import SlugIndex, LookupCache, SyncRunRecorder, QueryCountingCursor
+from .utils import iter_geojson_features, geometry_hash, bulk_update
 from .settings import settings, CITYSDK_TOURISM_TEST_CONFIG, CITYSDK_MOBILITY_TEST_CONFIG
-from .tasks import synchronize_external_layers
+from .tasks import synchronize_external_layers, flush_push_queue
 
 
 TEST_FILES_PATH = '%snodeshot/testing' % settings.STATIC_URL
+TEST_FILES_DIR = os.path.join(os.path.dirname(__file__), 'static', 'nodeshot', 'testing')
 
 
 def capture_output(command, args=[], kwargs={}):
@@ -106,6 +111,16 @@ class InteroperabilityTest(TestCase):
             self.assertIn('wrongvalue', str(e))
             self.assertIn('does not exist', str(e))
 
+    def test_management_command_workers_sequential(self):
+        """ --workers=1 behaves like the default sequential mode """
+        output = capture_output(
+            management.call_command,
+            ['synchronize', 'vienna'],
+            { 'workers': 1 }
+        )
+        self.assertIn('does not have an interoperability class specified', output)
+        self.assertNotIn('layers processed', output)
+
     def test_layer_admin(self):
         """ ensure layer admin does not return any error """
         layer = Layer.objects.external()[0]
@@ -479,6 +494,330 @@ class InteroperabilityTest(TestCase):
         self.assertIn('2 total external', output)
         self.assertIn('2 total local', output)
 
+    def test_geojson_bulk_sync(self):
+        """ test GeoJSON sync with bulk_save mode """
+        layer = Layer.objects.external()[0]
+        layer.minimum_distance = 0
+        layer.area = None
+        layer.new_nodes_allowed = False
+        layer.save()
+        layer = Layer.objects.get(pk=layer.pk)
+
+        url = '%s/geojson1.json' % TEST_FILES_PATH
+
+        external = LayerExternal(layer=layer)
+        external.interoperability = 'nodeshot.interoperability.synchronizers.GeoJson'
+        external.config = '{ "url": "%s", "map": {}, "bulk_save": true }' % url
+        external.full_clean()
+        external.save()
+
+        output = capture_output(
+            management.call_command,
+            ['synchronize', 'vienna'],
+            kwargs={ 'verbosity': 0 }
+        )
+
+        # ensure following text is in output
+        self.assertIn('2 nodes added', output)
+        self.assertIn('0 nodes changed', output)
+        self.assertIn('2 total external', output)
+        self.assertIn('2 total local', output)
+
+        # check one particular node has the data we expect it to have
+        node = Node.objects.get(slug='simplegeojson')
+        self.assertEqual(node.name, 'simplegeojson')
+        self.assertIn('simplegeojson', node.address)
+        self.assertEqual(node.elev, 10.0)
+        self.assertIsNotNone(node.status)
+
+        ### --- repeat --- ###
+
+        output = capture_output(
+            management.call_command,
+            ['synchronize', 'vienna'],
+            kwargs={ 'verbosity': 0 }
+        )
+
+        self.assertIn('2 nodes unmodified', output)
+        self.assertIn('0 nodes deleted', output)
+        self.assertIn('0 nodes changed', output)
+
+        ### --- repeat with slightly different input --- ###
+
+        url = '%s/geojson2.json' % TEST_FILES_PATH
+        external.config = '{ "url": "%s", "map": {}, "bulk_save": true }' % url
+        external.full_clean()
+        external.save()
+
+        output = capture_output(
+            management.call_command,
+            ['synchronize', 'vienna'],
+            kwargs={ 'verbosity': 0 }
+        )
+
+        self.assertIn('1 nodes unmodified', output)
+        self.assertIn('0 nodes deleted', output)
+        self.assertIn('1 nodes changed', output)
+        self.assertEqual(Node.objects.get(slug='simplegeojson').address, 'simplegeojson')
+
+        ### --- repeat with one missing item --- ###
+
+        url = '%s/geojson4.json' % TEST_FILES_PATH
+        external.config = '{ "url": "%s", "map": {}, "bulk_save": true }' % url
+        external.full_clean()
+        external.save()
+
+        output = capture_output(
+            management.call_command,
+            ['synchronize', 'vienna'],
+            kwargs={ 'verbosity': 0 }
+        )
+
+        self.assertIn('1 nodes deleted', output)
+        self.assertIn('1 total external', output)
+        self.assertIn('1 total local', output)
+        self.assertEqual(Node.objects.filter(slug='simplegeojson2').count(), 0)
+
+    def test_geojson_streaming_parser(self):
+        """ ensure streaming parser yields the same features of json.loads """
+        data = open(os.path.join(TEST_FILES_DIR, 'geojson1.json')).read()
+        features = json.loads(data)['features']
+
+        # feed the parser with chunks of different sizes
+        for size in [1, 7, 64, len(data)]:
+            chunks = [data[i:i + size] for i in range(0, len(data), size)]
+            self.assertEqual(list(iter_geojson_features(chunks)), features)
+
+        # empty collection
+        self.assertEqual(list(iter_geojson_features(['{"type": "FeatureCollection", "features": []}'])), [])
+
+        # not a collection
+        with self.assertRaises(ValueError):
+            list(iter_geojson_features(['{"type": "Feature", "geometry": null}']))
+
+        # truncated document
+        with self.assertRaises(ValueError):
+            list(iter_geojson_features(['{"type": "FeatureCollection", "features": [{"type": ']))
+
+    def test_geojson_streaming_sync(self):
+        """ test GeoJSON sync in streaming mode """
+        layer = Layer.objects.external()[0]
+        layer.minimum_distance = 0
+        layer.area = None
+        layer.new_nodes_allowed = False
+        layer.save()
+        layer = Layer.objects.get(pk=layer.pk)
+
+        url = '%s/geojson1.json' % TEST_FILES_PATH
+
+        external = LayerExternal(layer=layer)
+        external.interoperability = 'nodeshot.interoperability.synchronizers.GeoJson'
+        external.config = '{ "url": "%s", "map": {}, "streaming": true }' % url
+        external.full_clean()
+        external.save()
+
+        output = capture_output(
+            management.call_command,
+            ['synchronize', 'vienna'],
+            kwargs={ 'verbosity': 0 }
+        )
+
+        # ensure following text is in output
+        self.assertIn('2 nodes added', output)
+        self.assertIn('0 nodes changed', output)
+        self.assertIn('2 total external', output)
+        self.assertIn('2 total local', output)
+
+    def test_conditional_fetch(self):
+        """ ensure unmodified sources are not parsed again """
+        layer = Layer.objects.external()[0]
+        layer.minimum_distance = 0
+        layer.area = None
+        layer.new_nodes_allowed = False
+        layer.save()
+        layer = Layer.objects.get(pk=layer.pk)
+
+        url = '%s/geojson1.json' % TEST_FILES_PATH
+
+        external = LayerExternal(layer=layer)
+        external.interoperability = 'nodeshot.interoperability.synchronizers.GeoJson'
+        external.config = '{ "url": "%s", "map": {}, "conditional_fetch": true }' % url
+        external.full_clean()
+        external.save()
+
+        output = capture_output(
+            management.call_command,
+            ['synchronize', 'vienna'],
+            kwargs={ 'verbosity': 0 }
+        )
+        self.assertIn('2 nodes added', output)
+
+        fetch_cache = FetchCache.objects.get(layer_external=external)
+        self.assertEqual(fetch_cache.url, url)
+        self.assertEqual(len(fetch_cache.content_hash), 40)
+
+        ### --- repeat: nothing to do --- ###
+
+        output = capture_output(
+            management.call_command,
+            ['synchronize', 'vienna'],
+            kwargs={ 'verbosity': 0 }
+        )
+        self.assertIn('not modified', output)
+        self.assertNotIn('nodes unmodified', output)
+
+        ### --- same content, different configuration: full sync --- ###
+
+        external.config = '{ "url": "%s", "map": {}, "conditional_fetch": true, "bulk_save": true }' % url
+        external.full_clean()
+        external.save()
+
+        output = capture_output(
+            management.call_command,
+            ['synchronize', 'vienna'],
+            kwargs={ 'verbosity': 0 }
+        )
+        self.assertNotIn('not modified', output)
+        self.assertIn('2 nodes unmodified', output)
+
+        output = capture_output(
+            management.call_command,
+            ['synchronize', 'vienna'],
+            kwargs={ 'verbosity': 0 }
+        )
+        self.assertIn('not modified', output)
+
+        ### --- different url: full sync --- ###
+
+        url = '%s/geojson2.json' % TEST_FILES_PATH
+        external.config = '{ "url": "%s", "map": {}, "conditional_fetch": true }' % url
+        external.full_clean()
+        external.save()
+
+        output = capture_output(
+            management.call_command,
+            ['synchronize', 'vienna'],
+            kwargs={ 'verbosity': 0 }
+        )
+        self.assertIn('1 nodes changed', output)
+        self.assertEqual(FetchCache.objects.get(layer_external=external).url, url)
+
+    def test_sync_run(self):
+        """ ensure each synchronization is recorded with its statistics """
+        layer = Layer.objects.external()[0]
+        layer.minimum_distance = 0
+        layer.area = None
+        layer.new_nodes_allowed = False
+        layer.save()
+        layer = Layer.objects.get(pk=layer.pk)
+
+        url = '%s/geojson1.json' % TEST_FILES_PATH
+
+        external = LayerExternal(layer=layer)
+        external.interoperability = 'nodeshot.interoperability.synchronizers.GeoJson'
+        external.config = '{ "url": "%s", "map": {}, "conditional_fetch": true }' % url
+        external.full_clean()
+        external.save()
+
+        for i in range(0, 2):
+            capture_output(
+                management.call_command,
+                ['synchronize', 'vienna'],
+                kwargs={ 'verbosity': 0 }
+            )
+
+        self.assertEqual(layer.sync_runs.count(), 2)
+        not_modified, success = layer.sync_runs.all()
+
+        self.assertEqual(success.status, 'success')
+        self.assertEqual(success.synchronizer, 'GeoJson')
+        self.assertEqual(success.added, 2)
+        self.assertEqual(success.processed, 2)
+        self.assertEqual(success.deleted, 0)
+        self.assertTrue(success.bytes_downloaded > 0)
+        self.assertTrue(success.query_count > 0)
+        self.assertTrue(success.process_peak_memory > 0)
+        for phase in ['retrieve', 'parse', 'save']:
+            self.assertIsNotNone(getattr(success, '%s_time' % phase))
+        self.assertTrue(success.total_time >= success.save_time)
+
+        self.assertEqual(not_modified.status, 'not_modified')
+        self.assertIsNone(not_modified.save_time)
+
+        # REST API, admins only
+        url = reverse('api_layer_sync_run_list', args=[layer.slug])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 403)
+        self.client.login(username='admin', password='tester')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(response.data['results'][0]['status'], 'not_modified')
+        response = self.client.get(reverse('api_sync_run_list'), { 'status': 'success' })
+        self.assertEqual(response.data['count'], 1)
+
+        # queries are counted without logging them
+        recorder = SyncRunRecorder(external.synchronizer)
+        queries = len(connection.queries)
+        Node.objects.count()
+        Node.objects.count()
+        self.assertEqual(recorder.count, 2)
+        self.assertEqual(len(connection.queries), queries)
+        self.assertEqual(recorder.finish('success').query_count, 2)
+        self.assertFalse(isinstance(connection.cursor(), QueryCountingCursor))
+
+    def test_sync_hashes(self):
+        """ ensure unchanged records are skipped through hashes """
+        # geometry hashes ignore differences beyond the 7th decimal place
+        self.assertEqual(geometry_hash(Point(12.5, 41.9)), geometry_hash(Point(12.500000001, 41.9)))
+        self.assertNotEqual(geometry_hash(Point(12.5, 41.9)), geometry_hash(Point(12.50001, 41.9)))
+
+        layer = Layer.objects.external()[0]
+        layer.minimum_distance = 0
+        layer.area = None
+        layer.new_nodes_allowed = False
+        layer.save()
+        layer = Layer.objects.get(pk=layer.pk)
+
+        url = '%s/geojson1.json' % TEST_FILES_PATH
+
+        external = LayerExternal(layer=layer)
+        external.interoperability = 'nodeshot.interoperability.synchronizers.GeoJson'
+        external.config = '{ "url": "%s", "map": {} }' % url
+        external.full_clean()
+        external.save()
+
+        output = capture_output(
+            management.call_command,
+            ['synchronize', 'vienna'],
+            kwargs={ 'verbosity': 0 }
+        )
+        self.assertIn('2 nodes added', output)
+        self.assertEqual(NodeSyncHash.objects.filter(node__layer=layer).count(), 2)
+
+        # unchanged records are skipped
+        output = capture_output(
+            management.call_command,
+            ['synchronize', 'vienna'],
+            kwargs={ 'verbosity': 0 }
+        )
+        self.assertIn('2 nodes unmodified', output)
+
+        # nodes edited locally are processed again
+        node = layer.node_set.all()[0]
+        original_name = node.name
+        node.name = 'edited locally'
+        node.save()
+
+        output = capture_output(
+            management.call_command,
+            ['synchronize', 'vienna'],
+            kwargs={ 'verbosity': 0 }
+        )
+        self.assertIn('1 nodes changed', output)
+        self.assertIn('1 nodes unmodified', output)
+        self.assertEqual(Node.objects.get(pk=node.pk).name, original_name)
+
     def test_preexisting_name(self):
         """ test preexisting names """
         layer = Layer.objects.external()[0]
@@ -513,6 +852,68 @@ class InteroperabilityTest(TestCase):
         self.assertIn('2 total external', output)
         self.assertIn('2 total local', output)
 
+    def test_slug_index(self):
+        """ ensure slugs can't be claimed twice during the same run """
+        node = Node.first()
+        layer = Layer.objects.exclude(pk=node.layer_id)[0]
+        index = SlugIndex()
+
+        # slug of existing node can be claimed only by its own layer, once
+        self.assertIn(node.slug, index)
+        self.assertFalse(index.claim(node.slug, layer.id))
+        self.assertTrue(index.claim(node.slug, node.layer_id))
+        self.assertFalse(index.claim(node.slug, node.layer_id))
+
+        # new slugs are reserved as soon as they are claimed
+        self.assertTrue(index.claim('brand-new-slug', layer.id))
+        self.assertFalse(index.claim('brand-new-slug', node.layer_id))
+
+        # released slugs become available again
+        index.release(['brand-new-slug'])
+        self.assertTrue(index.claim('brand-new-slug', node.layer_id))
+
+    def test_bulk_update(self):
+        """ ensure many rows are updated with one query """
+        nodes = list(Node.objects.all()[0:3])
+        for i, node in enumerate(nodes):
+            node.name = 'bulk updated %d' % i
+            node.elev = i
+            node.geometry = Point(12.5 + i, 41.9, srid=4326)
+
+        with self.assertNumQueries(1):
+            bulk_update(Node, nodes, ['name', 'elev', 'geometry'])
+
+        for i, node in enumerate(nodes):
+            node = Node.objects.get(pk=node.pk)
+            self.assertEqual(node.name, 'bulk updated %d' % i)
+            self.assertEqual(node.elev, i)
+            self.assertTrue(node.geometry.equals(Point(12.5 + i, 41.9)))
+
+        with self.assertNumQueries(0):
+            bulk_update(Node, [], ['name'])
+
+    def test_lookup_cache(self):
+        """ ensure statuses and users are looked up with the minimum number of queries """
+        cache = LookupCache()
+
+        # all statuses are loaded with one query
+        with self.assertNumQueries(1):
+            self.assertEqual(cache.get_status('ACTIVE').slug, 'active')
+            self.assertEqual(cache.get_status('wrong').slug, 'potential')
+            self.assertEqual(cache.get_status(None).slug, 'potential')
+            self.assertEqual(cache.get_default_status().slug, 'potential')
+
+        # users are resolved in batch and misses are memoized
+        with self.assertNumQueries(1):
+            cache.prefetch_users(['admin', 'romano', 'wrong', None])
+            self.assertEqual(cache.get_user('admin').username, 'admin')
+            self.assertEqual(cache.get_user('romano').username, 'romano')
+            self.assertIsNone(cache.get_user('wrong'))
+            self.assertIsNone(cache.get_user(None))
+
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(cache.hits, 5)
+
     def test_key_mappings(self):
         """ importing a file with different keys """
         layer = Layer.objects.external()[0]
@@ -683,6 +1084,60 @@ class InteroperabilityTest(TestCase):
         self.assertIn('2 total external', output)
         self.assertIn('2 total local', output)
 
+    def test_georss_iterparse(self):
+        """ test GeoRSS and OpenWisp with the iterparse backend """
+        layer = Layer.objects.external()[0]
+        layer.minimum_distance = 0
+        layer.area = None
+        layer.new_nodes_allowed = False
+        layer.save()
+        layer = Layer.objects.get(pk=layer.pk)
+
+        url = '%s/georss-simple.xml' % TEST_FILES_PATH
+
+        external = LayerExternal(layer=layer)
+        external.interoperability = 'nodeshot.interoperability.synchronizers.GeoRss'
+        external.config = '{ "url": "%s", "map": {}, "iterparse": true }' % url
+        external.full_clean()
+        external.save()
+
+        output = capture_output(
+            management.call_command,
+            ['synchronize', 'vienna'],
+            kwargs={ 'verbosity': 0 }
+        )
+
+        # ensure following text is in output
+        self.assertIn('3 nodes added', output)
+        self.assertIn('3 total external', output)
+
+        node = Node.objects.get(slug='item-2')
+        self.assertEqual(node.name, 'item 2')
+        self.assertEqual(node.updated.strftime('%Y-%m-%d'), '2006-08-17')
+        geometry = GEOSGeometry('POINT (-70.92 44.256)')
+        self.assertTrue(node.geometry.equals_exact(geometry) or node.geometry.equals(geometry))
+
+        ### --- OpenWisp --- ###
+
+        url = '%s/openwisp-georss.xml' % TEST_FILES_PATH
+        external.interoperability = 'nodeshot.interoperability.synchronizers.OpenWisp'
+        external.config = '{ "url": "%s", "iterparse": true }' % url
+        external.save()
+
+        output = capture_output(
+            management.call_command,
+            ['synchronize', 'vienna'],
+            kwargs={ 'verbosity': 0 }
+        )
+
+        self.assertIn('42 nodes added', output)
+        self.assertIn('3 nodes deleted', output)
+        self.assertIn('42 total local', output)
+
+        node = Node.objects.get(slug='podesta1-ced')
+        self.assertEqual(node.address, 'Test WISP')
+        self.assertTrue(node.geometry.equals(Point(8.96166, 44.4185)))
+
     def test_openlabor_get_nodes(self):
         layer = Layer.objects.external()[0]
         layer.minimum_distance = 0
@@ -720,6 +1175,99 @@ class InteroperabilityTest(TestCase):
         self.assertEqual(nodes[0]['properties']['name'], 'SARTO CONFEZIONISTA')
         self.assertEqual(nodes[0]['properties']['address'], 'Via Lussemburgo snc, Anzio - 00042')
 
+    def test_push_queue(self):
+        """ ensure operations on the same node are coalesced """
+        layer = Layer.objects.external()[0]
+        external = LayerExternal(layer=layer)
+        external.interoperability = 'nodeshot.interoperability.synchronizers.GeoJson'
+        external.config = '{ "url": "%s/geojson1.json", "map": {} }' % TEST_FILES_PATH
+        external.full_clean()
+        external.save()
+        layer = Layer.objects.get(pk=layer.pk)
+        node = layer.node_set.all()[0]
+        queue = PushOperation.objects.filter(layer_external=external, node_id=node.pk)
+
+        # add + change = add
+        PushOperation.enqueue(node, 'add')
+        PushOperation.enqueue(node, 'change')
+        self.assertEqual(queue.get().operation, 'add')
+
+        # add + delete = nothing to do
+        self.assertIsNone(PushOperation.enqueue(node, 'delete', external_id='1'))
+        self.assertEqual(queue.count(), 0)
+
+        # change + change + delete = delete
+        PushOperation.enqueue(node, 'change')
+        PushOperation.enqueue(node, 'change')
+        PushOperation.enqueue(node, 'delete', external_id='1')
+        self.assertEqual(queue.get().operation, 'delete')
+        self.assertEqual(queue.get().external_id, '1')
+
+        # nodes without external id can't be deleted
+        PushOperation.enqueue(node, 'change')
+        self.assertIsNone(PushOperation.enqueue(node, 'delete'))
+        self.assertEqual(queue.count(), 0)
+
+        # unsupported operations are discarded when the queue is flushed
+        PushOperation.enqueue(node, 'change')
+        flush_push_queue.delay(external.pk)
+        self.assertEqual(queue.count(), 0)
+
+    def test_push_queue_changed_while_pushing(self):
+        """ ensure operations enqueued while a batch is being pushed are not lost """
+        layer = Layer.objects.external()[0]
+        external = LayerExternal(layer=layer)
+        external.interoperability = 'nodeshot.interoperability.synchronizers.GeoJson'
+        external.config = '{ "url": "%s/geojson1.json", "map": {} }' % TEST_FILES_PATH
+        external.full_clean()
+        external.save()
+        layer = Layer.objects.get(pk=layer.pk)
+        node = layer.node_set.all()[0]
+        queue = PushOperation.objects.filter(layer_external=external, node_id=node.pk)
+
+        synchronizer_class = external.synchronizer_class
+        original_push = synchronizer_class.push
+        pushed = []
+        # operations performed on the node during the next push
+        concurrent = []
+        failing = []
+
+        def push(self, operations):
+            pushed.append([operation for operation, target in operations])
+            while concurrent:
+                PushOperation.enqueue(node, concurrent.pop(0))
+            if failing:
+                return [False] * len(operations)
+            return original_push(self, operations)
+
+        synchronizer_class.push = push
+        try:
+            # the change is pushed after the add
+            PushOperation.enqueue(node, 'add')
+            concurrent.append('change')
+            flush_push_queue.delay(external.pk)
+            self.assertEqual(pushed, [['add'], ['change']])
+            self.assertEqual(queue.count(), 0)
+
+            # the delete is pushed after the add even if the external id was not known yet
+            del pushed[:]
+            PushOperation.enqueue(node, 'add')
+            concurrent.append('delete')
+            flush_push_queue.delay(external.pk)
+            self.assertEqual(pushed, [['add'], ['delete']])
+            self.assertEqual(queue.count(), 0)
+
+            # if the add fails there's nothing left to delete
+            del pushed[:]
+            PushOperation.enqueue(node, 'add')
+            concurrent.append('delete')
+            failing.append(True)
+            flush_push_queue.delay(external.pk)
+            self.assertEqual(pushed, [['add']])
+            self.assertEqual(queue.count(), 0)
+        finally:
+            synchronizer_class.push = original_push
+
     def test_openlabor_add_node(self):
         layer = Layer.objects.external()[0]
         layer.minimum_distance = 0
@@ -1321,3 +1869,69 @@ class InteroperabilityTest(TestCase):
 
             data = json.loads(requests.get(citysdk_nodes_url, params=querystring_params, verify=False).content)
             self.assertEqual(len(data['results']), 0)
+
+
+class InteroperabilityWorkersTest(TransactionTestCase):
+    """ worker processes need committed data, hence TransactionTestCase """
+    fixtures = [
+        'initial_data.json',
+        user_fixtures,
+        'test_layers.json',
+        'test_status.json',
+        'test_nodes.json'
+    ]
+
+    def test_management_command_workers(self):
+        """ test --workers """
+        layer = Layer.objects.external()[0]
+        layer.minimum_distance = 0
+        layer.area = None
+        layer.new_nodes_allowed = False
+        layer.save()
+
+        external = LayerExternal(layer=layer)
+        external.interoperability = 'nodeshot.interoperability.synchronizers.GeoJson'
+        external.config = '{ "url": "%s/geojson1.json", "map": {} }' % TEST_FILES_PATH
+        external.full_clean()
+        external.save()
+
+        output = capture_output(
+            management.call_command,
+            ['synchronize'],
+            { 'workers': 2, 'timeout': 60, 'verbosity': 0 }
+        )
+
+        self.assertIn('2 nodes added', output)
+        self.assertIn('succeeded', output)
+        self.assertEqual(layer.node_set.count(), 2)
+
+    def test_management_command_workers_colliding_names(self):
+        """ layers synchronized by different processes can't claim the same slug """
+        url = '%s/geojson1.json' % TEST_FILES_PATH
+        layers = [Layer.objects.get(slug='vienna'), Layer.objects.get(slug='rome')]
+
+        for layer in layers:
+            layer.is_external = True
+            layer.minimum_distance = 0
+            layer.area = None
+            layer.new_nodes_allowed = False
+            layer.save()
+            # both layers import the same names
+            external = LayerExternal(layer=layer)
+            external.interoperability = 'nodeshot.interoperability.synchronizers.GeoJson'
+            external.config = '{ "url": "%s", "map": {}, "bulk_save": true }' % url
+            external.full_clean()
+            external.save()
+
+        output = capture_output(
+            management.call_command,
+            ['synchronize', 'vienna', 'rome'],
+            { 'workers': 2, 'timeout': 60, 'verbosity': 0 }
+        )
+
+        self.assertIn('2 layers processed: 2 succeeded', output)
+        for layer in layers:
+            self.assertEqual(layer.node_set.count(), 2)
+        # the layer which came second got different names
+        slugs = Node.objects.filter(layer__in=layers).values_list('slug', flat=True)
+        self.assertEqual(sorted(slugs), ['simplegeojson', 'simplegeojson-2', 'simplegeojson2', 'simplegeojson2-2'])
@@ -0,0 +1,7 @@
+from django.conf.urls import patterns, url
+
+
+urlpatterns = patterns('nodeshot.interoperability.views',
+    url(r'^sync-runs/$', 'sync_run_list', name='api_sync_run_list'),
+    url(r'^layers/(?P<slug>[-\w]+)/sync-runs/$', 'layer_sync_run_list', name='api_layer_sync_run_list'),
+)
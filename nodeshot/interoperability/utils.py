@@ -0,0 +1,499 @@
+import re
+import time
+import hashlib
+import resource
+import simplejson as json
+from contextlib import contextmanager
+from itertools import islice
+from threading import Lock
+from multiprocessing.managers import BaseManager
+
+from django.db import connection, connections, DEFAULT_DB_ALIAS
+from django.db.models import AutoField
+from django.contrib.auth import get_user_model
+User = get_user_model()
+
+from nodeshot.core.base.utils import now
+from nodeshot.core.nodes.models import Node, Status
+
+from .models import SyncRun
+from .settings import GEOMETRY_HASH_PRECISION
+
+
+__all__ = ['SlugIndex', 'SlugIndexManager', 'LookupCache', 'LayerLock', 'SyncRunRecorder', 'IterStream',
+           'geometry_hash', 'record_hash', 'chunks', 'bulk_update', 'iter_geojson_features']
+
+
+class SlugIndex(object):
+    """
+    Set based index of the node slugs which are already taken.
+
+    It is built once per sync run and can be shared among the synchronizers
+    of different layers running in the same process (threads included):
+        * all the slugs are preloaded with one query the first time the index is used
+        * slugs are reserved as soon as a synchronizer assigns them to an item,
+          so two layers can't claim the same slug during the same run
+        * lookups and reservations cost O(1)
+
+    Worker processes share one index served by SlugIndexManager.
+    """
+
+    def __init__(self, owners=None):
+        self._lock = Lock()
+        # slug -> layer id
+        self._owners = owners
+        # layer id -> set of slugs claimed during this run
+        self._claimed = {}
+
+    @staticmethod
+    def load_owners():
+        """ returns a dictionary of slug -> layer id of all the nodes, one query """
+        return dict(Node.objects.values_list('slug', 'layer_id'))
+
+    def _load(self):
+        """ preload slugs of all nodes in one query """
+        if self._owners is None:
+            self._owners = self.load_owners()
+
+    def claim(self, slug, layer_id):
+        """
+        reserve slug for the specified layer
+        returns False if slug is already taken by a node of another layer
+        or if it has already been claimed by the same layer during this run
+        """
+        with self._lock:
+            self._load()
+            claimed = self._claimed.setdefault(layer_id, set())
+            owner = self._owners.get(slug)
+
+            if (owner is not None and owner != layer_id) or slug in claimed:
+                return False
+
+            self._owners[slug] = layer_id
+            claimed.add(slug)
+            return True
+
+    def release(self, slugs):
+        """ make slugs of deleted nodes available again """
+        with self._lock:
+            self._load()
+            for slug in slugs:
+                layer_id = self._owners.pop(slug, None)
+                if layer_id is not None:
+                    self._claimed.get(layer_id, set()).discard(slug)
+
+    def __contains__(self, slug):
+        with self._lock:
+            self._load()
+            return slug in self._owners
+
+
+class SlugIndexManager(BaseManager):
+    """
+    Serves a SlugIndex from its own process to the worker processes of
+    "synchronize --workers", so that two layers synchronized at the same time
+    can't claim the same slug, exactly like layers synchronized by the same process.
+
+    usage:
+        manager = SlugIndexManager()
+        manager.start()
+        # pass the slugs, the manager process does not use the database
+        slug_index = manager.SlugIndex(SlugIndex.load_owners())
+    """
+    pass
+
+SlugIndexManager.register('SlugIndex', SlugIndex, exposed=('claim', 'release', '__contains__'))
+
+
+class LookupCache(object):
+    """
+    Synchronizer scoped cache of the Status and User lookups performed for each item:
+        * all the statuses (and the default status) are loaded with one query
+        * users can be resolved in batch with one "username__in" query
+        * misses are memoized too
+    Keeps count of hits (lookups answered from memory) and misses (lookups which needed a query).
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._statuses = None
+        self._default_status = None
+        self._users = {}
+
+    def _load_statuses(self):
+        """ load all statuses in one query """
+        if self._statuses is not None:
+            return
+        self.misses += 1
+        self._statuses = {}
+        # statuses are ordered, the first default status wins
+        for status in Status.objects.all():
+            self._statuses[status.slug.lower()] = status
+            if status.is_default and self._default_status is None:
+                self._default_status = status
+
+    def get_default_status(self):
+        """ returns default status or None """
+        self._load_statuses()
+        return self._default_status
+
+    def get_status(self, slug):
+        """ returns status with the specified slug (case insensitive) or default status or None """
+        if self._statuses is not None:
+            self.hits += 1
+        self._load_statuses()
+        return self._statuses.get((slug or '').lower(), self._default_status)
+
+    def prefetch_users(self, usernames):
+        """ resolve users which are not cached yet with one query """
+        usernames = set(username for username in usernames if username and username not in self._users)
+        if not usernames:
+            return
+        self.misses += 1
+        for user in User.objects.filter(username__in=usernames):
+            self._users[user.username] = user
+        # memoize misses
+        for username in usernames:
+            self._users.setdefault(username, None)
+
+    def get_user(self, username):
+        """ returns user with the specified username or None """
+        if not username:
+            return None
+        if username in self._users:
+            self.hits += 1
+        else:
+            self.misses += 1
+            try:
+                self._users[username] = User.objects.get(username=username)
+            except User.DoesNotExist:
+                self._users[username] = None
+        return self._users[username]
+
+
+class LayerLock(object):
+    """
+    PostgreSQL advisory lock which ensures an external layer is never
+    synchronized twice at the same time, even by different processes or hosts.
+    The lock is released automatically if the DB session ends (eg: crashed worker).
+
+    A different namespace can be specified to lock other kind of operations (eg: pushes).
+    """
+    # first key of the advisory lock, the second one is the layer id
+    NAMESPACE = 8371
+    PUSH_NAMESPACE = 8372
+
+    def __init__(self, layer_id, namespace=NAMESPACE):
+        self.layer_id = layer_id
+        self.namespace = namespace
+        self.acquired = False
+
+    def acquire(self):
+        """ returns True if lock has been acquired, False if the layer is already locked """
+        cursor = connection.cursor()
+        cursor.execute('SELECT pg_try_advisory_lock(%s, %s)', [self.namespace, self.layer_id])
+        self.acquired = cursor.fetchone()[0]
+        return self.acquired
+
+    def release(self):
+        if not self.acquired:
+            return
+        cursor = connection.cursor()
+        cursor.execute('SELECT pg_advisory_unlock(%s, %s)', [self.namespace, self.layer_id])
+        self.acquired = False
+
+
+class QueryCountingCursor(object):
+    """
+    Wrapper of database cursors which counts the executed queries without formatting,
+    timing or storing them (like the debug cursor does), so that long synchronizations
+    are not slowed down and don't fill the memory with SQL strings
+    """
+
+    def __init__(self, cursor, counter):
+        self.cursor = cursor
+        self.counter = counter
+
+    def execute(self, *args, **kwargs):
+        self.counter.count += 1
+        return self.cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self.counter.count += 1
+        return self.cursor.executemany(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+
+class SyncRunRecorder(object):
+    """
+    Records a SyncRun for each synchronization performed by a synchronizer:
+        * wall time of each phase (see "phase" method)
+        * bytes downloaded (synchronizer.bytes_downloaded, if available)
+        * item counts (synchronizer.report, if available)
+        * query count and peak memory of the process (since the process started)
+    """
+
+    def __init__(self, synchronizer):
+        self.synchronizer = synchronizer
+        self.sync_run = SyncRun(
+            layer=synchronizer.layer,
+            synchronizer=synchronizer.__class__.__name__,
+            started=now()
+        )
+        self.start_time = time.time()
+        # count queries by wrapping the cursors of the default connection
+        self.count = 0
+        self.connection = connections[DEFAULT_DB_ALIAS]
+        cursor = self.connection.cursor
+        self.connection.cursor = lambda: QueryCountingCursor(cursor(), self)
+
+    @contextmanager
+    def phase(self, name):
+        """ measures wall time of the enclosed block and stores it in the "<name>_time" field """
+        start = time.time()
+        try:
+            yield
+        finally:
+            setattr(self.sync_run, '%s_time' % name, time.time() - start)
+
+    def finish(self, status, message=''):
+        """ stores the SyncRun """
+        sync_run = self.sync_run
+        synchronizer = self.synchronizer
+
+        sync_run.status = status
+        sync_run.message = (message or '').strip()
+        sync_run.total_time = time.time() - self.start_time
+        sync_run.bytes_downloaded = getattr(synchronizer, 'bytes_downloaded', None)
+        sync_run.query_count = self.count
+        # ru_maxrss is expressed in KB on linux
+        sync_run.process_peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        for key, value in getattr(synchronizer, 'report', {}).items():
+            setattr(sync_run, key, value)
+
+        # stop counting queries
+        del self.connection.cursor
+
+        sync_run.save()
+        return sync_run
+
+
+class IterStream(object):
+    """ read only file-like object which reads from an iterable of strings """
+
+    def __init__(self, iterable):
+        self.iterator = iter(iterable)
+        self.buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            try:
+                self.buffer += next(self.iterator)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def _round_coords(coords, precision):
+    """ recursively rounds nested tuples of coordinates """
+    if isinstance(coords, (int, long, float)):
+        return round(coords, precision)
+    return [_round_coords(value, precision) for value in coords]
+
+
+def geometry_hash(geometry, precision=GEOMETRY_HASH_PRECISION):
+    """
+    SHA1 fingerprint of a GEOSGeometry: geometry type, SRID
+    and coordinates rounded to the specified number of decimal places
+    """
+    fingerprint = json.dumps([
+        geometry.geom_type,
+        geometry.srid,
+        _round_coords(geometry.coords, precision)
+    ])
+    return hashlib.sha1(fingerprint).hexdigest()
+
+
+def record_hash(item, geometry_hash):
+    """
+    SHA1 fingerprint of an item converted by GenericGisSynchronizer._convert_item;
+    status and user are represented by their slug and primary key
+    """
+    record = dict(item)
+    record['geometry'] = geometry_hash
+    record['status'] = item['status'].slug if item['status'] else None
+    record['user'] = item['user'].pk if item['user'] else None
+    return hashlib.sha1(json.dumps(record, sort_keys=True, default=unicode)).hexdigest()
+
+
+def chunks(iterable, size):
+    """
+    yields lists of at most "size" elements from iterable
+    without consuming more than one chunk at a time
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_update(model, objects, fields, batch_size=None):
+    """
+    writes the specified fields of many instances of model with one query per batch:
+
+        UPDATE <table> SET <field> = v.<field>, ... FROM (VALUES (<pk>, <field>, ...), ...) AS v (...)
+        WHERE <table>.<pk> = v.<pk>
+
+    values are prepared and cast like Django does for single updates (PostgreSQL only)
+    """
+    if not objects:
+        return
+
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    pk = model._meta.pk
+    columns = [pk] + [model._meta.get_field(name) for name in fields]
+    column_names = [qn(field.column) for field in columns]
+    # the primary key is the first column
+    assignments = ', '.join('%s = v.%s' % (name, name) for name in column_names[1:])
+    cursor = connection.cursor()
+
+    for batch in chunks(objects, batch_size or len(objects)):
+        rows = []
+        params = []
+
+        for obj in batch:
+            placeholders = []
+            for field in columns:
+                value = field.get_db_prep_save(getattr(obj, field.attname), connection=connection)
+                placeholder = field.get_placeholder(value, connection) if hasattr(field, 'get_placeholder') else '%s'
+                # VALUES are not typed, cast them to the type of the column
+                db_type = 'integer' if isinstance(field, AutoField) else field.db_type(connection)
+                if db_type:
+                    placeholder = 'CAST(%s AS %s)' % (placeholder, db_type)
+                placeholders.append(placeholder)
+                params.append(value)
+            rows.append('(%s)' % ', '.join(placeholders))
+
+        cursor.execute('UPDATE %s SET %s FROM (VALUES %s) AS v (%s) WHERE %s.%s = v.%s' % (
+            table,
+            assignments,
+            ', '.join(rows),
+            ', '.join(column_names),
+            table, column_names[0], column_names[0]
+        ), params)
+
+
+class JsonStreamReader(object):
+    """
+    Minimal incremental JSON reader: consumes an iterable of strings
+    (eg: the chunks of an HTTP response) and decodes one value at a time,
+    keeping in memory only the data which has not been consumed yet.
+    """
+    WHITESPACE = re.compile(r'[ \t\n\r]*')
+    decoder = json.JSONDecoder()
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+
+    def _read(self):
+        """ read next chunk, returns False if there's nothing left to read """
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            self.eof = True
+            return False
+        # discard data which has already been consumed
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self):
+        """ returns next non whitespace character without consuming it """
+        while True:
+            self.position = self.WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._read():
+                raise ValueError('unexpected end of JSON document')
+
+    def expect(self, *characters):
+        """ consume next non whitespace character, which must be one of the specified ones """
+        character = self.peek()
+        if character not in characters:
+            raise ValueError('expected one of "%s", got "%s"' % ('", "'.join(characters), character))
+        self.position += 1
+        return character
+
+    def decode(self):
+        """ decode next JSON value """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except ValueError:
+                # value is incomplete, read more unless there's nothing left
+                if not self._read():
+                    raise
+                continue
+            # numbers at the end of the buffer might be truncated
+            if end == len(self.buffer) and not self.eof and self._read():
+                continue
+            self.position = end
+            return value
+
+
+def iter_geojson_features(chunks):
+    """
+    Streaming GeoJSON parser: yields the features of a FeatureCollection one at a time.
+
+    :param chunks: iterable of strings, eg: response.iter_content(n)
+    """
+    reader = JsonStreamReader(chunks)
+    root_type = None
+
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.expect('}')
+    else:
+        while True:
+            key = reader.decode()
+            reader.expect(':')
+
+            if key == 'features':
+                reader.expect('[')
+                if reader.peek() == ']':
+                    reader.expect(']')
+                else:
+                    while True:
+                        yield reader.decode()
+                        if reader.expect(',', ']') == ']':
+                            break
+            else:
+                value = reader.decode()
+                if key == 'type':
+                    root_type = value
+                    # fail early if possible
+                    if root_type != 'FeatureCollection':
+                        break
+
+            if reader.expect(',', '}') == '}':
+                break
+
+    if root_type != 'FeatureCollection':
+        raise ValueError('GeoJson synchronizer expects a FeatureCollection object at root level')
@@ -0,0 +1,61 @@
+from django.http import Http404
+from django.utils.translation import ugettext_lazy as _
+
+from rest_framework import generics, permissions, authentication
+
+from nodeshot.core.layers.models import Layer
+
+from .models import SyncRun
+from .serializers import *
+
+
+class SyncRunList(generics.ListAPIView):
+    """
+    Retrieve the history of the synchronizations of external layers,
+    most recent first. Available to administrators only.
+
+    Parameters:
+
+     * `status=<status>`: filter by status (success, not_modified, error)
+     * `limit=<n>`: specify number of items per page (defaults to 50)
+     * `limit=0`: turns off pagination
+     * `page=<n>`: show page n
+    """
+    authentication_classes = (authentication.SessionAuthentication,)
+    permission_classes = (permissions.IsAdminUser,)
+    serializer_class = SyncRunSerializer
+    pagination_serializer_class = PaginatedSyncRunSerializer
+    paginate_by_param = 'limit'
+    paginate_by = 50
+    queryset = SyncRun.objects.select_related('layer')
+
+    def get_queryset(self):
+        queryset = super(SyncRunList, self).get_queryset()
+        status = self.request.QUERY_PARAMS.get('status')
+        if status:
+            queryset = queryset.filter(status=status)
+        return queryset
+
+sync_run_list = SyncRunList.as_view()
+
+
+class LayerSyncRunList(SyncRunList):
+    """
+    Retrieve the history of the synchronizations of the specified layer,
+    most recent first. Available to administrators only.
+
+    Parameters:
+
+     * `status=<status>`: filter by status (success, not_modified, error)
+     * `limit=<n>`: specify number of items per page (defaults to 50)
+     * `limit=0`: turns off pagination
+     * `page=<n>`: show page n
+    """
+    def get_queryset(self):
+        try:
+            layer = Layer.objects.only('id').get(slug=self.kwargs['slug'])
+        except Layer.DoesNotExist:
+            raise Http404(_('Layer not found'))
+        return super(LayerSyncRunList, self).get_queryset().filter(layer_id=layer.id)
+
+layer_sync_run_list = LayerSyncRunList.as_view()